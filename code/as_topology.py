@@ -1,15 +1,33 @@
 import networkx as nx
 import math
 
+from as_topology_array import ASTopologyArray
+from prefix_index import Bitmap
+
+"""
+AS topology of a peer: the prefixes traversing every AS link (and at which depth).
+paths is the ASPathTable (see rib.py) of the peer, required to use path ids
+(add_path and remove_path) instead of AS paths (add and remove). prefix_ids
+(see prefix_index.PrefixIds) gives the prefixes of the ids in the prefix bitmaps.
+"""
 class ASTopology(nx.DiGraph):
-    def __init__(self, w_threshold, silent=False):
+    def __init__(self, w_threshold, silent=False, paths=None, prefix_ids=None):
         super(ASTopology, self).__init__()
+        self.paths = paths
+        self.prefix_ids = prefix_ids
         self.silent = silent
         self.nodes_forward = set() # Set of nodes that needs to be taken into account when looking for the best fm score
         self.nodes_backward = set() # Set of nodes that needs to be taken into account when looking for the best fm score
         self.w_threshold = w_threshold
+        self.touched = None # List of the AS paths added or removed, when set (see bpa.IncrementalBPA)
+
+    """
+    Add count prefixes with this AS path (the id of a prefix can only be given if count is 1).
+    """
+    def add(self, as_path, pid=None, count=1):
+        if self.touched is not None:
+            self.touched.append(as_path)
 
-    def add(self, as_path, prefix=None):
         for i in range(0, len(as_path)-1):
             # Create the node and initialize their attributes if they do not exist yet
             if as_path[i] not in self:
@@ -18,13 +36,13 @@ class ASTopology(nx.DiGraph):
                 self.add_node(as_path[i+1], out_prefixes=0, in_prefixes=0)
 
             # Update the node attributes
-            self.node[as_path[i]]['out_prefixes'] += 1
-            self.node[as_path[i+1]]['in_prefixes'] += 1
+            self.node[as_path[i]]['out_prefixes'] += count
+            self.node[as_path[i+1]]['in_prefixes'] += count
 
             # Add those nodes in the out_prefixes our in_prefixes sets if necessary
-            if self.node[as_path[i]]['out_prefixes'] == self.w_threshold:
+            if self.w_threshold <= self.node[as_path[i]]['out_prefixes'] < self.w_threshold+count:
                 self.nodes_forward.add(as_path[i])
-            if self.node[as_path[i+1]]['in_prefixes'] == self.w_threshold:
+            if self.w_threshold <= self.node[as_path[i+1]]['in_prefixes'] < self.w_threshold+count:
                 self.nodes_backward.add(as_path[i+1])
 
             # Create the edge
@@ -33,44 +51,50 @@ class ASTopology(nx.DiGraph):
             # Update the prefix counter
             if 'prefix_counter' not in self[as_path[i]][as_path[i+1]]:
                 self[as_path[i]][as_path[i+1]]['prefix_counter'] = 0.
-            self[as_path[i]][as_path[i+1]]['prefix_counter'] += 1.
+            self[as_path[i]][as_path[i+1]]['prefix_counter'] += count
 
             # Update the depth prefix counter
             if 'depth' not in self[as_path[i]][as_path[i+1]]:
                 self[as_path[i]][as_path[i+1]]['depth'] = {}
             if i+1 not in self[as_path[i]][as_path[i+1]]['depth']:
                 self[as_path[i]][as_path[i+1]]['depth'][i+1] = 0
-            self[as_path[i]][as_path[i+1]]['depth'][i+1] += 1
+            self[as_path[i]][as_path[i+1]]['depth'][i+1] += count
 
-            # Update the prefix set (if not silent only)
-            if not self.silent and prefix is not None:
+            # Update the prefix bitmap (if not silent only)
+            if not self.silent and pid is not None:
                 if 'prefixes' not in self[as_path[i]][as_path[i+1]]:
-                    self[as_path[i]][as_path[i+1]]['prefixes'] = set()
-                self[as_path[i]][as_path[i+1]]['prefixes'].add(prefix)
+                    self[as_path[i]][as_path[i+1]]['prefixes'] = Bitmap()
+                self[as_path[i]][as_path[i+1]]['prefixes'].add(pid)
+
+    """
+    Remove count prefixes with this AS path (the id of a prefix can only be given if count is 1).
+    """
+    def remove(self, as_path, pid=None, count=1):
+        if self.touched is not None:
+            self.touched.append(as_path)
 
-    def remove(self, as_path, prefix=None):
         for i in range(0, len(as_path)-1):
             # Update the node attributes
-            self.node[as_path[i]]['out_prefixes'] -= 1
-            self.node[as_path[i+1]]['in_prefixes'] -= 1
+            self.node[as_path[i]]['out_prefixes'] -= count
+            self.node[as_path[i+1]]['in_prefixes'] -= count
 
             # Add those nodes in the out_prefixes our in_prefixes sets if necessary
-            if self.node[as_path[i]]['out_prefixes'] == self.w_threshold-1:
+            if self.w_threshold-count <= self.node[as_path[i]]['out_prefixes'] < self.w_threshold:
                 self.nodes_forward.remove(as_path[i])
-            if self.node[as_path[i+1]]['in_prefixes'] == self.w_threshold-1:
+            if self.w_threshold-count <= self.node[as_path[i+1]]['in_prefixes'] < self.w_threshold:
                 self.nodes_backward.remove(as_path[i+1])
 
             # Update the weight
-            self[as_path[i]][as_path[i+1]]['prefix_counter'] -= 1.
+            self[as_path[i]][as_path[i+1]]['prefix_counter'] -= count
 
             # Update the depth prefix counter
-            self[as_path[i]][as_path[i+1]]['depth'][i+1] -= 1
+            self[as_path[i]][as_path[i+1]]['depth'][i+1] -= count
             if self[as_path[i]][as_path[i+1]]['depth'][i+1] == 0:
                 del self[as_path[i]][as_path[i+1]]['depth'][i+1]
 
-            # Update the prefix set (if not silent only)
-            if not self.silent and prefix is not None:
-                self[as_path[i]][as_path[i+1]]['prefixes'].remove(prefix)
+            # Update the prefix bitmap (if not silent only)
+            if not self.silent and pid is not None:
+                self[as_path[i]][as_path[i+1]]['prefixes'].remove(pid)
 
             # Clean the graph
             if self[as_path[i]][as_path[i+1]]['prefix_counter'] == 0.:
@@ -80,6 +104,24 @@ class ASTopology(nx.DiGraph):
                 if self.out_degree(as_path[i+1]) == 0 and self.in_degree(as_path[i+1]) == 0.:
                     self.remove_node(as_path[i+1])
 
+    """
+    Same as add and remove, with the id of the AS path in the ASPathTable of the peer.
+    """
+    def add_path(self, path_id, count=1, pid=None):
+        self.add(self.paths.get(path_id), pid, count)
+
+    def remove_path(self, path_id, count=1, pid=None):
+        self.remove(self.paths.get(path_id), pid, count)
+
+
+    """
+    Number of prefixes going out of (or coming in) a node.
+    """
+    def get_out_prefixes(self, node):
+        return self.node[node]['out_prefixes']
+
+    def get_in_prefixes(self, node):
+        return self.node[node]['in_prefixes']
 
     def print_nodes(self):
         list_nodes = []
@@ -99,11 +141,22 @@ class ASTopology(nx.DiGraph):
 
     def get_prefixes_edge(self, edge):
         try:
-            for p in self[edge[0]][edge[1]]['prefixes']:
-                yield p
+            for pid in self[edge[0]][edge[1]]['prefixes']:
+                yield self.prefix_ids.prefix(pid)
         except KeyError:
             return
 
+    """
+    Yields the prefixes traversing at least one of the edges.
+    """
+    def get_prefixes_edges(self, edges):
+        union = Bitmap()
+        for edge in edges:
+            if self.has_edge(edge[0], edge[1]) and 'prefixes' in self[edge[0]][edge[1]]:
+                union.update(self[edge[0]][edge[1]]['prefixes'])
+        for pid in union:
+            yield self.prefix_ids.prefix(pid)
+
     def __str__(self):
         res = ''
         for i in self:
@@ -164,3 +217,13 @@ class ASTopology(nx.DiGraph):
         fd = open(outfile, 'w')
         fd.write(res)
         fd.close()
+
+
+"""
+Returns the class of the AS topologies: networkx (ASTopology) or array (ASTopologyArray).
+"""
+def topology_class(name):
+    if name == 'array':
+        return ASTopologyArray
+    else:
+        return ASTopology
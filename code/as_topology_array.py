@@ -0,0 +1,444 @@
+import math
+from array import array
+
+from prefix_index import Bitmap
+
+"""
+AS topology with the same interface as ASTopology (the networkx DiGraph used by
+BPA and the encoding), but without networkx.
+
+Every edge gets an integer id when it appears, and its counters live in array
+columns indexed by this id: the number of prefixes traversing it, the number
+of prefixes traversing it at every depth (DEPTH_SLOTS columns, the deeper depths
+are kept in a dictionary) and the source and destination nodes. The nodes also
+get integer ids, with their number of outgoing and incoming prefixes in arrays.
+The ids of the edges and nodes removed are reused.
+
+add and remove thus do one dictionary lookup per AS hop (the edge id), and
+integer updates in the arrays. The adjacency dictionaries (G[from_node][to_node])
+are only modified when an edge appears or disappears.
+"""
+
+DEPTH_SLOTS = 16
+
+"""
+An edge, as returned by G[from_node][to_node]. Its attributes are read in the
+arrays of the topology: 'prefix_counter', 'depth' and 'prefixes' (if not silent).
+"""
+class Edge(object):
+    __slots__ = ['topology', 'eid']
+
+    def __init__(self, topology, eid):
+        self.topology = topology
+        self.eid = eid
+
+    def __getitem__(self, key):
+        if key == 'prefix_counter':
+            return self.topology.prefix_counter[self.eid]
+        elif key == 'depth':
+            return EdgeDepth(self.topology, self.eid)
+        elif key == 'prefixes' and not self.topology.silent:
+            return self.topology.prefixes[self.eid]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key == 'prefix_counter' or key == 'depth' or (key == 'prefixes' and not self.topology.silent)
+
+"""
+The number of prefixes traversing an edge at every depth, read like the
+dictionary G[from_node][to_node]['depth'] (only the depths with prefixes are present).
+"""
+class EdgeDepth(object):
+    __slots__ = ['topology', 'eid']
+
+    def __init__(self, topology, eid):
+        self.topology = topology
+        self.eid = eid
+
+    def __getitem__(self, depth):
+        if depth < DEPTH_SLOTS:
+            value = self.topology.depth_counter[self.eid*DEPTH_SLOTS+depth]
+        else:
+            value = self.topology.depth_overflow.get((self.eid, depth), 0)
+        if value == 0:
+            raise KeyError(depth)
+        return value
+
+    def __contains__(self, depth):
+        try:
+            self[depth]
+            return True
+        except KeyError:
+            return False
+
+    def items(self):
+        res = []
+        base = self.eid*DEPTH_SLOTS
+        depth_counter = self.topology.depth_counter
+        for depth in range(1, DEPTH_SLOTS):
+            if depth_counter[base+depth] != 0:
+                res.append((depth, depth_counter[base+depth]))
+        for (eid, depth), value in self.topology.depth_overflow.items():
+            if eid == self.eid:
+                res.append((depth, value))
+        return res
+
+    def keys(self):
+        return [depth for depth, value in self.items()]
+
+    def values(self):
+        return [value for depth, value in self.items()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.items())
+
+    def __str__(self):
+        return str(dict(self.items()))
+
+
+class ASTopologyArray(object):
+    def __init__(self, w_threshold, silent=False, paths=None, prefix_ids=None):
+        self.paths = paths
+        self.silent = silent
+        self.nodes_forward = set() # Set of nodes that needs to be taken into account when looking for the best fm score
+        self.nodes_backward = set() # Set of nodes that needs to be taken into account when looking for the best fm score
+        self.w_threshold = w_threshold
+
+        # Adjacency: from_node -> to_node -> Edge, and to_node -> from_node -> Edge
+        self.succ = {}
+        self.pred = {}
+
+        # (from_node << 32 | to_node) -> edge id, and the edge columns
+        self.edge_ids = {}
+        self.free_edges = []
+        self.prefix_counter = array('d')
+        self.depth_counter = array('i')
+        self.depth_overflow = {}
+        self.edge_src = array('i')
+        self.edge_dst = array('i')
+        self.prefixes = [] # Bitmap of the ids of the prefixes traversing every edge (if not silent only)
+        self.prefix_ids = prefix_ids # Prefixes of these ids (see prefix_index.PrefixIds)
+        self.touched = None # List of the AS paths added or removed, when set (see bpa.IncrementalBPA)
+
+        # AS number -> node id, and the node columns
+        self.node_ids = {}
+        self.free_nodes = []
+        self.out_prefixes = array('i')
+        self.in_prefixes = array('i')
+        self.degree = array('i')
+
+        # Path id -> ids of the edges of this AS path, and number of prefixes using it (see add_path)
+        self.path_edges = {}
+        self.path_count = {}
+
+    def get_node(self, asn):
+        nid = self.node_ids.get(asn)
+        if nid is None:
+            if len(self.free_nodes) > 0:
+                nid = self.free_nodes.pop()
+            else:
+                nid = len(self.degree)
+                self.out_prefixes.append(0)
+                self.in_prefixes.append(0)
+                self.degree.append(0)
+            self.node_ids[asn] = nid
+        return nid
+
+    def new_edge(self, from_node, to_node):
+        src = self.get_node(from_node)
+        dst = self.get_node(to_node)
+
+        if len(self.free_edges) > 0:
+            eid = self.free_edges.pop()
+            self.prefix_counter[eid] = 0.
+            self.edge_src[eid] = src
+            self.edge_dst[eid] = dst
+            if not self.silent:
+                self.prefixes[eid] = Bitmap()
+        else:
+            eid = len(self.prefix_counter)
+            self.prefix_counter.append(0.)
+            self.depth_counter.extend([0]*DEPTH_SLOTS)
+            self.edge_src.append(src)
+            self.edge_dst.append(dst)
+            self.prefixes.append(Bitmap() if not self.silent else None)
+
+        self.edge_ids[(from_node << 32) | to_node] = eid
+        edge = Edge(self, eid)
+        if from_node not in self.succ:
+            self.succ[from_node] = {}
+        self.succ[from_node][to_node] = edge
+        if to_node not in self.pred:
+            self.pred[to_node] = {}
+        self.pred[to_node][from_node] = edge
+        self.degree[src] += 1
+        self.degree[dst] += 1
+
+        return eid
+
+    def remove_edge(self, from_node, to_node):
+        eid = self.edge_ids.pop((from_node << 32) | to_node)
+        self.free_edges.append(eid)
+        if not self.silent:
+            self.prefixes[eid] = None
+
+        del self.succ[from_node][to_node]
+        if len(self.succ[from_node]) == 0:
+            del self.succ[from_node]
+        del self.pred[to_node][from_node]
+        if len(self.pred[to_node]) == 0:
+            del self.pred[to_node]
+
+        for node, nid in ((from_node, self.edge_src[eid]), (to_node, self.edge_dst[eid])):
+            self.degree[nid] -= 1
+            if self.degree[nid] == 0:
+                del self.node_ids[node]
+                self.free_nodes.append(nid)
+
+    """
+    Returns the ids of the edges of an AS path, the edges which do not exist
+    yet are created.
+    """
+    def path_edge_ids(self, as_path):
+        edge_ids = self.edge_ids
+        eids = array('i')
+        for i in range(0, len(as_path)-1):
+            eid = edge_ids.get((as_path[i] << 32) | as_path[i+1])
+            if eid is None:
+                eid = self.new_edge(as_path[i], as_path[i+1])
+            eids.append(eid)
+        return eids
+
+    """
+    Add count prefixes with this AS path (the id of a prefix can only be given if count is 1).
+    """
+    def add(self, as_path, pid=None, count=1):
+        self.add_edges(self.path_edge_ids(as_path), as_path, pid, count)
+
+    """
+    Remove count prefixes with this AS path (the id of a prefix can only be given if count is 1).
+    """
+    def remove(self, as_path, pid=None, count=1):
+        edge_ids = self.edge_ids
+        eids = [edge_ids[(as_path[i] << 32) | as_path[i+1]] for i in range(0, len(as_path)-1)]
+        self.remove_edges(eids, as_path, pid, count)
+
+    """
+    Same as add and remove, with the id of the AS path in the ASPathTable of the
+    peer. The ids of the edges of the paths used are kept, so that adding or
+    removing a prefix does not need any dictionary lookup (the AS paths without
+    edges are ignored).
+    """
+    def add_path(self, path_id, count=1, pid=None):
+        as_path = self.paths.get(path_id)
+        if len(as_path) < 2:
+            return
+
+        eids = self.path_edges.get(path_id)
+        if eids is None:
+            eids = self.path_edge_ids(as_path)
+            self.path_edges[path_id] = eids
+            self.path_count[path_id] = 0
+        self.path_count[path_id] += count
+        self.add_edges(eids, as_path, pid, count)
+
+    def remove_path(self, path_id, count=1, pid=None):
+        as_path = self.paths.get(path_id)
+        if len(as_path) < 2:
+            return
+
+        self.remove_edges(self.path_edges[path_id], as_path, pid, count)
+        self.path_count[path_id] -= count
+        if self.path_count[path_id] == 0:
+            del self.path_edges[path_id]
+            del self.path_count[path_id]
+
+    def add_edges(self, eids, as_path, pid, count):
+        prefix_counter = self.prefix_counter
+        depth_counter = self.depth_counter
+        out_prefixes = self.out_prefixes
+        in_prefixes = self.in_prefixes
+        w_threshold = self.w_threshold
+        keep_prefix = not self.silent and pid is not None
+        if self.touched is not None:
+            self.touched.append(as_path)
+
+        for i in range(0, len(eids)):
+            eid = eids[i]
+
+            # Update the node attributes, and add those nodes in the out_prefixes our in_prefixes sets if necessary
+            src = self.edge_src[eid]
+            out_prefixes[src] += count
+            if w_threshold <= out_prefixes[src] < w_threshold+count:
+                self.nodes_forward.add(as_path[i])
+            dst = self.edge_dst[eid]
+            in_prefixes[dst] += count
+            if w_threshold <= in_prefixes[dst] < w_threshold+count:
+                self.nodes_backward.add(as_path[i+1])
+
+            # Update the prefix counter and the depth prefix counter
+            prefix_counter[eid] += count
+            if i+1 < DEPTH_SLOTS:
+                depth_counter[eid*DEPTH_SLOTS+i+1] += count
+            else:
+                self.depth_overflow[(eid, i+1)] = self.depth_overflow.get((eid, i+1), 0) + count
+
+            # Update the prefix bitmap (if not silent only)
+            if keep_prefix:
+                self.prefixes[eid].add(pid)
+
+    def remove_edges(self, eids, as_path, pid, count):
+        prefix_counter = self.prefix_counter
+        depth_counter = self.depth_counter
+        out_prefixes = self.out_prefixes
+        in_prefixes = self.in_prefixes
+        w_threshold = self.w_threshold
+        keep_prefix = not self.silent and pid is not None
+        if self.touched is not None:
+            self.touched.append(as_path)
+
+        for i in range(0, len(eids)):
+            eid = eids[i]
+
+            # Update the node attributes, and remove those nodes from the out_prefixes our in_prefixes sets if necessary
+            src = self.edge_src[eid]
+            out_prefixes[src] -= count
+            if w_threshold-count <= out_prefixes[src] < w_threshold:
+                self.nodes_forward.remove(as_path[i])
+            dst = self.edge_dst[eid]
+            in_prefixes[dst] -= count
+            if w_threshold-count <= in_prefixes[dst] < w_threshold:
+                self.nodes_backward.remove(as_path[i+1])
+
+            # Update the weight and the depth prefix counter
+            prefix_counter[eid] -= count
+            if i+1 < DEPTH_SLOTS:
+                depth_counter[eid*DEPTH_SLOTS+i+1] -= count
+            else:
+                self.depth_overflow[(eid, i+1)] -= count
+                if self.depth_overflow[(eid, i+1)] == 0:
+                    del self.depth_overflow[(eid, i+1)]
+
+            # Update the prefix bitmap (if not silent only)
+            if keep_prefix:
+                self.prefixes[eid].remove(pid)
+
+            # Clean the graph
+            if prefix_counter[eid] == 0.:
+                self.remove_edge(as_path[i], as_path[i+1])
+
+    def __contains__(self, node):
+        return node in self.node_ids
+
+    def __iter__(self):
+        return iter(self.node_ids)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __getitem__(self, node):
+        succ = self.succ.get(node)
+        if succ is None:
+            if node not in self.node_ids:
+                raise KeyError(node)
+            return {}
+        return succ
+
+    def has_edge(self, from_node, to_node):
+        return ((from_node << 32) | to_node) in self.edge_ids
+
+    def predecessors(self, node):
+        return self.pred.get(node, {}).keys()
+
+    def successors(self, node):
+        return self.succ.get(node, {}).keys()
+
+    def nodes(self):
+        return self.node_ids.keys()
+
+    def edges(self):
+        return [(from_node, to_node) for from_node, succ in self.succ.items() for to_node in succ]
+
+    def number_of_edges(self):
+        return len(self.edge_ids)
+
+    """
+    Number of prefixes going out of (or coming in) a node.
+    """
+    def get_out_prefixes(self, node):
+        return self.out_prefixes[self.node_ids[node]]
+
+    def get_in_prefixes(self, node):
+        return self.in_prefixes[self.node_ids[node]]
+
+    def print_nodes(self):
+        list_nodes = []
+        for n, nid in self.node_ids.items():
+            list_nodes.append((n, self.out_prefixes[nid], self.in_prefixes[nid]))
+
+        list_nodes = sorted(list_nodes, reverse=True, key=lambda x:x[1])
+
+        res = ''
+        for i in list_nodes:
+            res += str(i[0])+'\t'+str(i[1])+'\t'+str(i[2])+'\n'
+
+        print self.nodes_forward
+        print self.nodes_backward
+
+        return res
+
+    def get_prefixes_edge(self, edge):
+        eid = self.edge_ids.get((edge[0] << 32) | edge[1])
+        if eid is None or self.silent:
+            return
+        for pid in self.prefixes[eid]:
+            yield self.prefix_ids.prefix(pid)
+
+    """
+    Yields the prefixes traversing at least one of the edges.
+    """
+    def get_prefixes_edges(self, edges):
+        if self.silent:
+            return
+        union = Bitmap()
+        for edge in edges:
+            eid = self.edge_ids.get((edge[0] << 32) | edge[1])
+            if eid is not None:
+                union.update(self.prefixes[eid])
+        for pid in union:
+            yield self.prefix_ids.prefix(pid)
+
+    def __str__(self):
+        res = ''
+        for i, j in self.edges():
+            res += str(i)+'\t'+str(j)+'\t'+str(self[i][j]['prefix_counter'])+'\n'
+        return res
+
+    def get_depth(self, from_node, to_node):
+        depth = '-1'
+        if self.has_edge(from_node, to_node):
+            depth = min(self[from_node][to_node]['depth'].keys())
+
+        return depth
+
+    """
+    Return a string with the description of the topology. Only the edges with the
+    the top _limit_ weight are shown.
+    """
+    def print_subtopo(self, limit=10):
+        list_edges = []
+        for i, j in self.edges():
+            list_edges.append((i, j, self[i][j]['prefix_counter']))
+
+        list_edges_sorted = sorted(list_edges, reverse=True, key=lambda x:x[2])
+
+        res = ''
+        for i in range(0, min(len(list_edges_sorted),limit)):
+            res += str(list_edges_sorted[i][0])+'\t'+str(list_edges_sorted[i][1])+'\t'+str(list_edges_sorted[i][2])+'\t'+str(self[list_edges_sorted[i][0]][list_edges_sorted[i][1]]['depth'])+'\n'
+        return res
+
+    def fowlkes_mallows(self, TP, FP, FN, w_p=1., w_r=1.):
+        return math.exp((w_p*math.log(TP/(TP+FP)) + w_r*math.log(TP/(TP+FN))) / (w_p+w_r))
@@ -0,0 +1,131 @@
+import sys
+import os
+import time
+import random
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from as_topology import topology_class
+from bpa import IncrementalBPA, AnytimeBPA
+from peer import burst_prediction
+from topology import synthetic_table, file_table
+
+"""
+Benchmark of the BPA algorithms during a large burst. The whole table is loaded
+in G, then a link fails: the prefixes traversing it are withdrawn (moved from G
+to G_W) in a random order, mixed with withdrawals of random prefixes (noise).
+The prediction runs every bpa_freq withdrawals, with bpa-multiple (the
+reference) and the other algorithms given, and the script checks that they
+return the same edges, FM score, TP, FP and FN as the reference.
+
+With --bpa_budget, the script also reports the quality of the prediction of
+bpa-anytime within this budget (before its search continues): the number of
+exact predictions, and the FM score compared to the one of the reference.
+"""
+
+"""
+The attributes of a burst used by burst_prediction.
+"""
+class BenchmarkBurst:
+    def __init__(self):
+        self.prediction_done = False
+        self.deleted_from_W_queue = []
+
+def failure_withdrawals(table, noise, seed=0):
+    rand = random.Random(seed)
+
+    # The failed link is the link at depth 2 used by the largest number of prefixes
+    counter = {}
+    for prefix, as_path in table:
+        if len(as_path) > 2:
+            counter[(as_path[1], as_path[2])] = counter.get((as_path[1], as_path[2]), 0) + 1
+    failed_edge = max(counter, key=lambda e: counter[e])
+
+    withdrawals = [(prefix, as_path) for prefix, as_path in table if len(as_path) > 2 and (as_path[1], as_path[2]) == failed_edge]
+    others = [(prefix, as_path) for prefix, as_path in table if len(as_path) <= 2 or (as_path[1], as_path[2]) != failed_edge]
+    withdrawals += rand.sample(others, int(len(withdrawals)*noise))
+    rand.shuffle(withdrawals)
+
+    return failed_edge, withdrawals
+
+def run_benchmark(name, table, withdrawals, algos, nb_withdrawals_burst_start, bpa_freq, p_w, r_w, bpa_budget=None):
+    G = topology_class(name)(1, True)
+    G_W = topology_class(name)(nb_withdrawals_burst_start, True)
+    for prefix, as_path in table:
+        G.add(as_path)
+
+    burst = BenchmarkBurst()
+    W_queue = []
+    bpa = IncrementalBPA(G, G_W, p_w, r_w) if 'bpa-incremental' in algos else None
+
+    durations = dict((algo, 0.) for algo in ['bpa-multiple']+algos)
+    nb_predictions = 0
+    nb_mismatches = 0
+    nb_exact_budget = 0
+    fm_ratio_budget = 0.
+
+    for prefix, as_path in withdrawals:
+        G.remove(as_path)
+        G_W.add(as_path)
+        W_queue.append(prefix)
+
+        if len(W_queue) >= nb_withdrawals_burst_start and len(W_queue) % bpa_freq == 0:
+            nb_predictions += 1
+
+            start = time.time()
+            reference = burst_prediction(burst, G, G_W, W_queue, p_w, r_w, 'bpa-multiple', None)
+            durations['bpa-multiple'] += time.time() - start
+
+            for algo in algos:
+                start = time.time()
+                res = burst_prediction(burst, G, G_W, W_queue, p_w, r_w, algo, None, bpa)
+                durations[algo] += time.time() - start
+
+                if res != reference:
+                    nb_mismatches += 1
+                    print 'Mismatch '+algo+' after '+str(len(W_queue))+' withdrawals: '+str(sorted(res[0]))+' '+str(res[1:])+' instead of '+str(sorted(reference[0]))+' '+str(reference[1:])
+
+            if bpa_budget is not None:
+                res = AnytimeBPA(G, G_W, len(W_queue), p_w, r_w).run(bpa_budget/1000.)
+                if res == reference:
+                    nb_exact_budget += 1
+                fm_ratio_budget += res[1]/reference[1] if reference[1] > 0 else 1.
+
+    if bpa is not None:
+        bpa.detach()
+
+    return nb_predictions, nb_mismatches, durations, nb_exact_budget, fm_ratio_budget
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("Benchmark of the BPA algorithms during a large burst.")
+    parser.add_argument("--infile", type=str, default=None, help="File with the BGP messages of the table (a synthetic table is used if not set).")
+    parser.add_argument("--nb_prefixes", type=int, default=300000, help="Number of prefixes of the synthetic table (default 300000).")
+    parser.add_argument("--noise", type=float, default=0.1, help="Number of random withdrawals per withdrawal of the failed link (default 0.1).")
+    parser.add_argument("--nb_withdrawals_burst_start", type=int, default=1500, help="Number of withdrawals before the first prediction (default 1500).")
+    parser.add_argument("--bpa_freq", type=int, default=100, help="Number of withdrawals between two predictions (default 100).")
+    parser.add_argument("--p_w", type=int, default=1, help="Weight of the precision (default 1).")
+    parser.add_argument("--r_w", type=int, default=1, help="Weight of the recall (default 1).")
+    parser.add_argument("--algos", type=str, default='bpa-incremental', help="Algorithms compared with bpa-multiple, separated by a comma.")
+    parser.add_argument("--bpa_budget", type=float, default=None, help="Time budget (in ms) of bpa-anytime, to report the quality of its prediction within the budget.")
+    parser.add_argument("--topology", type=str, default='networkx', help="Implementation of the AS topologies (networkx or array).")
+    args = parser.parse_args()
+
+    if args.infile is not None:
+        table = file_table(args.infile)
+    else:
+        table = synthetic_table(args.nb_prefixes)
+    failed_edge, withdrawals = failure_withdrawals(table, args.noise)
+    print 'Table: '+str(len(table))+' prefixes, failed link '+str(failed_edge)+', '+str(len(withdrawals))+' withdrawals'
+
+    algos = args.algos.split(',')
+    nb_predictions, nb_mismatches, durations, nb_exact_budget, fm_ratio_budget = run_benchmark(args.topology, table, withdrawals, algos, \
+    args.nb_withdrawals_burst_start, args.bpa_freq, args.p_w, args.r_w, args.bpa_budget)
+
+    print str(nb_predictions)+' predictions, '+str(nb_mismatches)+' mismatches'
+    for algo in ['bpa-multiple']+algos:
+        print algo+'\t'+('%.2f' % durations[algo])+'s ('+('%.1f' % (1000*durations[algo]/max(nb_predictions, 1)))+' ms per prediction)'
+
+    if args.bpa_budget is not None:
+        print 'bpa-anytime within '+str(args.bpa_budget)+' ms: '+str(nb_exact_budget)+'/'+str(nb_predictions)+' exact predictions, ' \
+        +('%.3f' % (fm_ratio_budget/max(nb_predictions, 1)))+' of the FM score of bpa-multiple on average'
@@ -0,0 +1,63 @@
+import sys
+import os
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from as_topology import topology_class
+from encoding import Encoding
+from topology import synthetic_table, file_table
+
+"""
+Benchmark of the computation of the encoding on a full routing table:
+compute_encoding (all the AS links sorted at once) against the former
+compute_encoding_sortedlist (one sorted list per depth), for several numbers of
+bits of the AS path part of the VMAC (see --nb_bits_aspath in swift.py). The
+script also checks that both give the same mappings, encoded links and minimums.
+"""
+
+def encoding_state(encoding):
+    mapping = {}
+    for depth, m in encoding.mapping.items():
+        values = dict((asn, (value, m.from_count[value], m.to_count[value])) for asn, value in m.mapping.items())
+        mapping[depth] = (m.nb_bytes, list(m.free), values, m.blocked)
+    return mapping, encoding.encoded_aslinks, encoding.minimum
+
+def run_benchmark(G, nb_bits):
+    res = {}
+    states = {}
+    for name in ['compute_encoding_sortedlist', 'compute_encoding']:
+        encoding = Encoding('benchmark', G, 'encoding', nb_bits, 5, output=False)
+        start = time.time()
+        getattr(encoding, name)()
+        res[name] = time.time() - start
+        states[name] = encoding_state(encoding)
+
+    identical = states['compute_encoding_sortedlist'] == states['compute_encoding']
+    nb_links = sum(len(links) for links in states['compute_encoding'][1].values())
+    return res, identical, nb_links
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("Benchmark of the computation of the encoding on a full routing table.")
+    parser.add_argument("--infile", type=str, default=None, help="File with the BGP messages of the table (a synthetic table is used if not set).")
+    parser.add_argument("--nb_prefixes", type=int, default=800000, help="Number of prefixes of the synthetic table (default 800000).")
+    parser.add_argument("--nb_bits_aspath", type=str, default='20,28,36', help="Numbers of bits of the AS path part, separated by a comma (default 20,28,36).")
+    parser.add_argument("--topology", type=str, default='networkx', help="Implementation of the AS topology (networkx or array).")
+    args = parser.parse_args()
+
+    if args.infile is not None:
+        table = file_table(args.infile)
+    else:
+        table = synthetic_table(args.nb_prefixes)
+
+    G = topology_class(args.topology)(1, True)
+    for prefix, as_path in table:
+        G.add(as_path)
+    print 'Table: '+str(len(table))+' prefixes, '+str(len(G.edges()))+' AS links'
+
+    for nb_bits in map(int, args.nb_bits_aspath.split(',')):
+        res, identical, nb_links = run_benchmark(G, nb_bits)
+        print str(nb_bits)+' bits\tsortedlist: '+('%.2f' % res['compute_encoding_sortedlist'])+'s' \
+        +'\tnumpy: '+('%.2f' % res['compute_encoding'])+'s ('+('%.1f' % (res['compute_encoding_sortedlist']/max(res['compute_encoding'], 1e-6)))+'x)' \
+        +'\tencoded links: '+str(nb_links)+'\t'+('identical' if identical else 'DIFFERENT')
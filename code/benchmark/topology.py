@@ -0,0 +1,162 @@
+import sys
+import os
+import time
+import random
+import resource
+import argparse
+import multiprocessing
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from as_topology import topology_class
+from prefix_index import PrefixIds
+from rib import ASPathTable, RIBPeer
+from bgp_messages import BGPMessage, parse, prefix_to_int
+
+"""
+Benchmark of the AS topology implementations (see --topology in swift.py) on a
+full routing table: load all the prefixes (G.add), replace the AS path of some
+of them (G.remove then G.add, as for an advertisement) and withdraw them all
+(G.remove). Every implementation runs in its own process, so that the maximum
+resident memory reported only counts its own topology.
+
+The table is either read from a file (BGP messages in any format parse
+understands, e.g., the output of feed/mrt.py on a RIB dump), or generated:
+nb_prefixes prefixes whose AS paths go from the peer down a synthetic hierarchy
+of ASes, so that the paths share their first edges as in a real table.
+
+The prefix ids of the prefix bitmaps are the positions of the prefixes in the
+table. With --path_ids, the prefixes are kept in a RIBPeer, which interns their
+AS paths and gives their prefix ids (as in the peers), and the topologies are
+updated with add_path and remove_path.
+"""
+
+def synthetic_table(nb_prefixes, seed=0):
+    rand = random.Random(seed)
+    peer_as = 1
+    tier1 = range(10, 25)
+    tier2 = range(100, 1600)
+    tier3 = range(2000, 17000)
+    stubs = range(20000, 90000)
+
+    table = []
+    for i in range(0, nb_prefixes):
+        origin = stubs[int(rand.paretovariate(1.2)) % len(stubs)] if rand.random() < 0.8 else rand.choice(tier3)
+        as_path = [peer_as, rand.choice(tier1)]
+        if rand.random() < 0.9:
+            as_path.append(tier2[hash((origin, 2)) % len(tier2)])
+        if rand.random() < 0.6:
+            as_path.append(tier3[hash((origin, 3)) % len(tier3)])
+        if origin not in as_path:
+            as_path.append(origin)
+        prefix = prefix_to_int(str(1+i/65536)+'.'+str((i/256) % 256)+'.'+str(i % 256)+'.0/24')
+        table.append((prefix, as_path))
+    return table
+
+def file_table(filename):
+    table = {}
+    with open(filename, 'r') as fd:
+        for line in fd:
+            bgp_msg = parse(line)
+            if bgp_msg is not None and bgp_msg.mtype == 'A' and bgp_msg.as_path:
+                table[bgp_msg.prefix] = bgp_msg.as_path
+    return table.items()
+
+def run_benchmark(name, table, nb_churn, silent, path_ids, queue):
+    if path_ids:
+        run_benchmark_path_ids(name, table, nb_churn, silent, queue)
+        return
+
+    prefix_ids = PrefixIds()
+    G = topology_class(name)(1, silent, None, prefix_ids)
+    res = {}
+
+    start = time.time()
+    for prefix, as_path in table:
+        G.add(as_path, prefix_ids.new(prefix))
+    res['load'] = time.time() - start
+    res['edges'] = len(G.edges())
+    res['maxrss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Move some prefixes to the AS path of another prefix
+    rand = random.Random(1)
+    current = [as_path for prefix, as_path in table]
+    start = time.time()
+    for i in range(0, nb_churn):
+        pid = rand.randrange(len(table))
+        new_as_path = table[rand.randrange(len(table))][1]
+        G.remove(current[pid], pid)
+        G.add(new_as_path, pid)
+        current[pid] = new_as_path
+    res['churn'] = time.time() - start
+
+    start = time.time()
+    for pid in range(0, len(current)):
+        G.remove(current[pid], pid)
+    res['withdraw'] = time.time() - start
+
+    queue.put(res)
+
+def run_benchmark_path_ids(name, table, nb_churn, silent, queue):
+    paths = ASPathTable()
+    prefix_ids = PrefixIds() if not silent else None
+    G = topology_class(name)(1, silent, paths, prefix_ids)
+    rib = RIBPeer(paths, prefix_ids)
+    res = {}
+
+    start = time.time()
+    for prefix, as_path in table:
+        old_path_id, path_id, pid = rib.update_path(BGPMessage('A', None, None, 0, prefix, as_path))
+        G.add_path(path_id, pid=pid)
+    res['load'] = time.time() - start
+    res['edges'] = len(G.edges())
+    res['maxrss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    rand = random.Random(1)
+    start = time.time()
+    for i in range(0, nb_churn):
+        prefix = table[rand.randrange(len(table))][0]
+        as_path = table[rand.randrange(len(table))][1]
+        old_path_id, path_id, pid = rib.update_path(BGPMessage('A', None, None, 0, prefix, as_path))
+        G.remove_path(old_path_id, pid=pid)
+        G.add_path(path_id, pid=pid)
+        paths.release(old_path_id)
+    res['churn'] = time.time() - start
+
+    start = time.time()
+    for prefix in rib.rib.keys():
+        path_id, pid = rib.withdraw_path(BGPMessage('W', None, None, 0, prefix))
+        G.remove_path(path_id, pid=pid)
+        paths.release(path_id)
+    res['withdraw'] = time.time() - start
+
+    queue.put(res)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("Benchmark of the AS topology implementations on a full routing table.")
+    parser.add_argument("--infile", type=str, default=None, help="File with the BGP messages of the table (a synthetic table is used if not set).")
+    parser.add_argument("--nb_prefixes", type=int, default=900000, help="Number of prefixes of the synthetic table (default 900000).")
+    parser.add_argument("--nb_churn", type=int, default=200000, help="Number of AS path changes (default 200000).")
+    parser.add_argument("--silent", action='store_true', default=False, help="Do not keep the prefixes of every edge (as with swift.py --silent).")
+    parser.add_argument("--path_ids", action='store_true', default=False, help="Use the ids of the AS paths (add_path and remove_path).")
+    parser.add_argument("--topologies", type=str, default='networkx,array', help="Implementations to compare, separated by a comma.")
+    args = parser.parse_args()
+
+    if args.infile is not None:
+        table = file_table(args.infile)
+    else:
+        table = synthetic_table(args.nb_prefixes)
+    nb_hops = sum(len(as_path)-1 for prefix, as_path in table)
+    print 'Table: '+str(len(table))+' prefixes, '+str(nb_hops)+' AS hops'
+
+    for name in args.topologies.split(','):
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run_benchmark, args=(name, table, args.nb_churn, args.silent, args.path_ids, queue))
+        process.start()
+        res = queue.get()
+        process.join()
+
+        print name+'\tload: '+('%.2f' % res['load'])+'s ('+('%.0f' % (len(table)/res['load']))+' prefixes/s)' \
+        +'\tchurn: '+('%.2f' % res['churn'])+'s ('+('%.0f' % (args.nb_churn/res['churn']))+' updates/s)' \
+        +'\twithdraw: '+('%.2f' % res['withdraw'])+'s ('+('%.0f' % (len(table)/res['withdraw']))+' prefixes/s)' \
+        +'\tedges: '+str(res['edges'])+'\tmax RSS: '+str(res['maxrss']/1024)+' MB'
@@ -1,8 +1,62 @@
 import argparse
+import math
+import struct
+import socket
+import binascii
+from array import array
 from collections import deque
 
+"""
+Prefixes are stored as integers: (network << 8) | prefix length, with the bit
+PREFIX_IPV6 set for IPv6 prefixes. They are converted back to text only when
+they are written (see prefix_to_text).
+"""
+PREFIX_IPV6 = 1 << 136
+PREFIX_IPV4_NETWORK = struct.Struct('!I')
+
+def prefix_to_int(prefix):
+    address, sep, prefix_len = prefix.partition('/')
+    if ':' in address:
+        network = int(binascii.hexlify(socket.inet_pton(socket.AF_INET6, address)), 16)
+        return PREFIX_IPV6 | (network << 8) | (int(prefix_len) if sep else 128)
+    else:
+        network = PREFIX_IPV4_NETWORK.unpack(socket.inet_aton(address))[0]
+        return (network << 8) | (int(prefix_len) if sep else 32)
+
+def prefix_to_text(prefix):
+    if isinstance(prefix, basestring): # INFO messages do not carry a prefix
+        return prefix
+    if prefix & PREFIX_IPV6:
+        network = (prefix & (PREFIX_IPV6-1)) >> 8
+        return socket.inet_ntop(socket.AF_INET6, binascii.unhexlify('%032x' % network))+'/'+str(prefix & 0xff)
+    else:
+        return socket.inet_ntoa(PREFIX_IPV4_NETWORK.pack(prefix >> 8))+'/'+str(prefix & 0xff)
+
+"""
+Returns the address family (4 or 6), the prefix length and the network
+(4 or 16 bytes, in network order) of a prefix.
+"""
+def prefix_to_bytes(prefix):
+    if prefix & PREFIX_IPV6:
+        return 6, prefix & 0xff, binascii.unhexlify('%032x' % ((prefix & (PREFIX_IPV6-1)) >> 8))
+    else:
+        return 4, prefix & 0xff, PREFIX_IPV4_NETWORK.pack(prefix >> 8)
+
+def prefix_from_bytes(family, prefix_len, network):
+    if family == 6:
+        return PREFIX_IPV6 | (int(binascii.hexlify(network[:16]), 16) << 8) | prefix_len
+    else:
+        return (PREFIX_IPV4_NETWORK.unpack(network[:4])[0] << 8) | prefix_len
+
+
+"""
+A BGP message. The prefix is an integer (see prefix_to_int), and slots are used
+instead of a per-instance dictionary because the peers keep the withdrawals in
+their queue during the whole burst.
+"""
+class BGPMessage(object):
+    __slots__ = ['mtype', 'peer_id', 'peer_as', 'time', 'prefix', 'as_path', 'description']
 
-class BGPMessage:
     def __init__(self, mtype, peer_id, peer_as, time, prefix, as_path=None, description=None):
         self.mtype = mtype
         self.peer_id = peer_id
@@ -14,30 +68,290 @@ class BGPMessage:
 
     def __str__(self):
         if self.prefix is not None:
-            res = str(self.description)+'|'+self.mtype+'|'+self.peer_id+'|'+str(self.peer_as)+'|'+str(self.time)+'|'+self.prefix+'|'+str(self.as_path)
+            res = str(self.description)+'|'+self.mtype+'|'+self.peer_id+'|'+str(self.peer_as)+'|'+str(self.time)+'|'+prefix_to_text(self.prefix)+'|'+str(self.as_path)
         else:
             res = str(self.description)+'|'+self.mtype+'|'+self.peer_id+'|'+str(self.peer_as)+'|'+str(self.time)+'|'+str(self.as_path)
         return res
 
-class BGPMessagesQueue(deque):
-    def __init__(self, time):
-        super(BGPMessagesQueue, self).__init__()
+    """
+    Returns an object that can be kept (see BGPMessageView).
+    """
+    def detach(self):
+        return self
+
+"""
+A block of BGP messages parsed at once (see parse_many), stored in columns:
+parallel lists/arrays for the type, peer, timestamp, prefix and source format of
+the messages, and the AS paths in a shared pool of AS numbers (path_offsets is -1
+if the message has no AS path). Peer ids are interned, and identical prefixes and
+AS paths are only converted (and AS paths stored) once per batch.
+Lines that could not be parsed are kept in errors.
+"""
+class BGPMessageBatch:
+    def __init__(self):
+        self.mtypes = []
+        self.peer_ids = []
+        self.peer_as = []
+        self.times = array('d')
+        self.prefixes = []
+        self.descriptions = []
+        self.path_offsets = array('l')
+        self.path_lengths = array('l')
+        self.path_pool = array('l')
+        self.errors = []
+
+        # AS path (text) -> (offset, length) in the pool
+        self.path_cache = {}
+        # Prefix (text) -> prefix (integer)
+        self.prefix_cache = {}
+
+    def __len__(self):
+        return len(self.mtypes)
+
+    """
+    Add the AS path (text, ASes separated by a space) in the pool, if not done yet.
+    Returns its offset and length in the pool.
+    """
+    def add_path(self, path_str):
+        ref = self.path_cache.get(path_str)
+        if ref is None:
+            as_path = clean_aspath(map(int, path_str.split(' ')))
+            ref = (len(self.path_pool), len(as_path))
+            self.path_pool.extend(as_path)
+            self.path_cache[path_str] = ref
+        return ref
+
+    """
+    Returns the prefix as an integer.
+    """
+    def add_prefix(self, prefix_str):
+        prefix = self.prefix_cache.get(prefix_str)
+        if prefix is None:
+            prefix = prefix_to_int(prefix_str)
+            self.prefix_cache[prefix_str] = prefix
+        return prefix
+
+    def append(self, mtype, peer_id, peer_as, ts, prefix, path_ref, description):
+        self.mtypes.append(mtype)
+        self.peer_ids.append(intern(peer_id))
+        self.peer_as.append(peer_as)
+        self.times.append(ts)
+        self.prefixes.append(prefix)
+        self.descriptions.append(description)
+        if path_ref is None:
+            self.path_offsets.append(-1)
+            self.path_lengths.append(0)
+        else:
+            self.path_offsets.append(path_ref[0])
+            self.path_lengths.append(path_ref[1])
+
+    """
+    Returns the AS path of the i-th message (None if it has no AS path).
+    """
+    def as_path(self, i):
+        offset = self.path_offsets[i]
+        if offset == -1:
+            return None
+        return self.path_pool[offset:offset+self.path_lengths[i]].tolist()
+
+    """
+    Returns the i-th message as a BGPMessage.
+    """
+    def message(self, i):
+        return BGPMessage(self.mtypes[i], self.peer_ids[i], self.peer_as[i], self.times[i], \
+        self.prefixes[i], self.as_path(i), self.descriptions[i])
+
+    """
+    Iterate over the messages without creating a BGPMessage for each of them.
+    The same view is returned at every step, use detach() to keep a message.
+    """
+    def __iter__(self):
+        view = BGPMessageView(self)
+        for i in xrange(0, len(self.mtypes)):
+            view.index = i
+            yield view
+
+"""
+Read-only view on one message of a BGPMessageBatch, with the same attributes
+as BGPMessage.
+"""
+class BGPMessageView(object):
+    __slots__ = ['batch', 'index']
+
+    def __init__(self, batch, index=0):
+        self.batch = batch
+        self.index = index
+
+    @property
+    def mtype(self):
+        return self.batch.mtypes[self.index]
+
+    @property
+    def peer_id(self):
+        return self.batch.peer_ids[self.index]
+
+    @property
+    def peer_as(self):
+        return self.batch.peer_as[self.index]
+
+    @property
+    def time(self):
+        return self.batch.times[self.index]
+
+    @property
+    def prefix(self):
+        return self.batch.prefixes[self.index]
+
+    @property
+    def as_path(self):
+        return self.batch.as_path(self.index)
+
+    @property
+    def description(self):
+        return self.batch.descriptions[self.index]
+
+    def detach(self):
+        return self.batch.message(self.index)
+
+    def __str__(self):
+        return str(self.detach())
+
+"""
+The distinct undirected edges of an AS path, as tuples (smallest AS, largest AS).
+"""
+def path_edges(as_path):
+    edges = set()
+    for i in range(0, len(as_path)-1):
+        edges.add((as_path[i], as_path[i+1]) if as_path[i] < as_path[i+1] else (as_path[i+1], as_path[i]))
+    return edges
+
+"""
+The BGP messages received in one bucket of time of a BGPMessagesWindow, and the
+number of messages of every AS path (a tuple) among them.
+"""
+class WindowBucket(object):
+    __slots__ = ['index', 'start', 'messages', 'paths', 'expired']
+
+    def __init__(self, index, start):
+        self.index = index
+        self.start = start
+        self.messages = []
+        self.paths = {}
+        self.expired = False
+
+    def __len__(self):
+        return len(self.messages)
+
+"""
+Sliding window with the BGP messages received during the last time seconds.
+The messages are grouped in buckets of resolution seconds, which expire all at
+once: the messages of a bucket are removed when the start of the bucket is more
+than time seconds old. The number of messages in the window is kept up to date,
+so expiring a bucket does not depend on the number of messages in it.
+
+With edge_index, the window also indexes the messages by the (undirected) AS
+edges of their AS path: edge -> buckets with messages traversing the edge, and
+these messages (see edge_messages). The expired buckets stay in the index until
+they are released, e.g., at the end of a burst.
+"""
+class BGPMessagesWindow(object):
+    def __init__(self, time, resolution=1, edge_index=False):
         self.time = time
+        self.resolution = resolution
+        self.buckets = deque()
+        self.size = 0
+        self.edges = {} if edge_index else None
+
+    def append(self, bgp_msg):
+        # The epsilon keeps a time such as 1.3 in the bucket 1300 of 1 ms (1.3/0.001 = 1299.99...)
+        index = int(math.floor(bgp_msg.time/self.resolution+1e-6))
+        # A message older than the last bucket (out of order) goes in the last bucket
+        if len(self.buckets) == 0 or index > self.buckets[-1].index:
+            self.buckets.append(WindowBucket(index, index*float(self.resolution)))
+        bucket = self.buckets[-1]
+
+        bucket.messages.append(bgp_msg)
+        if bgp_msg.as_path is not None:
+            as_path = tuple(bgp_msg.as_path)
+            bucket.paths[as_path] = bucket.paths.get(as_path, 0) + 1
+
+            if self.edges is not None:
+                for edge in path_edges(as_path):
+                    groups = self.edges.get(edge)
+                    if groups is None:
+                        groups = self.edges[edge] = deque()
+                    if len(groups) == 0 or groups[-1][0] is not bucket:
+                        groups.append((bucket, [bgp_msg]))
+                    else:
+                        groups[-1][1].append(bgp_msg)
+        self.size += 1
 
     """
-    Remove all the bgp messages in the queue that have expired
+    Remove the buckets that have expired at time ts, and yields them (oldest first).
+    """
+    def expire(self, ts):
+        buckets = self.buckets
+        while len(buckets) > 0 and ts - buckets[0].start > self.time:
+            bucket = buckets.popleft()
+            bucket.expired = True
+            self.size -= len(bucket.messages)
+            yield bucket
+
+    """
+    Remove all the bgp messages in the window that have expired at time ts.
     """
     def refresh(self, ts):
-        while len(self) > 0 and ts - self[0].time > self.time:
-            self.popleft()
+        for bucket in self.expire(ts):
+            self.release(bucket)
+
+    """
+    Remove an expired bucket from the edge index. The buckets must be released
+    in the order they expired.
+    """
+    def release(self, bucket):
+        if self.edges is not None:
+            for as_path in bucket.paths:
+                for edge in path_edges(as_path):
+                    # The group of the bucket may have been removed with another AS path of the bucket
+                    groups = self.edges.get(edge)
+                    if groups is not None and groups[0][0] is bucket:
+                        groups.popleft()
+                        if len(groups) == 0:
+                            del self.edges[edge]
 
     """
-    Remove all the bgp messages in the queue that have expired.
-    And yields the expired messages.
+    Yields the messages traversing an AS edge (in any direction), oldest first,
+    as tuples (expired, bgp_msg). The expired messages are the ones of the
+    buckets expired but not released yet.
     """
-    def refresh_iter(self, ts):
-        while len(self) > 0 and ts - self[0].time > self.time:
-            yield self.popleft()
+    def edge_messages(self, edge):
+        groups = self.edges.get((edge[0], edge[1]) if edge[0] < edge[1] else (edge[1], edge[0]), ())
+        for bucket, messages in groups:
+            for bgp_msg in messages:
+                yield bucket.expired, bgp_msg
+
+    """
+    Last time at which the messages of the bucket were still in the window.
+    """
+    def expiry_time(self, bucket):
+        return bucket.start+self.time
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for bucket in self.buckets:
+            for bgp_msg in bucket.messages:
+                yield bgp_msg
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.size
+        for bucket in self.buckets:
+            if i < len(bucket.messages):
+                return bucket.messages[i]
+            i -= len(bucket.messages)
+        raise IndexError('window index out of range')
 
 """
 Parse a bgp message from bgpdump or CBGP.
@@ -52,9 +366,9 @@ def parse(msg):
                     as_path = clean_aspath(map(lambda x: int(x), linetab[7].split(' ')))
                 except:
                     print 'ERROR: '+str(msg)
-                return BGPMessage(linetab[3], linetab[0]+'-'+linetab[4], as_path[0], float(linetab[2]), linetab[6], as_path, 'CBGP')
+                return BGPMessage(linetab[3], linetab[0]+'-'+linetab[4], as_path[0], float(linetab[2]), prefix_to_int(linetab[6]), as_path, 'CBGP')
             elif linetab[3] == 'W':
-                return BGPMessage(linetab[3], linetab[0]+'-'+linetab[4], None, float(linetab[2]), linetab[6], None, 'CBGP')
+                return BGPMessage(linetab[3], linetab[0]+'-'+linetab[4], None, float(linetab[2]), prefix_to_int(linetab[6]), None, 'CBGP')
             elif linetab[3] == 'CLOSE':
                 return BGPMessage(linetab[3], linetab[0]+'-'+linetab[4], None, float(linetab[2]), None, None, 'CBGP')
             elif linetab[3] == 'INFO':
@@ -65,9 +379,9 @@ def parse(msg):
         elif linetab[0] == 'BGP4MP': # RIPE's updates
             if linetab[2] == 'A':
                 as_path = clean_aspath(map(lambda x: int(x), linetab[6].split(' ')))
-                return BGPMessage(linetab[2], linetab[3], int(linetab[4]), float(linetab[1]), linetab[5], as_path, 'BGP4MP')
+                return BGPMessage(linetab[2], linetab[3], int(linetab[4]), float(linetab[1]), prefix_to_int(linetab[5]), as_path, 'BGP4MP')
             elif linetab[2] == 'W':
-                return BGPMessage(linetab[2], linetab[3], int(linetab[4]), float(linetab[1]), linetab[5], None, 'BGP4MP')
+                return BGPMessage(linetab[2], linetab[3], int(linetab[4]), float(linetab[1]), prefix_to_int(linetab[5]), None, 'BGP4MP')
             elif linetab[2] == 'CLOSE':
                 return BGPMessage(linetab[2], linetab[3], int(linetab[4]), float(linetab[1]), None, None, 'BGP4MP')
             else:
@@ -79,18 +393,81 @@ def parse(msg):
                     as_path = clean_aspath(map(lambda x: int(x), linetab[6].split(' ')))
                 except ValueError:
                     as_path = []
-                return BGPMessage('A', linetab[3], int(linetab[4]), float(linetab[1]), linetab[5], as_path, 'TABLE_DUMP2')
+                return BGPMessage('A', linetab[3], int(linetab[4]), float(linetab[1]), prefix_to_int(linetab[5]), as_path, 'TABLE_DUMP2')
 
         elif linetab[0] == 'BGPSTREAM':
             if linetab[2] == 'A' or linetab[2] == 'R':
                 as_path = clean_aspath(map(lambda x: int(x), linetab[7].split(' ')))
-                return BGPMessage('A', linetab[1]+'-'+linetab[3], int(linetab[4]), float(linetab[5]), linetab[6], as_path, 'BGPSTREAM')
+                return BGPMessage('A', linetab[1]+'-'+linetab[3], int(linetab[4]), float(linetab[5]), prefix_to_int(linetab[6]), as_path, 'BGPSTREAM')
             elif linetab[2] == 'W':
-                return BGPMessage(linetab[2], linetab[1]+'-'+linetab[3], int(linetab[4]), float(linetab[5]), linetab[6], None, 'BGPSTREAM')
+                return BGPMessage(linetab[2], linetab[1]+'-'+linetab[3], int(linetab[4]), float(linetab[5]), prefix_to_int(linetab[6]), None, 'BGPSTREAM')
             elif linetab[2] == 'CLOSE':
                 return BGPMessage(linetab[2], linetab[1]+'-'+linetab[3], int(linetab[4]), float(linetab[5]), None, None, 'BGPSTREAM')
 
 
+"""
+Parse a block of bgp messages from bgpdump or CBGP (one per line), with the same
+rules as parse. Lines that cannot be parsed are reported in the errors of the batch.
+Return a BGPMessageBatch.
+"""
+def parse_many(block, batch=None):
+    if batch is None:
+        batch = BGPMessageBatch()
+
+    for line in block.split('\n'):
+        if len(line) == 0 or line[0] == '#':
+            continue
+
+        linetab = line.split('|')
+        try:
+            if linetab[1] == 'BGP4': # c-bgp
+                mtype = linetab[3]
+                if mtype == 'A':
+                    path_ref = batch.add_path(linetab[7])
+                    # The peer AS is the first AS of the path
+                    if path_ref[1] == 0:
+                        batch.errors.append(line)
+                        continue
+                    batch.append('A', linetab[0]+'-'+linetab[4], batch.path_pool[path_ref[0]], \
+                    float(linetab[2]), batch.add_prefix(linetab[6]), path_ref, 'CBGP')
+                elif mtype == 'W':
+                    batch.append('W', linetab[0]+'-'+linetab[4], None, float(linetab[2]), batch.add_prefix(linetab[6]), None, 'CBGP')
+                elif mtype == 'CLOSE':
+                    batch.append('CLOSE', linetab[0]+'-'+linetab[4], None, float(linetab[2]), None, None, 'CBGP')
+                elif mtype == 'INFO':
+                    batch.append('INFO', linetab[0]+'-'+linetab[4], None, float(linetab[2]), linetab[6]+'_'+linetab[7], None, 'CBGP')
+
+            elif linetab[0] == 'BGPSTREAM':
+                mtype = linetab[2]
+                if mtype == 'A' or mtype == 'R':
+                    batch.append('A', linetab[1]+'-'+linetab[3], int(linetab[4]), float(linetab[5]), batch.add_prefix(linetab[6]), batch.add_path(linetab[7]), 'BGPSTREAM')
+                elif mtype == 'W':
+                    batch.append('W', linetab[1]+'-'+linetab[3], int(linetab[4]), float(linetab[5]), batch.add_prefix(linetab[6]), None, 'BGPSTREAM')
+                elif mtype == 'CLOSE':
+                    batch.append('CLOSE', linetab[1]+'-'+linetab[3], int(linetab[4]), float(linetab[5]), None, None, 'BGPSTREAM')
+
+            elif linetab[0] == 'BGP4MP': # RIPE's updates
+                mtype = linetab[2]
+                if mtype == 'A':
+                    batch.append('A', linetab[3], int(linetab[4]), float(linetab[1]), batch.add_prefix(linetab[5]), batch.add_path(linetab[6]), 'BGP4MP')
+                elif mtype == 'W':
+                    batch.append('W', linetab[3], int(linetab[4]), float(linetab[1]), batch.add_prefix(linetab[5]), None, 'BGP4MP')
+                elif mtype == 'CLOSE':
+                    batch.append('CLOSE', linetab[3], int(linetab[4]), float(linetab[1]), None, None, 'BGP4MP')
+
+            elif linetab[0] == 'TABLE_DUMP2':
+                if linetab[2] == 'B':
+                    try:
+                        path_ref = batch.add_path(linetab[6])
+                    except ValueError:
+                        path_ref = (0, 0)
+                    batch.append('A', linetab[3], int(linetab[4]), float(linetab[1]), batch.add_prefix(linetab[5]), path_ref, 'TABLE_DUMP2')
+
+        except (IndexError, ValueError, OverflowError, socket.error):
+            batch.errors.append(line)
+
+    return batch
+
 """
 Remove duplicate ASes in case of AS-path prepending.
 Check for loops in the as-path.
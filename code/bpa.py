@@ -1,5 +1,10 @@
 import math
 import time
+import signal
+import heapq
+import Queue
+import multiprocessing
+import numpy as np
 from as_topology import ASTopology
 
 """
@@ -225,6 +230,537 @@ def find_best_fmscore_backward(G, G_W, W_nb, p_w=1, r_w=1, opti=True):
     return best_edge_set, best_fm_score, best_TP, best_FP, best_FN
 
 
+"""
+Same as fowlkes_mallows, on numpy arrays (same operations, hence the same results).
+"""
+def fowlkes_mallows_numpy(TP, FP, FN, w_p=1., w_r=1.):
+    return np.exp((w_p*np.log(TP/(TP+FP)) + w_r*np.log(TP/(TP+FN))) / (w_p+w_r))
+
+"""
+The greedy algorithm of find_best_fmscore_forward and find_best_fmscore_backward,
+on all the nodes at once with numpy. The candidate edges of a node form a
+segment: segments[i] is the node of edges[i], TP[i] and FP[i] are its TP and FP
+(the edges of a node are contiguous, in the order used by the loops of
+find_best_fmscore_forward and find_best_fmscore_backward).
+Every segment is sorted by FM score (stable argsort), the TP and FP of the
+successive sets of edges are the cumulative sums of the segments, and the
+greedy algorithm stops at the first set which does not improve the FM score.
+"""
+def find_best_edge_set_numpy(edges, segments, TP, FP, W_nb, p_w=1, r_w=1):
+    if len(edges) == 0:
+        return set(), 0, 0, 0, 0
+
+    segments = np.array(segments)
+    TP = np.array(TP, dtype=float)
+    FP = np.array(FP, dtype=float)
+    n = len(edges)
+
+    # Sort the edges of every node based on the Fowlkes Mallows metric
+    fm = fowlkes_mallows_numpy(TP, FP, W_nb-TP, p_w, r_w)
+    order = np.lexsort((-fm, segments))
+    segments = segments[order]
+    starts = np.flatnonzero(np.concatenate(([True], segments[1:] != segments[:-1])))
+    ends = np.concatenate((starts[1:], [n]))
+
+    # TP and FP of the first k edges of every node (the counters are integers, the sums are exact)
+    cum_TP = np.cumsum(TP[order])
+    cum_FP = np.cumsum(FP[order])
+    offset_TP = np.repeat(np.concatenate(([0.], cum_TP[starts[1:]-1])), ends-starts)
+    offset_FP = np.repeat(np.concatenate(([0.], cum_FP[starts[1:]-1])), ends-starts)
+    set_TP = cum_TP-offset_TP
+    set_FP = cum_FP-offset_FP
+    set_fm = fowlkes_mallows_numpy(set_TP, set_FP, W_nb-set_TP, p_w, r_w)
+
+    # Greedy algorithm: stop at the first edge which does not improve the FM score
+    previous_fm = np.concatenate(([0.], set_fm[:-1]))
+    previous_fm[starts] = 0.
+    stop = np.where(set_fm > previous_fm, n, np.arange(n))
+    set_ends = np.minimum(np.minimum.reduceat(stop, starts), ends)
+    fm_score = np.where(set_ends > starts, set_fm[set_ends-1], 0.)
+
+    # Keep the node(s) with the highest FM score
+    best_fm_score = fm_score.max()
+    best_nodes = np.flatnonzero(fm_score == best_fm_score)
+
+    best_edge_set = set()
+    for i in best_nodes:
+        for k in range(starts[i], set_ends[i]):
+            best_edge_set.add(edges[order[k]])
+
+    if len(best_nodes) == 1 and best_fm_score > 0:
+        best_TP = float(set_TP[set_ends[best_nodes[0]]-1])
+        best_FP = float(set_FP[set_ends[best_nodes[0]]-1])
+        return best_edge_set, float(best_fm_score), best_TP, best_FP, W_nb-best_TP
+    else:
+        return best_edge_set, float(best_fm_score), -1, -1, -1
+
+"""
+Returns the candidate edges of find_best_fmscore_forward, with their node (segment),
+TP and FP, as needed by find_best_edge_set_numpy.
+"""
+def forward_edge_arrays(G, G_W):
+    edges = []
+    segments = []
+    TP = []
+    FP = []
+
+    for i, from_node in enumerate(G_W.nodes_forward):
+        for to_node in G_W[from_node].keys():
+            TP_edge = G_W[from_node][to_node]['prefix_counter']
+            if TP_edge > 0:
+                edges.append((from_node, to_node))
+                segments.append(i)
+                TP.append(TP_edge)
+                FP.append(G[from_node][to_node]['prefix_counter'] if G.has_edge(from_node, to_node) else 0)
+
+    return edges, segments, TP, FP
+
+"""
+Same as forward_edge_arrays, for find_best_fmscore_backward.
+"""
+def backward_edge_arrays(G, G_W):
+    edges = []
+    segments = []
+    TP = []
+    FP = []
+
+    for i, to_node in enumerate(G_W.nodes_backward):
+        for from_node in G_W.predecessors(to_node):
+            edges.append((from_node, to_node))
+            segments.append(i)
+            TP.append(G_W[from_node][to_node]['prefix_counter'])
+            FP.append(G[from_node][to_node]['prefix_counter'] if G.has_edge(from_node, to_node) else 0)
+
+    return edges, segments, TP, FP
+
+"""
+Same as find_best_fmscore_forward (with opti=True), with numpy.
+"""
+def find_best_fmscore_forward_numpy(G, G_W, W_nb, p_w=1, r_w=1):
+    edges, segments, TP, FP = forward_edge_arrays(G, G_W)
+    return find_best_edge_set_numpy(edges, segments, TP, FP, W_nb, p_w, r_w)
+
+"""
+Same as find_best_fmscore_backward (with opti=True), with numpy.
+"""
+def find_best_fmscore_backward_numpy(G, G_W, W_nb, p_w=1, r_w=1):
+    edges, segments, TP, FP = backward_edge_arrays(G, G_W)
+    return find_best_edge_set_numpy(edges, segments, TP, FP, W_nb, p_w, r_w)
+
+"""
+Combines the results of the forward and backward modes of BPA (bpa-multiple):
+returns the one with the highest FM score, or the union of both if they have the same.
+"""
+def best_of_forward_backward(forward, backward):
+    best_edge_set_forward, best_fm_score_forward, best_TP_forward, best_FP_forward, best_FN_forward = forward
+    best_edge_set_backward, best_fm_score_backward, best_TP_backward, best_FP_backward, best_FN_backward = backward
+
+    if best_fm_score_forward > best_fm_score_backward:
+        return best_edge_set_forward, best_fm_score_forward, best_TP_forward, best_FP_forward, best_FN_forward
+    elif best_fm_score_backward > best_fm_score_forward:
+        return best_edge_set_backward, best_fm_score_backward, best_TP_backward, best_FP_backward, best_FN_backward
+    else: # backward and forward mode returns the same fm score
+        return best_edge_set_forward.union(best_edge_set_backward), best_fm_score_forward, -1, -1, -1
+
+"""
+Score used to sort the edges and the sets of edges in IncrementalBPA: the
+Fowlkes Mallows score in log space, without the term which only depends on the
+number of withdrawals W_nb (the same for every set of edges):
+(w_p+w_r)*log(fowlkes_mallows(TP, FP, W_nb-TP, w_p, w_r)) + w_r*log(W_nb)
+The greedy algorithm thus makes the same choices whatever W_nb is.
+"""
+def fowlkes_mallows_key(TP, FP, w_p=1., w_r=1.):
+    return w_p*math.log(TP/(TP+FP)) + w_r*math.log(TP)
+
+"""
+The greedy algorithm of find_best_fmscore_forward and find_best_fmscore_backward
+on the edges of one node. ngh is a list of (edge, TP, FP).
+Returns the set of edges, its TP, its FP and its score (fowlkes_mallows_key).
+"""
+def find_greedy_edge_set(ngh, p_w=1, r_w=1):
+    ngh_sorted = sorted(ngh, key=lambda x : fowlkes_mallows_key(x[1], x[2], p_w, r_w), reverse=True)
+
+    current_set = set()
+    current_TP = 0
+    current_FP = 0
+    current_key = None
+
+    for edge, TP, FP in ngh_sorted:
+        new_key = fowlkes_mallows_key(current_TP+TP, current_FP+FP, p_w, r_w)
+        if current_key is None or new_key > current_key:
+            current_set.add(edge)
+            current_TP += TP
+            current_FP += FP
+            current_key = new_key
+        else:
+            break # Greedy algorithm
+
+    return current_set, current_TP, current_FP, current_key
+
+"""
+Returns the candidate edges of a node in the forward mode (its outgoing edges
+in G_W) as a list of (edge, TP, FP), for find_greedy_edge_set.
+"""
+def forward_candidates(G, G_W, from_node):
+    ngh = []
+    for to_node in G_W[from_node].keys():
+        TP = G_W[from_node][to_node]['prefix_counter']
+        FP = G[from_node][to_node]['prefix_counter'] if G.has_edge(from_node, to_node) else 0
+        if TP > 0:
+            ngh.append(((from_node, to_node), TP, FP))
+    return ngh
+
+"""
+Same as forward_candidates, in the backward mode (incoming edges in G_W).
+"""
+def backward_candidates(G, G_W, to_node):
+    ngh = []
+    for from_node in G_W.predecessors(to_node):
+        TP = G_W[from_node][to_node]['prefix_counter']
+        FP = G[from_node][to_node]['prefix_counter'] if G.has_edge(from_node, to_node) else 0
+        ngh.append(((from_node, to_node), TP, FP))
+    return ngh
+
+"""
+BPA (bpa-multiple) computed incrementally during a burst. The greedy set of
+edges of every node (forward and backward) does not depend on the number of
+withdrawals (see fowlkes_mallows_key), so it is kept between two predictions
+and only recomputed for the nodes whose edges have changed since the last one.
+The topologies record the AS paths they add or remove while the engine is
+attached to them (touched attribute), and the nodes of those paths are the
+dirty nodes. The best nodes are kept in a heap (with lazy deletion).
+The result is the same as find_best_fmscore_forward and find_best_fmscore_backward.
+"""
+class IncrementalBPA:
+
+    def __init__(self, G, G_W, p_w=1, r_w=1):
+        self.G = G
+        self.G_W = G_W
+        self.p_w = p_w
+        self.r_w = r_w
+
+        # AS paths added or removed in G and G_W since the last prediction
+        self.touched = []
+        G.touched = self.touched
+        G_W.touched = self.touched
+        self.initialized = False
+
+        # node -> (key, TP, FP, edge set), and heap of (-key, node, version)
+        self.forward = {}
+        self.backward = {}
+        self.heap_forward = []
+        self.heap_backward = []
+        self.versions = {}
+
+    """
+    Stop recording the changes in the topologies.
+    """
+    def detach(self):
+        self.G.touched = None
+        self.G_W.touched = None
+
+    def update_node(self, node, cache, heap, ngh):
+        version = self.versions.get(node, 0) + 1
+        self.versions[node] = version
+
+        if len(ngh) > 0:
+            edge_set, TP, FP, key = find_greedy_edge_set(ngh, self.p_w, self.r_w)
+            cache[node] = (key, TP, FP, edge_set)
+            heapq.heappush(heap, (-key, node, version))
+        elif node in cache:
+            del cache[node]
+
+        # Remove the outdated entries if there are too many of them
+        if len(heap) > 2*len(cache)+64:
+            del heap[:]
+            for n, entry in cache.iteritems():
+                heap.append((-entry[0], n, self.versions[n]))
+            heapq.heapify(heap)
+
+    def update_forward(self, from_node):
+        ngh = forward_candidates(self.G, self.G_W, from_node) if from_node in self.G_W.nodes_forward else []
+        self.update_node(('F', from_node), self.forward, self.heap_forward, ngh)
+
+    def update_backward(self, to_node):
+        ngh = backward_candidates(self.G, self.G_W, to_node) if to_node in self.G_W.nodes_backward else []
+        self.update_node(('B', to_node), self.backward, self.heap_backward, ngh)
+
+    """
+    Recompute the greedy sets of the dirty nodes.
+    """
+    def update(self):
+        if not self.initialized:
+            forward_dirty = set(self.G_W.nodes_forward)
+            backward_dirty = set(self.G_W.nodes_backward)
+            self.initialized = True
+        else:
+            forward_dirty = set()
+            backward_dirty = set()
+        for as_path in self.touched:
+            for i in range(0, len(as_path)-1):
+                forward_dirty.add(as_path[i])
+                backward_dirty.add(as_path[i+1])
+        del self.touched[:]
+
+        for node in forward_dirty:
+            self.update_forward(node)
+        for node in backward_dirty:
+            self.update_backward(node)
+
+    """
+    Returns the nodes with the highest score in a heap.
+    """
+    def best_nodes(self, cache, heap):
+        versions = self.versions
+
+        while len(heap) > 0 and versions[heap[0][1]] != heap[0][2]:
+            heapq.heappop(heap)
+        if len(heap) == 0:
+            return []
+
+        best = []
+        top = heap[0][0]
+        while len(heap) > 0 and heap[0][0] == top:
+            entry = heapq.heappop(heap)
+            if versions[entry[1]] == entry[2]:
+                best.append(entry)
+        for entry in best:
+            heapq.heappush(heap, entry)
+
+        return [entry[1] for entry in best]
+
+    """
+    Returns the best set of edges among the nodes in cache, as find_best_fmscore_forward
+    (or backward) does.
+    """
+    def best_edge_set(self, cache, heap, W_nb):
+        nodes = self.best_nodes(cache, heap)
+
+        if len(nodes) == 0:
+            return set(), 0, 0, 0, 0
+
+        key, TP, FP, edge_set = cache[nodes[0]]
+        fm_score = fowlkes_mallows(TP, FP, W_nb-TP, self.p_w, self.r_w)
+        if len(nodes) == 1:
+            return edge_set, fm_score, TP, FP, W_nb-TP
+
+        best_edge_set = set()
+        for node in nodes:
+            best_edge_set = best_edge_set.union(cache[node][3])
+        return best_edge_set, fm_score, -1, -1, -1
+
+    """
+    Returns the set of edges with the highest Fowlkes-Mallows score, as the
+    bpa-multiple algorithm does (see burst_prediction in peer.py).
+    """
+    def find_best_fmscore(self, W_nb):
+        self.update()
+
+        return best_of_forward_backward(self.best_edge_set(self.forward, self.heap_forward, W_nb), \
+        self.best_edge_set(self.backward, self.heap_backward, W_nb))
+
+
+"""
+BPA (bpa-multiple) with a time budget. The nodes (forward and backward) are
+evaluated in the decreasing order of an upper bound of their FM score: the FM
+score of all the prefixes withdrawn through the node (out_prefixes or
+in_prefixes in G_W), without false positive. The search ends when the bound of
+the next node is lower than the best FM score found, with the same result as
+bpa-multiple, or when the budget is exhausted. In that case, run can be called
+again later on to continue the search where it stopped (at least one node is
+evaluated at every call). The candidate edges of every node are copied when the
+search starts (as the edge arrays of AsyncBPA), so that the search continues on
+the topologies of W_nb withdrawals while the burst grows.
+"""
+class AnytimeBPA:
+
+    def __init__(self, G, G_W, W_nb, p_w=1, r_w=1):
+        self.W_nb = W_nb
+        self.p_w = p_w
+        self.r_w = r_w
+
+        # (mode, node) -> candidate edges of the node, as forward_candidates and backward_candidates
+        self.ngh = {}
+
+        self.candidates = []
+        for node in G_W.nodes_forward:
+            self.ngh[('F', node)] = forward_candidates(G, G_W, node)
+            self.candidates.append((-self.bound(G_W.get_out_prefixes(node)), 'F', node))
+        for node in G_W.nodes_backward:
+            self.ngh[('B', node)] = backward_candidates(G, G_W, node)
+            self.candidates.append((-self.bound(G_W.get_in_prefixes(node)), 'B', node))
+        self.candidates.sort()
+        self.position = 0
+
+        # Best FM score found, and the (edge set, TP, FP) of every node with this score
+        self.best_fm_score = 0
+        self.best_sets = []
+
+    def bound(self, TP):
+        return fowlkes_mallows(float(TP), 0., self.W_nb-TP, self.p_w, self.r_w)
+
+    """
+    True if all the nodes which can have the best FM score have been evaluated.
+    """
+    def done(self):
+        return self.position >= len(self.candidates)
+
+    """
+    Evaluates the nodes until the end of the search or until the budget (in
+    seconds) is exhausted (no limit if budget is None). Returns the best set of
+    edges found so far, as burst_prediction.
+    """
+    def run(self, budget=None):
+        deadline = time.time()+budget if budget is not None else None
+        nb_evaluated = 0
+
+        while self.position < len(self.candidates):
+            bound, mode, node = self.candidates[self.position]
+            if -bound < self.best_fm_score:
+                self.position = len(self.candidates)
+                self.ngh = {}
+                break
+            if deadline is not None and nb_evaluated > 0 and time.time() > deadline:
+                break
+
+            self.evaluate(mode, node)
+            self.position += 1
+            nb_evaluated += 1
+
+        return self.result()
+
+    def evaluate(self, mode, node):
+        ngh = self.ngh.pop((mode, node))
+        if len(ngh) == 0:
+            return
+
+        edge_set, TP, FP, key = find_greedy_edge_set(ngh, self.p_w, self.r_w)
+        fm_score = fowlkes_mallows(TP, FP, self.W_nb-TP, self.p_w, self.r_w)
+
+        if fm_score > self.best_fm_score:
+            self.best_fm_score = fm_score
+            self.best_sets = [(edge_set, TP, FP)]
+        elif fm_score == self.best_fm_score:
+            self.best_sets.append((edge_set, TP, FP))
+
+    def result(self):
+        if len(self.best_sets) == 1:
+            edge_set, TP, FP = self.best_sets[0]
+            return edge_set, self.best_fm_score, int(TP), int(FP), int(self.W_nb-TP)
+
+        best_edge_set = set()
+        for edge_set, TP, FP in self.best_sets:
+            best_edge_set = best_edge_set.union(edge_set)
+        return best_edge_set, self.best_fm_score, -1, -1, -1
+
+"""
+Main function of the processes of AsyncBPA: computes the best set of edges of
+the snapshots received (edge arrays of one mode, forward or backward), with
+find_best_edge_set_numpy. Only the most recent snapshot waiting is computed.
+"""
+def run_bpa_worker(jobs, results):
+    # The handlers of the peer (or of the pool worker) are inherited, but the
+    # worker must not stop its copy of the peers when it is terminated
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    while True:
+        job = jobs.get()
+        while job is not None:
+            try:
+                job = jobs.get_nowait()
+            except Queue.Empty:
+                break
+        if job is None:
+            break
+
+        tag, mode, W_nb, edges, segments, TP, FP, p_w, r_w = job
+        results.put((tag, mode, find_best_edge_set_numpy(edges, segments, TP, FP, W_nb, p_w, r_w)))
+
+"""
+BPA (bpa-multiple) executed by two worker processes, one for the forward mode
+and one for the backward mode, while the peer keeps processing the BGP messages.
+submit sends them a snapshot of the counters of the candidate edges. The
+results are tagged with the generation (incremented by reset, at the end of
+every burst) and the burst size of their snapshot, and poll only returns the
+most recent result for which both modes are done. The older results are dropped.
+"""
+class AsyncBPA:
+
+    def __init__(self, p_w=1, r_w=1):
+        self.p_w = p_w
+        self.r_w = r_w
+        self.generation = 0
+        self.last_tag = None     # Tag of the last snapshot sent
+        self.result_tag = None   # Tag of the last result returned by poll
+        self.pending = {}        # tag -> mode -> result
+
+        self.results = multiprocessing.Queue()
+        self.jobs = {}
+        self.workers = {}
+        for mode in ['forward', 'backward']:
+            self.jobs[mode] = multiprocessing.Queue()
+            self.workers[mode] = multiprocessing.Process(target=run_bpa_worker, args=(self.jobs[mode], self.results))
+            self.workers[mode].start()
+
+    def submit(self, burst_size, G, G_W, W_nb):
+        tag = (self.generation, burst_size)
+        self.last_tag = tag
+        for mode, edge_arrays in (('forward', forward_edge_arrays), ('backward', backward_edge_arrays)):
+            edges, segments, TP, FP = edge_arrays(G, G_W)
+            self.jobs[mode].put((tag, mode, W_nb, edges, segments, TP, FP, self.p_w, self.r_w))
+
+    """
+    Returns the tag and the result (as burst_prediction) of the most recent
+    snapshot computed, if it is more recent than the previous one returned.
+    Returns None otherwise. Does not block.
+    """
+    def poll(self):
+        best = None
+
+        # Nothing to wait for once the result of the last snapshot sent is known
+        while self.waiting():
+            try:
+                tag, mode, res = self.results.get_nowait()
+            except Queue.Empty:
+                break
+
+            if tag[0] != self.generation or (self.result_tag is not None and tag <= self.result_tag):
+                continue
+            self.pending.setdefault(tag, {})[mode] = res
+
+            if len(self.pending[tag]) == 2:
+                best_edge_set, best_fm_score, best_TP, best_FP, best_FN = best_of_forward_backward(self.pending[tag]['forward'], self.pending[tag]['backward'])
+                best = (tag, (best_edge_set, best_fm_score, int(best_TP), int(best_FP), int(best_FN)))
+                self.result_tag = tag
+                for t in self.pending.keys():
+                    if t <= tag:
+                        del self.pending[t]
+
+        return best
+
+    """
+    Returns True if the result of the last snapshot sent is not known yet.
+    """
+    def waiting(self):
+        return self.last_tag is not None and self.result_tag != self.last_tag
+
+    """
+    Drops the results not returned yet (at the end of a burst).
+    """
+    def reset(self):
+        self.generation += 1
+        self.last_tag = None
+        self.result_tag = None
+        self.pending = {}
+
+    def stop(self):
+        for mode in self.workers:
+            self.jobs[mode].put(None)
+        for mode in self.workers:
+            self.workers[mode].join()
+
+
 if __name__ == '__main__':
     import networkx as nx
     from random import randint
@@ -1,9 +1,12 @@
+from bgp_messages import prefix_to_text
+
 
 class Burst:
 
-    def __init__(self, peer_id, start_time, duration, outdir, encoding, W_queue, silent=False):
+    def __init__(self, peer_id, start_time, duration, outdir, encoding, W_queue, silent=False, resolution=1):
         self.peer_id = peer_id
-        self.start_time = int(start_time)
+        self.resolution = resolution
+        self.start_time = int(start_time) if resolution >= 1 else start_time
         self.duration = duration
         self.outdir = outdir
         self.silent = silent
@@ -12,6 +15,8 @@ class Burst:
 
         # Variable to keep the number of withdrawals removed from the queue during the burst
         self.deleted_from_W_queue = []
+        # and the buckets of the window they were in (see BGPMessagesWindow)
+        self.deleted_buckets = []
 
         # Set with the predicted prefixes
         self.predicted_prefixes = set()
@@ -30,15 +35,15 @@ class Burst:
         self.ts_100th_w = W_queue[100].time if len(W_queue) > 100 else W_queue[0].time
 
         # Open the file for the real prefixes of this burst
-        self.fd_real = open(outdir+'/'+str(self.peer_id)+'_'+str(self.start_time)+'_real', 'w', 1)
-        self.fd_predicted = open(outdir+'/'+str(self.peer_id)+'_'+str(self.start_time)+'_predicted', 'w', 1)
-        self.fd_predicted.write('# Started burst!\n#100thTS\t'+str(self.ts_100th_w)+'\n')
-        self.fd_real.write('# Started burst!\n#100thTS\t'+str(self.ts_100th_w)+'\n')
+        self.fd_real = open(outdir+'/'+str(self.peer_id)+'_'+self.time_text(self.start_time, True)+'_real', 'w', 1)
+        self.fd_predicted = open(outdir+'/'+str(self.peer_id)+'_'+self.time_text(self.start_time, True)+'_predicted', 'w', 1)
+        self.fd_predicted.write('# Started burst!\n#100thTS\t'+self.time_text(self.ts_100th_w)+'\n')
+        self.fd_real.write('# Started burst!\n#100thTS\t'+self.time_text(self.ts_100th_w)+'\n')
 
         # Write the prefixes currently in the queue in the real set of prefixes
         # (but  not added in real set of prefixes)
         for p in W_queue:
-            self.fd_real.write(p.prefix+'|'+str(p.time)+'|B|'+str(' '.join(map(lambda x:str(x), p.as_path)))+'\n')
+            self.fd_real.write(prefix_to_text(p.prefix)+'|'+self.time_text(p.time)+'|B|'+str(' '.join(map(lambda x:str(x), p.as_path)))+'\n')
 
     """
     Stop the burst when it expires. This essentially means close the file descriptors.
@@ -48,7 +53,18 @@ class Burst:
         self.fd_predicted.close()
 
         with open(self.info_file, 'a') as fd:
-            fd.write(self.peer_id+'\t'+str(self.start_time)+'\t'+str(self.last_ts)+'\t'+str(self.duration)+'\t'+str(len(self.real_prefixes))+'\t'+str(self.ts_100th_w)+'\n')
+            fd.write(self.peer_id+'\t'+self.time_text(self.start_time, True)+'\t'+self.time_text(self.last_ts)+'\t'+str(self.duration)+'\t'+str(len(self.real_prefixes))+'\t'+self.time_text(self.ts_100th_w)+'\n')
+
+    """
+    Text of a timestamp in the files of the burst. With a resolution of one second,
+    the timestamps are written as before: truncated to the second if truncate is
+    True, or as floats otherwise. With a finer resolution, they are all written in
+    milliseconds (three decimals), because str only keeps 12 significant digits.
+    """
+    def time_text(self, ts, truncate=False):
+        if self.resolution >= 1:
+            return str(int(ts)) if truncate else str(ts)
+        return '%.3f' % ts
 
     """
     Check if the burst is expired
@@ -67,10 +83,10 @@ class Burst:
 
             if mtype == 'W':
                 if prefix not in self.real_prefixes:
-                    self.fd_real.write(prefix+'|'+str(int(time))+'|W|'+str(tag)+'|'+str(' '.join(map(lambda x:str(x), old_as_path)))+'\n')
+                    self.fd_real.write(prefix_to_text(prefix)+'|'+self.time_text(time, True)+'|W|'+str(tag)+'|'+str(' '.join(map(lambda x:str(x), old_as_path)))+'\n')
 
             elif mtype == 'A':
-                self.fd_real.write(prefix+'|'+str(int(time))+'|A|'+str(tag)+'|'+str(' '.join(map(lambda x:str(x), old_as_path)))+'\n')
+                self.fd_real.write(prefix_to_text(prefix)+'|'+self.time_text(time, True)+'|A|'+str(tag)+'|'+str(' '.join(map(lambda x:str(x), old_as_path)))+'\n')
 
         # Add the prefix in real set of withdrawn prefixes
         if mtype == 'W':
@@ -84,16 +100,16 @@ class Burst:
             if prefix not in self.predicted_prefixes:
                 if encoded:
                     self.predicted_prefixes.add(prefix)
-                    self.fd_predicted.write('PREFIX|'+prefix+'|'+str(int(time))+'|'+str(len(self))+'|'+'Y|'+str(depth)+'\n')
+                    self.fd_predicted.write('PREFIX|'+prefix_to_text(prefix)+'|'+self.time_text(time, True)+'|'+str(len(self))+'|'+'Y|'+str(depth)+'\n')
 
                 else:
-                    self.fd_predicted.write('PREFIX|'+prefix+'|'+str(int(time))+'|'+str(len(self))+'|'+'N|'+str(depth)+'\n')
+                    self.fd_predicted.write('PREFIX|'+prefix_to_text(prefix)+'|'+self.time_text(time, True)+'|'+str(len(self))+'|'+'N|'+str(depth)+'\n')
 
     """
     Add a predicted prefix in the predicted set of prefix of this burst.
     """
     def add_predicted_prefix2(self, time, prefix, encoded, depth):
-        self.fd_predicted.write('PREFIX|'+prefix+'|'+str(int(time))+'|'+str(len(self))+'|'+'?|'+str(depth)+'\n')
+        self.fd_predicted.write('PREFIX|'+prefix_to_text(prefix)+'|'+self.time_text(time, True)+'|'+str(len(self))+'|'+'?|'+str(depth)+'\n')
 
     """
     Add a set of edges to the set of edges of the burst.
@@ -108,7 +124,7 @@ class Burst:
 
                 self.as_edges.add(edge)
                 if not self.silent:
-                    self.fd_predicted.write('EDGE|'+str(edge[0])+','+str(edge[1])+'|'+str(int(time))+'|'+str(len(self))+'|'+str(depth)+'\n')
+                    self.fd_predicted.write('EDGE|'+str(edge[0])+','+str(edge[1])+'|'+self.time_text(time, True)+'|'+str(len(self))+'|'+str(depth)+'\n')
                 yield edge
 
     """
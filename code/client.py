@@ -1,14 +1,23 @@
 import socket
 import argparse
 
+from bgp_messages import parse
+from feed_protocol import FeedEncoder
+
 parser = argparse.ArgumentParser("This script connects to a server and sends bgp messages read from a file.")
 parser.add_argument("dst_ip", type=str, help="Server IP")
 parser.add_argument("port", type=int, help="Port")
 parser.add_argument("infile", type=str, help="Infile")
+parser.add_argument("--binary", action='store_true', default=False, help="Send the messages with the binary feed protocol instead of text lines.")
+parser.add_argument("--keep_time", action='store_true', default=False, help="Keep the timestamps of the messages instead of setting them all to 10000.")
 args = parser.parse_args()
 dst = args.dst_ip
 port = args.port
 infile = args.infile
+binary = args.binary
+keep_time = args.keep_time
+
+encoder = FeedEncoder()
 
 socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 socket.connect((dst, port))
@@ -18,10 +27,16 @@ with open(infile, 'r') as fd:
     for line in fd.readlines():
         if line[0] != '#':
             #print line
-            linetab = line.split('|')
-            linetab[2] = '10000'
-            line = '|'.join(linetab)
+            if not keep_time:
+                linetab = line.split('|')
+                linetab[2] = '10000'
+                line = '|'.join(linetab)
 
-            socket.send(line)
+            if binary:
+                bgp_msg = parse(line)
+                if bgp_msg is not None and bgp_msg.mtype != 'INFO':
+                    socket.sendall(encoder.encode_message(bgp_msg))
+            else:
+                socket.send(line)
 
 socket.close()
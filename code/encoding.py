@@ -1,20 +1,106 @@
-import os, shutil
+import os, sys, shutil
+import signal
+import Queue
+import multiprocessing
 from blist import sortedlist
-from blist import sortedset
+from array import array
 import timeit
 import numpy as np
 
+# Words of the free values: unsigned longs (64 bits, or 32 bits on some platforms)
+WORD_BITS = array('L').itemsize*8
+WORD_SHIFT = WORD_BITS.bit_length()-1
+WORD_LOW = WORD_BITS-1
+WORD_MASK = (1 << WORD_BITS)-1
+
+"""
+Free values of a Mapping: one bit per value (set if the value is free) in words
+of WORD_BITS bits, and the number of free values. The first free value is found by
+looking for the first non-zero word from first_word, the lowest word that may
+have a free value.
+"""
+class FreeValues(object):
+
+    def __init__(self):
+        self.words = array('L')
+        self.count = 0
+        self.first_word = 0
+
+    def __len__(self):
+        return self.count
+
+    """
+    Make a value free.
+    """
+    def add(self, value):
+        word = value >> WORD_SHIFT
+        bit = 1 << (value & WORD_LOW)
+        if not self.words[word] & bit:
+            self.words[word] |= bit
+            self.count += 1
+            if word < self.first_word:
+                self.first_word = word
+
+    """
+    Make free the values from start to stop (excluded), which are above all the
+    values known so far. Whole words are filled at once.
+    """
+    def add_range(self, start, stop):
+        nb_words = (stop+WORD_LOW) >> WORD_SHIFT
+        if nb_words > len(self.words):
+            self.words.extend(array('L', [0]) * (nb_words-len(self.words)))
+
+        if start & WORD_LOW == 0 and stop & WORD_LOW == 0:
+            self.words[start >> WORD_SHIFT:stop >> WORD_SHIFT] = array('L', [WORD_MASK]) * ((stop-start) >> WORD_SHIFT)
+            self.count += stop-start
+            if start >> WORD_SHIFT < self.first_word:
+                self.first_word = start >> WORD_SHIFT
+        else:
+            for value in range(start, stop):
+                self.add(value)
+
+    """
+    Remove the lowest free value and returns it (there must be one).
+    """
+    def pop_first(self):
+        words = self.words
+        i = self.first_word
+        while words[i] == 0:
+            i += 1
+        self.first_word = i
+
+        word = words[i]
+        lowest_bit = word & -word
+        words[i] = word ^ lowest_bit
+        self.count -= 1
+        return (i << WORD_SHIFT) | (lowest_bit.bit_length()-1)
+
+    """
+    Yields the free values in increasing order.
+    """
+    def __iter__(self):
+        for i in range(self.first_word, len(self.words)):
+            word = self.words[i]
+            while word:
+                lowest_bit = word & -word
+                yield (i << WORD_SHIFT) | (lowest_bit.bit_length()-1)
+                word ^= lowest_bit
+
+
 class Mapping:
 
     def __init__(self):
         self.nb_bytes = 0
 
         # Initialize the set of free values (Initaly all the values are free)
-        self.free = sortedset()
+        self.free = FreeValues()
 
-        # A dictionnary used to store the mapping AS to integer. An other value
-        # is also used to indicate how many times each AS appear on this mapping.
+        # A dictionnary used to store the mapping AS to integer. Two arrays
+        # indexed by the integers are also used to indicate how many times each
+        # AS appear on this mapping, as the from AS and as the to AS of a link.
         self.mapping = {}
+        self.from_count = array('l')
+        self.to_count = array('l')
 
         self.blocked = False
         self.max_free = 500
@@ -48,12 +134,14 @@ class Mapping:
                         self.add_byte()
                         res += 1
 
+            value = self.free.pop_first()
+            self.mapping[asn] = value
             if from_as:
-                self.mapping[asn] = [self.free[0], 1, 0]
+                self.from_count[value] = 1
+                self.to_count[value] = 0
             else:
-                self.mapping[asn] = [self.free[0], 0, 1]
-
-            self.free.pop(0)
+                self.from_count[value] = 0
+                self.to_count[value] = 1
 
             return res, True
 
@@ -61,9 +149,9 @@ class Mapping:
 
         else:
             if from_as:
-                self.mapping[asn][1] += 1
+                self.from_count[self.mapping[asn]] += 1
             else:
-                self.mapping[asn][2] += 1
+                self.to_count[self.mapping[asn]] += 1
 
         return 0, False
 
@@ -99,14 +187,17 @@ class Mapping:
 
 
     def add_byte(self):
-        if self.nb_bytes == 0:
-            #self.free.add(0)
+        self.nb_bytes += 1
+        self.from_count.extend(array('l', [0]) * (pow(2, self.nb_bytes)-len(self.from_count)))
+        self.to_count.extend(array('l', [0]) * (pow(2, self.nb_bytes)-len(self.to_count)))
+
+        if self.nb_bytes == 1:
             # Set the mapping for 0, which is used to match an AS link that is not encoded
-            self.mapping[-1] = [0, -1, -1]
+            self.mapping[-1] = 0
+            self.from_count[0] = -1
+            self.to_count[0] = -1
 
-        self.nb_bytes += 1
-        for i in range(pow(2, self.nb_bytes-1), pow(2, self.nb_bytes)):
-            self.free.add(i)
+        self.free.add_range(pow(2, self.nb_bytes-1), pow(2, self.nb_bytes))
 
     ###
     # @brief    This function   removes the AS number from the mapping.
@@ -115,25 +206,25 @@ class Mapping:
     ###
     def remove(self, asn, from_as=True):
         if asn in self.mapping:
+            value = self.mapping[asn]
             if from_as:
-                self.mapping[asn][1] -= 1
+                self.from_count[value] -= 1
             else:
-                self.mapping[asn][2] -= 1
+                self.to_count[value] -= 1
 
-            if self.mapping[asn][1] < 0 or self.mapping[asn][2] < 0:
+            if self.from_count[value] < 0 or self.to_count[value] < 0:
                 sys.exit(0)
 
-            if self.mapping[asn][1] == 0 and self.mapping[asn][2] == 0:
-                tmp = self.mapping[asn]
+            if self.from_count[value] == 0 and self.to_count[value] == 0:
                 del self.mapping[asn]
-                self.free.add(tmp[0])
+                self.free.add(value)
 
                 return True
         return False
 
     def get_mapping_string(self, asn):
         if asn in self.mapping:
-            res = bin(self.mapping[asn][0])[2:]
+            res = bin(self.mapping[asn])[2:]
             return res.zfill(self.nb_bytes)
         else:
             return '0' * self.nb_bytes
@@ -145,7 +236,7 @@ class Mapping:
         tmp += ' '
         tmp += 'Mapping '
         for k, v in self.mapping.items():
-            tmp += str(k)+'>'+str(v)+','
+            tmp += str(k)+'>'+str([v, self.from_count[v], self.to_count[v]])+','
 
         return tmp
 
@@ -161,6 +252,7 @@ class Encoding():
         self.g = topo
         self.min_percentile = min_percentile
         self.encoded_aslinks = {}   # AS links encoded for each depth
+        self.changed = None # List of the (depth, AS) whose value changed, or (depth, None) when a mapping gets one more bit, when set (see VMACCache)
 
         # Use to compute the weighted sum for each as link
         self.total_traffic = {}
@@ -201,11 +293,116 @@ class Encoding():
     """
     This function computes a static encoding. It optimizes the number of bits
     available to store the most important edges. Used to initialize the encoding.
+    The AS links of all the depths are sorted at once (with numpy), in the order
+    compute_encoding_sortedlist considers them: most prefixes first, then the
+    lowest depth, then the highest from AS and to AS.
     """
     def compute_encoding(self):
 
         start = timeit.default_timer()
 
+        nb_prefixes, depths, from_nodes, to_nodes = self.compute_candidates()
+        order = np.lexsort((-np.array(to_nodes, dtype=np.int64), -np.array(from_nodes, dtype=np.int64), \
+        np.array(depths, dtype=np.int64), -np.array(nb_prefixes, dtype=np.float64)))
+
+        minimum_tmp = {}
+        self.encoded_aslinks = {}
+        for depth in set(depths):
+            self.encoded_aslinks[depth] = set()
+            minimum_tmp[depth] = []
+
+        self.mapping = {}
+        total_bytes = 0
+
+        for i in order.tolist():
+            nb, depth, from_as, to_as = nb_prefixes[i], depths[i], from_nodes[i], to_nodes[i]
+
+            # Update the mapping accordingly
+            if depth not in self.mapping:
+                self.mapping[depth] = Mapping()
+            if depth+1 not in self.mapping:
+                self.mapping[depth+1] = Mapping()
+            mapping_from = self.mapping[depth]
+            mapping_to = self.mapping[depth+1]
+
+            # Both ASes are already in the mappings: no byte needed, only the counters change
+            if from_as in mapping_from.mapping and to_as in mapping_to.mapping:
+                if total_bytes <= self.max_bytes-2:
+                    mapping_from.from_count[mapping_from.mapping[from_as]] += 1
+                    mapping_to.to_count[mapping_to.mapping[to_as]] += 1
+                    self.encoded_aslinks[depth].add((from_as, to_as))
+                    if total_bytes >= self.max_bytes-2:
+                        mapping_from.blocked = True
+                        mapping_to.blocked = True
+                    minimum_tmp[depth].append(nb)
+                continue
+
+            bytes_to_add = mapping_from.is_available(from_as, overprovisioning=True, offset=0)
+            bytes_to_add += mapping_to.is_available(to_as, overprovisioning=True, offset=0)
+
+            # If we cannot add this AS link in the encodage, we go to the next one
+            if total_bytes + bytes_to_add <= self.max_bytes-2:
+                tmp1 = mapping_from.add(from_as, True)[0]
+                if tmp1 >= 1:
+                    total_bytes += tmp1
+                tmp2 = mapping_to.add(to_as, False)[0]
+                if tmp2 >= 1:
+                    total_bytes += tmp2
+
+                self.encoded_aslinks[depth].add((from_as, to_as))
+
+                if total_bytes >= self.max_bytes-2:
+                    mapping_from.blocked = True
+                    mapping_to.blocked = True
+
+                # Refresh the minimum weight*traffic for this peer and this depth
+                minimum_tmp[depth].append(nb)
+
+        # All the AS links have been considered, use the bytes left
+        while total_bytes < self.max_bytes-2:
+            to_increase = None
+            for d, dmap in self.mapping.items():
+                if to_increase is None or len(to_increase.free) > len(dmap.free):
+                   to_increase = dmap
+
+            if to_increase is None:
+                break
+            else:
+                to_increase.add_byte()
+                total_bytes += 1
+
+        self.finish_encoding(total_bytes, minimum_tmp, start)
+
+    """
+    Returns the number of prefixes, the depth, the from AS and the to AS of all
+    the AS links at a depth between 2 and max_depth (four lists).
+    """
+    def compute_candidates(self):
+        nb_prefixes = []
+        depths = []
+        from_nodes = []
+        to_nodes = []
+
+        for from_node in self.g:
+            for to_node in self.g[from_node].keys():
+                for depth, nb in self.g[from_node][to_node]['depth'].items():
+                    if depth > 1 and depth <= self.max_depth:
+                        nb_prefixes.append(nb)
+                        depths.append(depth)
+                        from_nodes.append(from_node)
+                        to_nodes.append(to_node)
+
+        return nb_prefixes, depths, from_nodes, to_nodes
+
+    """
+    Former implementation of compute_encoding, with one sorted list of AS links
+    per depth. Kept to check that compute_encoding gives the same encoding (see
+    benchmark/encoding_compute.py).
+    """
+    def compute_encoding_sortedlist(self):
+
+        start = timeit.default_timer()
+
         # Create a dictionnary with a pointer on the highest as link (the one on
         # the right side of the list) for each depth.
         aslink_sortedlist_depth = self.compute_sortedlist()
@@ -285,6 +482,13 @@ class Encoding():
                 # for each depth
                 next.pop()
 
+        self.finish_encoding(total_bytes, minimum_tmp, start)
+
+    """
+    Last step of compute_encoding: gives one more byte to the depths 2 and 3, and
+    computes the minimum number of prefixes of the links added later on.
+    """
+    def finish_encoding(self, total_bytes, minimum_tmp, start):
         # Add one more bit in the second depth (the more critical one)
         if 2 in self.mapping:
             #self.mapping[2].add_byte()
@@ -341,6 +545,15 @@ class Encoding():
                         p, added_p = self.mapping[depth].add(prev_as, from_as=True, overprovisioning=False)
                         n, added_n = self.mapping[depth+1].add(next_as, from_as=False, overprovisioning=False)
                         self.encoded_aslinks[depth].add((prev_as, next_as))
+                        if self.changed is not None:
+                            if p > 0:
+                                self.changed.append((depth, None))
+                            if n > 0:
+                                self.changed.append((depth+1, None))
+                            if added_p:
+                                self.changed.append((depth, prev_as))
+                            if added_n:
+                                self.changed.append((depth+1, next_as))
                         if added_p == 1 or added_n == 1:
                             return True
                         else:
@@ -361,6 +574,11 @@ class Encoding():
                 p = self.mapping[depth].remove(prev_as, True)
                 n = self.mapping[depth+1].remove(next_as, False)
                 self.encoded_aslinks[depth].remove((prev_as, next_as))
+                if self.changed is not None:
+                    if p:
+                        self.changed.append((depth, prev_as))
+                    if n:
+                        self.changed.append((depth+1, next_as))
 
                 try:
                     control_plane_overhead = self.g[prev_as][next_as]['depth'][depth]
@@ -393,6 +611,23 @@ class Encoding():
 
         #self.print_status(prefix='INFO')
 
+    """
+    Same as advertisement and withdraw, with the ids of the AS paths in the
+    ASPathTable of the topology.
+    """
+    def advertisement_path(self, old_path_id, new_path_id):
+        new_aspath = self.g.paths.get(new_path_id)
+
+        # The edges of the old AS path are all still used if the AS path has not changed
+        if old_path_id != new_path_id:
+            self.withdraw(self.g.paths.get(old_path_id))
+
+        for i in range(0, len(new_aspath)-1):
+            self.add(i+1, new_aspath[i], new_aspath[i+1])
+
+    def withdraw_path(self, old_path_id):
+        self.withdraw(self.g.paths.get(old_path_id))
+
     """
     Refresh a mapping for a depth. This function is called when a mapping is full.
     This function releases some space in the mapping for the depth. It removes the less
@@ -405,52 +640,18 @@ class Encoding():
         self.print_status(prefix='BR')
 
         # To refresh the mapping at depth X, we can remove edges at depth X-1 or X.
-        aslink_sortedlist_depth = self.compute_sortedlist(set([depth_targeted-1, depth_targeted]))
-
         # Re initialize the minimum treshold
         minimum_tmp = {}
-        for depth, slist in aslink_sortedlist_depth.items():
-            minimum_tmp[depth] = []
 
-        while True:
-            next = None
-            depth = 0
-
-            # Find which as link has the highest (lowest in this case) metric
-            for d, aslink in aslink_sortedlist_depth.items():
-                if len(aslink) == 0:
-                    continue
-                elif next is None:
-                    next = aslink
-                    depth = d
-                else:
-                    nb_bytes_cur_from = 0 if d not in self.mapping else self.mapping[d].nb_bytes
-                    nb_bytes_cur_to = 0 if d+1 not in self.mapping else self.mapping[d+1].nb_bytes
-                    nb_bytes_best_from = 0 if depth not in self.mapping else self.mapping[depth].nb_bytes
-                    nb_bytes_best_to = 0 if depth+1 not in self.mapping else self.mapping[depth+1].nb_bytes
-
-                    if self.opti_bits:
-                        if aslink[0][0]*pow(2, nb_bytes_cur_from) + aslink[0][0]*pow(2, nb_bytes_cur_to) < next[0][0]*pow(2, nb_bytes_best_from) + next[0][0]*pow(2, nb_bytes_best_to):
-                            next = aslink
-                            depth = d
-                    else:
-                        if aslink[0][0] < next[0][0]:
-                            next = aslink
-                            depth = d
-
-            # In case all the aslink are in the mapping (should never happen with a full Internet routing table)
-            if next is None:
-                break
+        for key, depth, nb_prefixes, from_as, to_as in self.encoded_links_ranking([depth_targeted-1, depth_targeted]):
+            # If more than hald of the space os used at that depth, we try to remove this edge
+            if len(self.mapping[depth_targeted].mapping) > pow(2, self.mapping[depth_targeted].nb_bytes-1):
+                control_plane_overhead += self.remove(depth, from_as, to_as)
+            # Otherwise, refresh the array used to compute the minimum threshold
             else:
-                # If more than hald of the space os used at that depth, we try to remove this edge
-                if len(self.mapping[depth_targeted].mapping) > pow(2, self.mapping[depth_targeted].nb_bytes-1):
-                    control_plane_overhead += self.remove(depth, next[0][1], next[0][2])
-                # Otherwise, refresh the array used to compute the minimum threshold
-                else:
-                    # Only if the edge is encoded though
-                    if depth in self.encoded_aslinks and (next[0][1], next[0][2]) in self.encoded_aslinks[depth]:
-                        minimum_tmp[depth].append(next[0][0])
-                next.pop(0)
+                if depth not in minimum_tmp:
+                    minimum_tmp[depth] = []
+                minimum_tmp[depth].append(nb_prefixes)
 
         for depth, vec in minimum_tmp.items():
             if len(vec) > 0:
@@ -458,6 +659,46 @@ class Encoding():
 
         self.print_status(prefix='AR', suffix=str(control_plane_overhead))
 
+    """
+    Returns the AS links encoded at these depths (and still used at their depth)
+    in the order refresh considers them, the least important first: tuples (key,
+    depth, number of prefixes, from AS, to AS) sorted by key (the number of
+    prefixes, weighted by the size of the mappings with opti_bits), then depth.
+    The links which are not encoded are left aside, refresh does not change them.
+    """
+    def encoded_links_ranking(self, depths):
+        ranking = []
+
+        for depth in depths:
+            if depth > 1 and depth <= self.max_depth and depth in self.encoded_aslinks:
+                weight = 1
+                if self.opti_bits:
+                    nb_bytes_from = 0 if depth not in self.mapping else self.mapping[depth].nb_bytes
+                    nb_bytes_to = 0 if depth+1 not in self.mapping else self.mapping[depth+1].nb_bytes
+                    weight = pow(2, nb_bytes_from) + pow(2, nb_bytes_to)
+
+                for from_as, to_as in self.encoded_aslinks[depth]:
+                    if self.g.has_edge(from_as, to_as) and depth in self.g[from_as][to_as]['depth']:
+                        nb_prefixes = self.g[from_as][to_as]['depth'][depth]
+                        ranking.append((nb_prefixes*weight, depth, nb_prefixes, from_as, to_as))
+
+        ranking.sort()
+        return ranking
+
+    """
+    Returns the VMAC of an AS path (the part where the AS path is encoded), as a
+    string of max_bytes bits.
+    """
+    def vmac(self, as_path):
+        v_mac = ''
+        deep = 1
+        for asn in as_path:
+            if deep in self.mapping:
+                v_mac += self.mapping[deep].get_mapping_string(asn)
+            deep += 1
+
+        return v_mac.ljust(self.max_bytes, '0')
+
     """
     Returns a boolean indicating if an edge, at a specific depth, is encoded.
     """
@@ -488,6 +729,27 @@ class Encoding():
         print 'Error: encoding.py prefix_is_encoded'
         return False, -1
 
+    """
+    Use the result of compute_encoding computed by a BackgroundEncoding, and
+    bring it up to date with the topology: the encoded links no longer used at
+    their depth are removed, and the links of the AS paths advertised since the
+    snapshot are added as with advertisement.
+    """
+    def load(self, result, aspaths=()):
+        self.mapping, self.encoded_aslinks, self.minimum, duration = result
+        self.print_debug('C|'+str(duration)+'\n')
+        self.print_status(prefix='C')
+
+        for depth, aslinks in self.encoded_aslinks.items():
+            for prev_as, next_as in list(aslinks):
+                if not self.g.has_edge(prev_as, next_as) or depth not in self.g[prev_as][next_as]['depth']:
+                    self.remove(depth, prev_as, next_as)
+
+        for aspath in aspaths:
+            for i in range(0, len(aspath)-1):
+                if self.g.has_edge(aspath[i], aspath[i+1]) and i+1 in self.g[aspath[i]][aspath[i+1]]['depth']:
+                    self.add(i+1, aspath[i], aspath[i+1])
+
     def print_debug(self, string):
         if self.output:
             self.fd_peer.write(string)
@@ -507,6 +769,150 @@ class Encoding():
             self.fd_peer.write(tmp)
 
 
+"""
+Main function of the process of BackgroundEncoding: computes the encoding of
+its copy of the topology and sends back the mappings, the encoded links, the
+minimums and the computation time.
+"""
+def run_encoding_worker(peer_id, topo, max_bytes, min_percentile, results):
+    # The handlers of the peer (or of the pool worker) are inherited, but the
+    # child must not stop its copy of the peers when it is terminated
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    encoding = Encoding(peer_id, topo, 'encoding', max_bytes, min_percentile, output=False)
+    start = timeit.default_timer()
+    encoding.compute_encoding()
+    results.put((encoding.mapping, encoding.encoded_aslinks, encoding.minimum, timeit.default_timer()-start))
+
+"""
+Computes the encoding of a topology (compute_encoding) in a child process. The
+child is forked when the computation starts, hence it works on a copy-on-write
+snapshot of the topology and nothing is copied. The AS paths advertised in the
+meantime are recorded with advertisement, for Encoding.load.
+"""
+class BackgroundEncoding:
+
+    def __init__(self, peer_id, topo, max_bytes, min_percentile):
+        self.aspaths = set()
+        self.results = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=run_encoding_worker, args=(peer_id, topo, max_bytes, min_percentile, self.results))
+        self.process.start()
+
+    def advertisement(self, aspath):
+        self.aspaths.add(aspath)
+
+    """
+    Returns the result of the computation (see Encoding.load), or None if it is
+    not done yet. Raises IOError if the child process exited without a result.
+    """
+    def poll(self):
+        try:
+            result = self.results.get_nowait()
+        except Queue.Empty:
+            if self.process.is_alive():
+                return None
+            # The result may have been sent just before the end of the child
+            try:
+                result = self.results.get_nowait()
+            except Queue.Empty:
+                self.process.join()
+                raise IOError('Encoding process exited with code '+str(self.process.exitcode))
+        self.process.join()
+        return result
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+
+
+"""
+Cache of the text of the AS paths and of their VMAC, as sent to the global RIB
+in the fake advertisements (see peer.send_fake_update). Many prefixes share the
+same AS path, so its VMAC is only built once. The cache follows the changes of
+the mappings of its encoding (changed attribute): only the AS paths traversing an
+AS whose value changed at that depth are dropped, and all of them when a mapping
+gets one more bit (the following bits of every VMAC are shifted). The cache is
+emptied when it holds max_size AS paths.
+"""
+class VMACCache:
+
+    def __init__(self, max_size=1000000):
+        self.max_size = max_size
+        self.encoding = None
+        self.changed = []
+
+        self.cache = {} # AS path -> text of the AS path and VMAC
+        self.index = {} # (depth, AS) -> AS paths of the cache with that AS at that depth
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, encoding, as_path):
+        if encoding is not self.encoding:
+            self.attach(encoding)
+        elif len(self.changed) > 0:
+            self.invalidate()
+
+        res = self.cache.get(as_path)
+        if res is not None:
+            self.hits += 1
+            return res
+
+        self.misses += 1
+        if len(self.cache) >= self.max_size:
+            self.clear()
+
+        res = ' '.join(map(str, as_path))+'|'+encoding.vmac(as_path)
+        self.cache[as_path] = res
+
+        deep = 1
+        for asn in as_path:
+            if deep in encoding.mapping:
+                paths = self.index.get((deep, asn))
+                if paths is None:
+                    paths = self.index[(deep, asn)] = set()
+                paths.add(as_path)
+            deep += 1
+
+        return res
+
+    """
+    Follow the changes of a new encoding (the VMACs of the previous one are dropped).
+    """
+    def attach(self, encoding):
+        if self.encoding is not None:
+            self.encoding.changed = None
+        self.encoding = encoding
+        encoding.changed = self.changed
+        self.clear()
+
+    """
+    Drop the AS paths whose VMAC changed since the last lookup.
+    """
+    def invalidate(self):
+        for depth, asn in self.changed:
+            if asn is None:
+                self.clear()
+                return
+            for as_path in self.index.pop((depth, asn), ()):
+                if self.cache.pop(as_path, None) is not None:
+                    self.invalidations += 1
+        del self.changed[:]
+
+    def clear(self):
+        self.invalidations += len(self.cache)
+        self.cache.clear()
+        self.index.clear()
+        del self.changed[:]
+
+    def __str__(self):
+        lookups = self.hits+self.misses
+        return 'hits: '+str(self.hits)+'/'+str(lookups)+' ('+('%.1f' % (100.*self.hits/max(lookups, 1)))+'%)' \
+        +'\tinvalidations: '+str(self.invalidations)+'\tpaths: '+str(len(self.cache))
+
 if __name__ == '__main__':
     m = Mapping ()
     m.add(1, True)
@@ -0,0 +1,497 @@
+import sys
+import os
+import socket
+import struct
+import gzip
+import bz2
+import heapq
+import argparse
+import traceback
+import multiprocessing
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from feed_protocol import FeedEncoder
+from bgp_messages import BGPMessage, clean_aspath, prefix_from_bytes, prefix_to_text
+
+"""
+Streaming decoder of MRT files (RFC 6396), so that SWIFT can be fed offline
+from the RIB dumps and the update files of RouteViews or RIPE RIS, without
+BGPStream. Only TABLE_DUMP_V2 (RIB dumps) and BGP4MP/BGP4MP_ET (updates)
+records are decoded, the others are skipped. gzip and bzip2 files are
+decompressed on the fly.
+
+The records are read one by one from the file, so the memory used does not
+depend on the size of the file. The elements produced are tuples
+(time, type, peer ip, peer AS, prefix, AS path, source format) where the type
+is B (RIB entry), A or W, the prefix is an integer (see bgp_messages.prefix_to_int)
+and the AS path a list of integers (cut at the first AS_SET, as run.py does).
+They can be turned into BGP messages, into the text lines bgpdump -m prints
+(understood by bgp_messages.parse) or into binary frames (see feed_protocol).
+"""
+
+MRT_HEADER = struct.Struct('>IHHI')
+
+TABLE_DUMP_V2 = 13
+BGP4MP = 16
+BGP4MP_ET = 17
+
+# TABLE_DUMP_V2 subtypes
+PEER_INDEX_TABLE = 1
+RIB_SUBTYPES = {2: (False, False), 4: (True, False), 8: (False, True), 10: (True, True)}  # subtype -> (ipv6, add-path)
+
+# BGP4MP subtypes carrying a BGP message
+MESSAGE_SUBTYPES = {1: (False, False), 4: (True, False), 6: (False, False), 7: (True, False), \
+8: (False, True), 9: (True, True), 10: (False, True), 11: (True, True)}  # subtype -> (4-byte AS, add-path)
+
+BGP_UPDATE = 2
+
+ATTR_AS_PATH = 2
+ATTR_MP_REACH_NLRI = 14
+ATTR_MP_UNREACH_NLRI = 15
+ATTR_AS4_PATH = 17
+
+AS_SET = 1
+AS_SEQUENCE = 2
+
+AFI_IPV4 = 1
+AFI_IPV6 = 2
+SAFI_UNICAST = 1
+
+UINT16 = struct.Struct('>H')
+UINT32 = struct.Struct('>I')
+
+
+class MRTError(Exception):
+    pass
+
+
+"""
+Opens an MRT file, decompressing it if it starts with the gzip or bzip2 magic.
+"""
+def open_mrt(filename):
+    with open(filename, 'rb') as fd:
+        magic = fd.read(3)
+    if magic[:2] == '\x1f\x8b':
+        return gzip.open(filename, 'rb')
+    elif magic == 'BZh':
+        return bz2.BZ2File(filename, 'rb')
+    else:
+        return open(filename, 'rb')
+
+"""
+Yields the (time, type, subtype, body) of every record of an MRT file.
+A truncated last record is ignored.
+"""
+def read_records(fd):
+    while True:
+        header = fd.read(MRT_HEADER.size)
+        if len(header) < MRT_HEADER.size:
+            return
+        ts, mrt_type, subtype, length = MRT_HEADER.unpack(header)
+        body = fd.read(length)
+        if len(body) < length:
+            return
+        yield ts, mrt_type, subtype, body
+
+
+"""
+Decodes one MRT file.
+peers   set of peer IPs to keep (all the peers if empty or None)
+"""
+class MRTReader:
+
+    def __init__(self, filename, peers=None):
+        self.filename = filename
+        self.peers = peers if peers else None
+
+        # Peers of the last PEER_INDEX_TABLE: (peer ip, peer AS)
+        self.peer_index = []
+
+        # Struct used to unpack AS path segments, per (number of ASes, AS size)
+        self.path_structs = {}
+
+        self.nb_records = 0
+        self.nb_skipped = 0
+
+    """
+    Yields the elements of the file (see the description of the module).
+    """
+    def elements(self):
+        fd = open_mrt(self.filename)
+        try:
+            for ts, mrt_type, subtype, body in read_records(fd):
+                self.nb_records += 1
+                try:
+                    if mrt_type == TABLE_DUMP_V2:
+                        if subtype == PEER_INDEX_TABLE:
+                            self.read_peer_index(body)
+                        elif subtype in RIB_SUBTYPES:
+                            for elem in self.read_rib(ts, subtype, body):
+                                yield elem
+                        else:
+                            self.nb_skipped += 1
+
+                    elif (mrt_type == BGP4MP or mrt_type == BGP4MP_ET) and subtype in MESSAGE_SUBTYPES:
+                        if mrt_type == BGP4MP_ET:
+                            ts += UINT32.unpack_from(body, 0)[0] / 1000000.
+                            body = body[4:]
+                        for elem in self.read_message(ts, subtype, body):
+                            yield elem
+
+                    else:
+                        self.nb_skipped += 1
+
+                except (struct.error, IndexError, ValueError):
+                    self.nb_skipped += 1
+        finally:
+            fd.close()
+
+    """
+    Yields the BGP messages of the file (the peer id is the peer ip,
+    prefixed by the collector if any).
+    """
+    def messages(self, collector=None):
+        for elem in self.elements():
+            yield element_to_message(elem, collector)
+
+    def read_peer_index(self, body):
+        view_name_len = UINT16.unpack_from(body, 4)[0]
+        position = 6 + view_name_len
+        nb_peers = UINT16.unpack_from(body, position)[0]
+        position += 2
+
+        self.peer_index = []
+        for i in range(0, nb_peers):
+            peer_type = ord(body[position])
+            position += 5 # Type and BGP ID
+            if peer_type & 1:
+                peer_ip = socket.inet_ntop(socket.AF_INET6, body[position:position+16])
+                position += 16
+            else:
+                peer_ip = socket.inet_ntoa(body[position:position+4])
+                position += 4
+            if peer_type & 2:
+                peer_as = UINT32.unpack_from(body, position)[0]
+                position += 4
+            else:
+                peer_as = UINT16.unpack_from(body, position)[0]
+                position += 2
+            self.peer_index.append((intern(peer_ip), peer_as))
+
+    def read_rib(self, ts, subtype, body):
+        ipv6, add_path = RIB_SUBTYPES[subtype]
+        prefix, position = self.read_prefix(body, 4, ipv6)
+        nb_entries = UINT16.unpack_from(body, position)[0]
+        position += 2
+
+        for i in range(0, nb_entries):
+            peer_ip, peer_as = self.peer_index[UINT16.unpack_from(body, position)[0]]
+            position += 6 # Peer index and originated time
+            if add_path:
+                position += 4
+            attr_len = UINT16.unpack_from(body, position)[0]
+            position += 2
+
+            if self.peers is None or peer_ip in self.peers:
+                # AS paths are always encoded with 4-byte ASes in TABLE_DUMP_V2
+                as_path, reach, unreach = self.read_attributes(body[position:position+attr_len], 4, False, False)
+                yield (ts, 'B', peer_ip, peer_as, prefix, as_path, 'TABLE_DUMP2')
+            position += attr_len
+
+    def read_message(self, ts, subtype, body):
+        as4, add_path = MESSAGE_SUBTYPES[subtype]
+        as_size = 4 if as4 else 2
+
+        if as4:
+            peer_as = UINT32.unpack_from(body, 0)[0]
+        else:
+            peer_as = UINT16.unpack_from(body, 0)[0]
+        position = 2*as_size + 2 # Peer AS, local AS and interface index
+        afi = UINT16.unpack_from(body, position)[0]
+        position += 2
+        if afi == AFI_IPV6:
+            peer_ip = socket.inet_ntop(socket.AF_INET6, body[position:position+16])
+            position += 32
+        else:
+            peer_ip = socket.inet_ntoa(body[position:position+4])
+            position += 8
+
+        if self.peers is not None and peer_ip not in self.peers:
+            return
+        peer_ip = intern(peer_ip)
+
+        # BGP header: marker, length and type
+        if ord(body[position+18]) != BGP_UPDATE:
+            return
+        end = position + UINT16.unpack_from(body, position+16)[0]
+        position += 19
+
+        withdrawn_len = UINT16.unpack_from(body, position)[0]
+        position += 2
+        withdrawn = self.read_nlri(body, position, position+withdrawn_len, False, add_path)
+        position += withdrawn_len
+
+        attr_len = UINT16.unpack_from(body, position)[0]
+        position += 2
+        as_path, reach, unreach = self.read_attributes(body[position:position+attr_len], as_size, True, add_path)
+        position += attr_len
+
+        announced = self.read_nlri(body, position, end, False, add_path)
+
+        for prefix in withdrawn + unreach:
+            yield (ts, 'W', peer_ip, peer_as, prefix, None, 'BGP4MP')
+
+        # Announcements without AS path cannot be sent to SWIFT
+        if len(as_path) > 0:
+            for prefix in announced + reach:
+                yield (ts, 'A', peer_ip, peer_as, prefix, as_path, 'BGP4MP')
+
+    """
+    Returns the prefix encoded at _position_ and the position after it.
+    """
+    def read_prefix(self, data, position, ipv6, add_path=False):
+        if add_path:
+            position += 4
+        prefix_len = ord(data[position])
+        nbytes = (prefix_len+7) >> 3
+        network = data[position+1:position+1+nbytes]
+        if ipv6:
+            prefix = prefix_from_bytes(6, prefix_len, network.ljust(16, '\0'))
+        else:
+            prefix = prefix_from_bytes(4, prefix_len, network.ljust(4, '\0'))
+        return prefix, position+1+nbytes
+
+    def read_nlri(self, data, position, end, ipv6, add_path):
+        res = []
+        while position < end:
+            prefix, position = self.read_prefix(data, position, ipv6, add_path)
+            res.append(prefix)
+        return res
+
+    """
+    Returns the AS path, the prefixes announced in MP_REACH_NLRI and the prefixes
+    withdrawn in MP_UNREACH_NLRI (only if _mp_ is True, the MP_REACH_NLRI
+    attribute is abbreviated in TABLE_DUMP_V2).
+    """
+    def read_attributes(self, attrs, as_size, mp, add_path):
+        as_path = []
+        as4_path = None
+        reach = []
+        unreach = []
+
+        position = 0
+        while position < len(attrs):
+            flags = ord(attrs[position])
+            attr_type = ord(attrs[position+1])
+            if flags & 0x10: # Extended length
+                attr_len = UINT16.unpack_from(attrs, position+2)[0]
+                position += 4
+            else:
+                attr_len = ord(attrs[position+2])
+                position += 3
+            value = attrs[position:position+attr_len]
+            position += attr_len
+
+            if attr_type == ATTR_AS_PATH:
+                as_path = self.read_as_path(value, as_size)
+            elif attr_type == ATTR_AS4_PATH:
+                as4_path = self.read_as_path(value, 4)
+            elif mp and attr_type == ATTR_MP_REACH_NLRI:
+                afi, safi, nexthop_len = struct.unpack_from('>HBB', value, 0)
+                if safi == SAFI_UNICAST:
+                    reach = self.read_nlri(value, 5+nexthop_len, len(value), afi == AFI_IPV6, add_path)
+            elif mp and attr_type == ATTR_MP_UNREACH_NLRI:
+                afi, safi = struct.unpack_from('>HB', value, 0)
+                if safi == SAFI_UNICAST:
+                    unreach = self.read_nlri(value, 3, len(value), afi == AFI_IPV6, add_path)
+
+        # Rebuild the 4-byte AS path of an old speaker (RFC 6793)
+        if as4_path is not None and len(as_path) >= len(as4_path):
+            as_path = as_path[:len(as_path)-len(as4_path)] + as4_path
+
+        return as_path, reach, unreach
+
+    def read_as_path(self, value, as_size):
+        as_path = []
+        position = 0
+        while position < len(value):
+            segment_type = ord(value[position])
+            nb_asn = ord(value[position+1])
+            position += 2
+
+            if segment_type == AS_SET:
+                break
+
+            path_struct = self.path_structs.get((nb_asn, as_size))
+            if path_struct is None:
+                path_struct = struct.Struct('>'+str(nb_asn)+('I' if as_size == 4 else 'H'))
+                self.path_structs[(nb_asn, as_size)] = path_struct
+            if segment_type == AS_SEQUENCE:
+                as_path.extend(path_struct.unpack_from(value, position))
+            position += nb_asn*as_size
+
+        return as_path
+
+
+def element_to_message(elem, collector=None):
+    ts, mtype, peer_ip, peer_as, prefix, as_path, description = elem
+    peer_id = collector+'-'+peer_ip if collector is not None else peer_ip
+    if mtype == 'W':
+        return BGPMessage('W', peer_id, peer_as, ts, prefix, None, description)
+    else:
+        return BGPMessage('A', peer_id, peer_as, ts, prefix, clean_aspath(as_path), description)
+
+def format_time(ts):
+    return repr(ts) if isinstance(ts, float) else str(ts)
+
+"""
+Returns the text line of an element: the line of bgpdump -m, or a BGPSTREAM
+line (as sent by run.py) if a collector is given.
+"""
+def element_to_line(elem, collector=None):
+    ts, mtype, peer_ip, peer_as, prefix, as_path, description = elem
+    if collector is not None:
+        line = 'BGPSTREAM|'+collector+'|'+('R' if mtype == 'B' else mtype)+'|'+peer_ip+'|'+str(peer_as)+'|'+format_time(ts)+'|'+prefix_to_text(prefix)
+    else:
+        line = description+'|'+format_time(ts)+'|'+mtype+'|'+peer_ip+'|'+str(peer_as)+'|'+prefix_to_text(prefix)
+    if mtype != 'W':
+        line += '|'+' '.join(map(str, as_path))
+    return line
+
+def close_line(peer_ip, peer_as, collector=None):
+    if collector is not None:
+        return 'BGPSTREAM|'+collector+'|CLOSE|'+peer_ip+'|'+str(peer_as)+'|-1|'
+    else:
+        return 'BGP4MP|-1|CLOSE|'+peer_ip+'|'+str(peer_as)
+
+
+"""
+Elements of a file, decorated with the key used to merge the files: the time,
+then the index of the file and the position in the file so that the order of the
+elements of a file is kept.
+"""
+def decorated_elements(filename, index, peers):
+    n = 0
+    for elem in MRTReader(filename, peers).elements():
+        yield (elem[0], index, n, elem)
+        n += 1
+
+"""
+The main function executed by a decoding process: it merges its files
+and puts the elements in the queue by chunks (None at the end).
+"""
+def run_decoder(queue, files, peers, chunk_size):
+    try:
+        chunk = []
+        for item in heapq.merge(*[decorated_elements(filename, index, peers) for index, filename in files]):
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                queue.put(chunk)
+                chunk = []
+        if len(chunk) > 0:
+            queue.put(chunk)
+        queue.put(None)
+    except Exception:
+        queue.put(MRTError(traceback.format_exc()))
+
+def queue_elements(queue):
+    while True:
+        chunk = queue.get()
+        if chunk is None:
+            return
+        if isinstance(chunk, MRTError):
+            raise chunk
+        for item in chunk:
+            yield item
+
+"""
+Yields the elements of several MRT files, merged by time.
+The files are decoded by nb_workers processes (in the current process if
+nb_workers is 1). Every process merges the files it is given and sends its
+elements by chunks in a bounded queue, so a process never gets more than
+queue_size chunks ahead of the merge.
+"""
+def merge_files(filenames, peers=None, nb_workers=1, chunk_size=1000, queue_size=16):
+    files = list(enumerate(filenames))
+    nb_workers = max(1, min(nb_workers, len(files)))
+
+    if nb_workers == 1:
+        for item in heapq.merge(*[decorated_elements(filename, index, peers) for index, filename in files]):
+            yield item[3]
+        return
+
+    workers = []
+    streams = []
+    for i in range(0, nb_workers):
+        queue = multiprocessing.Queue(queue_size)
+        worker = multiprocessing.Process(target=run_decoder, args=(queue, files[i::nb_workers], peers, chunk_size))
+        worker.daemon = True
+        worker.start()
+        workers.append(worker)
+        streams.append(queue_elements(queue))
+
+    try:
+        for item in heapq.merge(*streams):
+            yield item[3]
+    finally:
+        for worker in workers:
+            worker.terminate()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("This script decodes MRT files (RIB dumps and updates) and sends the bgp messages to a server, or writes them on the standard output.")
+    parser.add_argument("files", type=str, nargs='+', help="MRT files, possibly compressed with gzip or bzip2.")
+    parser.add_argument("--dst_ip", type=str, default=None, help="Server IP (the messages are written on the standard output if not set).")
+    parser.add_argument("--port", type=int, default=3000, help="Port")
+    parser.add_argument("--collector", type=str, default=None, help="Name of the collector. If set, BGPSTREAM lines are produced with the peer ids prefixed by the collector, as with run.py.")
+    parser.add_argument("--peers_ip", default='no', type=str, help="List IP separated by comma \
+    (Default all the peers).")
+    parser.add_argument("--peers_file", default='no', type=str, help="List of peer IP in file, one per line .")
+    parser.add_argument("--nb_workers", type=int, default=1, help="Number of processes decoding the files.")
+    parser.add_argument("--binary", action='store_true', default=False, help="Send the messages with the binary feed protocol instead of text lines.")
+    args = parser.parse_args()
+
+    filter_peer = set()
+    if args.peers_ip != 'no':
+        for ip in args.peers_ip.rstrip('\n').split(','):
+            filter_peer.add(ip)
+    if args.peers_file != 'no':
+        with open(args.peers_file, 'r') as fd:
+            for line in fd.readlines():
+                filter_peer.add(line.rstrip('\n'))
+
+    if args.dst_ip is not None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((args.dst_ip, args.port))
+        sys.stderr.write('Connected to '+args.dst_ip+' port '+str(args.port)+'\n')
+        write = sock.sendall
+    else:
+        sock = None
+        write = sys.stdout.write
+
+    encoder = FeedEncoder()
+    description = 'BGPSTREAM' if args.collector is not None else None
+
+    # peer ip -> peer AS
+    peer_set = {}
+
+    for elem in merge_files(args.files, filter_peer, args.nb_workers):
+        ts, mtype, peer_ip, peer_as, prefix, as_path, elem_description = elem
+        peer_set[peer_ip] = peer_as
+        if args.binary:
+            peer_id = args.collector+'-'+peer_ip if args.collector is not None else peer_ip
+            write(encoder.encode('W' if mtype == 'W' else 'A', peer_id, peer_as, ts, prefix, as_path, \
+            description if description is not None else elem_description))
+        else:
+            write(element_to_line(elem, args.collector)+'\n')
+
+    # Stop each peer
+    for peer_ip, peer_as in peer_set.iteritems():
+        if args.binary:
+            peer_id = args.collector+'-'+peer_ip if args.collector is not None else peer_ip
+            write(encoder.encode('CLOSE', peer_id, peer_as, -1., description=description if description is not None else 'BGP4MP'))
+        else:
+            write(close_line(peer_ip, peer_as, args.collector)+'\n')
+
+    if sock is not None:
+        sock.close()
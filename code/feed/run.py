@@ -1,9 +1,15 @@
+import sys
+import os
 import time
 import datetime
 import socket
 import argparse
 from datetime import date
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from feed_protocol import FeedEncoder
+from bgp_messages import prefix_to_int
+
 from _pybgpstream import BGPStream, BGPRecord, BGPElem
 
 parser = argparse.ArgumentParser("This script connects to a server and sends bgp messages read from bgpstream.")
@@ -15,6 +21,7 @@ parser.add_argument("--stop_time", type=int, help="Stop time (timestamp).")
 parser.add_argument("--peers_ip", default='no', type=str, help="List IP separated by comma \
 (Default all the peers belonging to the collectors).")
 parser.add_argument("--peers_file", default='no', type=str, help="List of peer IP in file, one per line .")
+parser.add_argument("--binary", action='store_true', default=False, help="Send the messages with the binary feed protocol instead of text lines.")
 
 args = parser.parse_args()
 dst = args.dst_ip
@@ -24,6 +31,7 @@ start_time_ts = args.start_time
 stop_time_ts = args.stop_time
 peers_ip = args.peers_ip
 peers_file = args.peers_file
+binary = args.binary
 
 filter_peer = set()
 if peers_ip != 'no':
@@ -74,6 +82,24 @@ def filter_play_updates(collectors, start_time_ts, stop_time_ts):
     return stream
 
 
+encoder = FeedEncoder()
+
+"""
+Encode a BGPStream element in a binary frame (None if the element cannot be sent).
+"""
+def encode_elem(rec, elem):
+    peer_id = str(rec.collector)+'-'+str(elem.peer_address)
+    if elem.type == 'W':
+        return encoder.encode('W', peer_id, int(elem.peer_asn), float(elem.time), prefix_to_int(str(elem.fields['prefix'])))
+    elif (elem.type == 'A' or elem.type == 'R') and 'as-path' in elem.fields:
+        as_path = elem.fields['as-path'].split('{')[0].split(',')[0].rstrip(' ')
+        try:
+            as_path = map(int, as_path.split(' '))
+        except ValueError:
+            return None
+        return encoder.encode('A', peer_id, int(elem.peer_asn), float(elem.time), prefix_to_int(str(elem.fields['prefix'])), as_path)
+    return None
+
 def stream_ribfirst(stream, filter_peer):
     rec = BGPRecord()
 
@@ -90,7 +116,9 @@ def stream_ribfirst(stream, filter_peer):
                 elem = rec.get_next_elem()
                 while(elem):
                     if elem.peer_address in filter_peer or len(filter_peer) == 0:
-                        if elem.type == 'W':
+                        if binary:
+                            bgp_message = encode_elem(rec, elem)
+                        elif elem.type == 'W':
                             bgp_message = 'BGPSTREAM|'+str(rec.collector) \
                             +'|'+str(elem.type)+'|'+str(elem.peer_address) \
                             +'|'+str(elem.peer_asn)+'|'+str(elem.time)+'|'+str(elem.fields['prefix'])
@@ -126,11 +154,17 @@ socket.connect((dst, port))
 print 'Connected to ',dst,' port ',port
 
 for bgp_message in stream_ribfirst(stream, filter_peer):
-    socket.send(bgp_message+'\n')
+    if binary:
+        socket.sendall(bgp_message)
+    else:
+        socket.send(bgp_message+'\n')
 
 # Stop each peer
 for c, peer_c in peer_set.iteritems():
     for p in peer_c:
-        socket.send('BGPSTREAM|'+str(c)+'|CLOSE|'+str(p)+'|37989|'+'-1'+'|||||||||\n')
+        if binary:
+            socket.sendall(encoder.encode('CLOSE', str(c)+'-'+str(p), 37989, -1.))
+        else:
+            socket.send('BGPSTREAM|'+str(c)+'|CLOSE|'+str(p)+'|37989|'+'-1'+'|||||||||\n')
 
 socket.close()
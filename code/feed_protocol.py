@@ -0,0 +1,245 @@
+import struct
+
+from bgp_messages import BGPMessage, BGPMessageView, clean_aspath, parse_many, prefix_to_bytes, PREFIX_IPV6
+
+"""
+Binary feed protocol, an alternative to the BGPSTREAM-like text lines.
+
+A binary feed starts with FEED_MAGIC, then only contains frames. Every frame
+starts with its length (uint32, not including the length itself) and its type:
+- 'P' registers a peer: the key used in the next frames, the format the
+  messages come from (index in FEED_DESCRIPTIONS) and the peer id.
+- 'A' (advertisement), 'W' (withdrawal) and 'C' (close) carry a BGP message:
+  flags, address family (0 if no prefix), prefix length, peer key, peer AS and
+  timestamp, followed by the network (4 or 16 bytes) and, for advertisements,
+  the AS path as an array of uint32.
+All the fields are little-endian, except the network which is in network order.
+A frame is at most FEED_MAX_LENGTH bytes long.
+"""
+
+FEED_MAGIC = 'SWFB\x01'
+
+FEED_LENGTH = struct.Struct('<I')
+FEED_PEER = struct.Struct('<cIB')
+FEED_MESSAGE = struct.Struct('<cBBBIqd')
+FEED_IPV4 = struct.Struct('>I')
+FEED_IPV6 = struct.Struct('>QQ')
+
+FEED_HAS_PEER_AS = 1
+
+FEED_MAX_LENGTH = 65536
+FEED_NETWORK_SIZES = {0: 0, 4: FEED_IPV4.size, 6: FEED_IPV6.size}
+FEED_PREFIX_MAX_LENGTHS = {0: 0, 4: 32, 6: 128}
+
+FEED_DESCRIPTIONS = [None, 'CBGP', 'BGP4MP', 'TABLE_DUMP2', 'BGPSTREAM']
+FEED_MTYPES = {'A': 'A', 'W': 'W', 'CLOSE': 'C'}
+FEED_MTYPES_REVERSE = {'A': 'A', 'W': 'W', 'C': 'CLOSE'}
+
+
+"""
+Raised by FeedDecoder for a frame which does not follow the protocol.
+"""
+class FeedError(ValueError):
+    pass
+
+
+"""
+Encodes BGP messages in binary frames (used by the feeders).
+The first frame returned by encode is preceded by FEED_MAGIC.
+"""
+class FeedEncoder:
+
+    def __init__(self):
+        self.peer_keys = {}
+        self.started = False
+        # Struct used to pack AS paths, per length
+        self.path_structs = {}
+
+    """
+    Returns the frame(s) for one BGP message. mtype is A, W or CLOSE,
+    prefix is an integer (see bgp_messages.prefix_to_int) and as_path a list of integers.
+    """
+    def encode(self, mtype, peer_id, peer_as, ts, prefix=None, as_path=None, description='BGPSTREAM'):
+        res = ''
+        if not self.started:
+            res = FEED_MAGIC
+            self.started = True
+
+        peer_key = self.peer_keys.get(peer_id)
+        if peer_key is None:
+            peer_key = len(self.peer_keys)
+            self.peer_keys[peer_id] = peer_key
+            res += FEED_LENGTH.pack(FEED_PEER.size+len(peer_id)) + \
+            FEED_PEER.pack('P', peer_key, FEED_DESCRIPTIONS.index(description)) + peer_id
+
+        flags = 0
+        if peer_as is not None:
+            flags |= FEED_HAS_PEER_AS
+        else:
+            peer_as = 0
+
+        family = 0
+        prefix_len = 0
+        network = ''
+        if prefix is not None:
+            family, prefix_len, network = prefix_to_bytes(prefix)
+
+        path = ''
+        if mtype == 'A' and as_path is not None:
+            path_struct = self.path_structs.get(len(as_path))
+            if path_struct is None:
+                path_struct = struct.Struct('<'+str(len(as_path))+'I')
+                self.path_structs[len(as_path)] = path_struct
+            path = path_struct.pack(*as_path)
+
+        return res + FEED_LENGTH.pack(FEED_MESSAGE.size+len(network)+len(path)) + \
+        FEED_MESSAGE.pack(FEED_MTYPES[mtype], flags, family, prefix_len, peer_key, peer_as, ts) + \
+        network + path
+
+    def encode_message(self, bgp_msg):
+        return self.encode(bgp_msg.mtype, bgp_msg.peer_id, bgp_msg.peer_as, bgp_msg.time, \
+        bgp_msg.prefix, bgp_msg.as_path, bgp_msg.description)
+
+
+"""
+Decodes the binary frames received on one feed connection.
+The fields are read in place in the receive buffer with struct.
+"""
+class FeedDecoder:
+
+    def __init__(self):
+        # peer key -> (peer id, description)
+        self.peers = {}
+        # Struct used to unpack AS paths, per length
+        self.path_structs = {}
+
+    """
+    Yields a BGP message for every complete frame in the buffer
+    (None for the frames which are not BGP messages).
+    Raises FeedError for a malformed frame (the connection cannot be read anymore).
+    """
+    def messages(self, buffer):
+        buf = buffer.buf
+        for offset, length in buffer.frames(FEED_LENGTH, FEED_MAX_LENGTH):
+            if length == 0:
+                raise FeedError('Empty frame')
+            mtype = buf[offset]
+
+            if mtype == ord('P'):
+                if length < FEED_PEER.size:
+                    raise FeedError('Truncated peer frame ('+str(length)+' bytes)')
+                mtype, peer_key, description = FEED_PEER.unpack_from(buf, offset)
+                if description >= len(FEED_DESCRIPTIONS):
+                    raise FeedError('Unknown description '+str(description))
+                peer_id = str(buf[offset+FEED_PEER.size:offset+length])
+                self.peers[peer_key] = (intern(peer_id), FEED_DESCRIPTIONS[description])
+                yield None
+                continue
+
+            if chr(mtype) not in FEED_MTYPES_REVERSE:
+                raise FeedError('Unknown frame type '+repr(chr(mtype)))
+            if length < FEED_MESSAGE.size:
+                raise FeedError('Truncated message frame ('+str(length)+' bytes)')
+
+            mtype, flags, family, prefix_len, peer_key, peer_as, ts = FEED_MESSAGE.unpack_from(buf, offset)
+            position = offset + FEED_MESSAGE.size
+
+            if peer_key not in self.peers:
+                raise FeedError('Unknown peer key '+str(peer_key))
+            if family not in FEED_NETWORK_SIZES or prefix_len > FEED_PREFIX_MAX_LENGTHS[family]:
+                raise FeedError('Bad prefix (family '+str(family)+', length '+str(prefix_len)+')')
+            path_size = offset + length - position - FEED_NETWORK_SIZES[family]
+            if path_size < 0 or path_size % 4 != 0 or (mtype != 'A' and path_size > 0):
+                raise FeedError('Bad length of '+FEED_MTYPES_REVERSE[mtype]+' frame ('+str(length)+' bytes)')
+
+            prefix = None
+            if family == 4:
+                prefix = (FEED_IPV4.unpack_from(buf, position)[0] << 8) | prefix_len
+                position += 4
+            elif family == 6:
+                high, low = FEED_IPV6.unpack_from(buf, position)
+                prefix = PREFIX_IPV6 | (((high << 64) | low) << 8) | prefix_len
+                position += 16
+
+            as_path = None
+            if mtype == 'A':
+                nb_asn = path_size / 4
+                path_struct = self.path_structs.get(nb_asn)
+                if path_struct is None:
+                    path_struct = struct.Struct('<'+str(nb_asn)+'I')
+                    self.path_structs[nb_asn] = path_struct
+                as_path = clean_aspath(path_struct.unpack_from(buf, position))
+
+            peer_id, description = self.peers[peer_key]
+            yield BGPMessage(FEED_MTYPES_REVERSE[mtype], peer_id, peer_as if flags & FEED_HAS_PEER_AS else None, \
+            ts, prefix, as_path, description)
+
+
+"""
+Reads the messages of one feed connection. The format of the feed
+(text lines or binary frames) is found from its first bytes.
+Text lines are parsed by blocks (see parse_many), and the lines which
+cannot be parsed are given to report_errors once their block has been read.
+A malformed binary frame is given to report_errors too, and no message is read
+from the connection anymore (error is set, the connection must be closed).
+"""
+class FeedReader:
+
+    def __init__(self, buffer, report_errors):
+        self.buffer = buffer
+        self.report_errors = report_errors
+        self.decoder = None
+        self.binary = None
+        self.error = None
+
+        # Block of text messages being read
+        self.batch = None
+        self.index = 0
+
+    """
+    Yields the BGP messages received (None for control messages).
+    The messages yielded may be views (see BGPMessageBatch), use detach() to keep them.
+    """
+    def messages(self):
+        if self.error is not None:
+            return
+
+        if self.binary is None:
+            nbytes = min(len(self.buffer), len(FEED_MAGIC))
+            if self.buffer.peek(nbytes) != FEED_MAGIC[:nbytes]:
+                self.binary = False
+            elif nbytes < len(FEED_MAGIC):
+                return
+            else:
+                self.buffer.consume(len(FEED_MAGIC))
+                self.binary = True
+                self.decoder = FeedDecoder()
+
+        if self.binary:
+            try:
+                for bgp_msg in self.decoder.messages(self.buffer):
+                    yield bgp_msg
+            except ValueError, e:
+                self.error = str(e)
+                self.report_errors(['Bad frame: '+self.error])
+            return
+
+        while True:
+            if self.batch is None:
+                block = self.buffer.block()
+                if block is None:
+                    return
+                self.batch = parse_many(block)
+                self.index = 0
+
+            # The view is moved to the next message only when the previous one has been processed
+            batch = self.batch
+            view = BGPMessageView(batch)
+            while self.index < len(batch):
+                view.index = self.index
+                self.index += 1
+                yield view
+
+            self.batch = None
+            if len(batch.errors) > 0:
+                self.report_errors(batch.errors)
@@ -0,0 +1,139 @@
+import os
+
+"""
+Receive buffer shared by all the loops reading newline-delimited messages
+(BGP messages sent to SWIFT, fake updates sent to the global RIB, ExaBGP output).
+
+Incoming bytes are written directly in a preallocated bytearray (with recv_into
+when reading from a socket), and complete lines are extracted by searching for
+the delimiters in place. The partial last line simply stays in the buffer until
+the next read, so there is no copy of the whole buffer for every byte received.
+There is one buffer per connection, it starts small and grows only when a partial
+line does not fit in it.
+"""
+class ReceiveBuffer:
+
+    def __init__(self, size=65536, delimiter='\n'):
+        self.delimiter = delimiter
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0  # Position of the first byte not consumed yet
+        self.end = 0    # Position of the end of the valid data
+
+    """
+    Make sure at least _needed_ bytes can be written at the end of the buffer.
+    The data not consumed yet is first moved at the beginning of the buffer,
+    and the buffer grows (doubles) only if a single line does not fit in it.
+    """
+    def reserve(self, needed=1):
+        if self.start == self.end:
+            self.start = 0
+            self.end = 0
+
+        if len(self.buf) - self.end >= needed:
+            return
+
+        pending = self.end - self.start
+        if pending + needed <= len(self.buf):
+            self.buf[0:pending] = self.buf[self.start:self.end]
+        else:
+            size = len(self.buf)
+            while size < pending + needed:
+                size *= 2
+            new_buf = bytearray(size)
+            new_buf[0:pending] = self.buf[self.start:self.end]
+            # The old buffer cannot be resized while a memoryview is exported,
+            # so we just replace both of them.
+            self.view = None
+            self.buf = new_buf
+            self.view = memoryview(self.buf)
+
+        self.start = 0
+        self.end = pending
+
+    """
+    Read data from a socket directly in the buffer.
+    Returns the number of bytes read (0 means the connection is closed).
+    """
+    def recv_from(self, sock):
+        # At least half of the buffer is free, the reads do not shrink with a long partial line
+        self.reserve(len(self.buf)/2)
+        nbytes = sock.recv_into(self.view[self.end:])
+        self.end += nbytes
+        return nbytes
+
+    """
+    Read data from a file descriptor (e.g., a pipe or stdin) in the buffer.
+    Returns the number of bytes read (0 means end of file).
+    """
+    def read_from(self, fd, size=1048576):
+        return self.feed(os.read(fd, size))
+
+    """
+    Append data which has already been read (e.g., from a file object).
+    """
+    def feed(self, data):
+        self.reserve(len(data))
+        self.buf[self.end:self.end+len(data)] = data
+        self.end += len(data)
+        return len(data)
+
+    """
+    Yields all the complete lines currently in the buffer (without the delimiter).
+    The partial last line, if any, is kept for the next read.
+    """
+    def lines(self):
+        while True:
+            pos = self.buf.find(self.delimiter, self.start, self.end)
+            if pos == -1:
+                break
+            line = self.view[self.start:pos].tobytes()
+            self.start = pos+1
+            yield line
+
+    """
+    Returns all the complete lines currently in the buffer as one block (without the
+    last delimiter), or None if there is no complete line.
+    """
+    def block(self):
+        pos = self.buf.rfind(self.delimiter, self.start, self.end)
+        if pos == -1:
+            return None
+        data = self.view[self.start:pos].tobytes()
+        self.start = pos+1
+        return data
+
+    """
+    Yields the position and the length of all the complete length-prefixed frames
+    currently in the buffer. The length of a frame is read with the struct _header_
+    and does not include the header. The frames must be processed before the next read.
+    A length above _max_length_ raises ValueError (the frame is not consumed).
+    """
+    def frames(self, header, max_length=None):
+        while self.end - self.start >= header.size:
+            length = header.unpack_from(self.buf, self.start)[0]
+            if max_length is not None and length > max_length:
+                raise ValueError('Frame of '+str(length)+' bytes (at most '+str(max_length)+')')
+            if self.end - self.start < header.size + length:
+                break
+            offset = self.start + header.size
+            self.start = offset + length
+            yield offset, length
+
+    """
+    Returns the first _size_ bytes not consumed yet, without consuming them.
+    """
+    def peek(self, size):
+        return self.view[self.start:self.start+min(size, self.end-self.start)].tobytes()
+
+    """
+    Consume _size_ bytes.
+    """
+    def consume(self, size):
+        self.start += min(size, self.end-self.start)
+
+    """
+    Returns the number of bytes received but not consumed yet.
+    """
+    def __len__(self):
+        return self.end - self.start
@@ -0,0 +1,153 @@
+import errno
+import socket
+import asyncore
+
+from framing import ReceiveBuffer
+from feed_protocol import FeedReader
+
+"""
+Event-driven (asyncore) server receiving the BGP feeds, with backpressure.
+
+Every feed connection has its own receive buffer and reader (text lines or
+binary frames, see feed_protocol). After each message is dispatched, the
+connection checks the channel of the peer that received it. If more than
+high_water messages are waiting for that peer process, the connection stops
+processing its buffer and is not read anymore. The kernel socket buffer then
+fills up and TCP flow control slows down the sender, instead of the dispatcher
+buffering messages for a slow peer process without bound.
+A paused connection resumes when all the peers it feeds are below low_water.
+
+report_errors  function called with the text lines which could not be parsed
+on_message  function called for every BGP message received, returns the id of the peer
+            the message was sent to (None if the message was not sent to a peer)
+channel_of  function returning the channel of a peer (None if the peer is gone)
+"""
+class FeedServer(asyncore.dispatcher):
+
+    def __init__(self, sock, report_errors, on_message, channel_of, high_water=100000, low_water=None, logger=None):
+        self.map = {}
+        asyncore.dispatcher.__init__(self, sock, map=self.map)
+        # The socket is already listening
+        self.accepting = True
+
+        self.report_errors = report_errors
+        self.on_message = on_message
+        self.channel_of = channel_of
+        self.high_water = high_water
+        self.low_water = low_water if low_water is not None else high_water/2
+        self.logger = logger
+
+        self.connections = []
+        self.nb_pauses = 0
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            newsock, address = pair
+            self.connections.append(FeedConnection(newsock, self))
+            print 'New connection from ', address
+
+    """
+    Returns True if at least one connection is paused.
+    """
+    def is_paused(self):
+        for connection in self.connections:
+            if connection.paused:
+                return True
+        return False
+
+    """
+    Resume the connections whose peers have caught up.
+    """
+    def resume(self):
+        for connection in list(self.connections):
+            if connection.paused:
+                connection.resume()
+
+    """
+    Wait for events during at most timeout seconds and process them.
+    """
+    def poll(self, timeout):
+        asyncore.loop(timeout, map=self.map, count=1)
+        self.resume()
+
+    def handle_error(self):
+        raise
+
+
+class FeedConnection(asyncore.dispatcher):
+
+    def __init__(self, sock, server):
+        asyncore.dispatcher.__init__(self, sock, map=server.map)
+        self.server = server
+        self.buffer = ReceiveBuffer()
+        self.reader = FeedReader(self.buffer, server.report_errors)
+        self.paused = False
+        # Peers which received messages from this connection
+        self.peers = set()
+
+    def readable(self):
+        return not self.paused
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        try:
+            nbytes = self.buffer.recv_from(self.socket)
+        except socket.error, e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            nbytes = 0
+
+        if nbytes == 0:
+            self.handle_close()
+        else:
+            self.drain()
+
+    """
+    Dispatch the complete messages in the buffer, until the peer of a message
+    is congested. The connection is closed after a malformed frame.
+    """
+    def drain(self):
+        for bgp_msg in self.reader.messages():
+            peer_id = self.server.on_message(bgp_msg)
+
+            if peer_id is not None:
+                self.peers.add(peer_id)
+
+                channel = self.server.channel_of(peer_id)
+                if channel is not None and channel.pending() >= self.server.high_water:
+                    self.paused = True
+                    self.server.nb_pauses += 1
+                    if self.server.logger is not None:
+                        self.server.logger.info('Pausing '+str(self.addr)+', peer '+peer_id+' has '+str(channel.pending())+' messages waiting.')
+                    return
+
+        if self.reader.error is not None:
+            if self.server.logger is not None:
+                self.server.logger.warning('Closing '+str(self.addr)+': '+self.reader.error)
+            self.handle_close()
+
+    def resume(self):
+        for peer_id in list(self.peers):
+            channel = self.server.channel_of(peer_id)
+            if channel is None:
+                self.peers.discard(peer_id)
+            elif channel.pending() > self.server.low_water:
+                return
+
+        self.paused = False
+        if self.server.logger is not None:
+            self.server.logger.info('Resuming '+str(self.addr)+'.')
+        self.drain()
+
+    def handle_close(self):
+        if self.server.logger is not None:
+            self.server.logger.info('Disconnected from '+str(self.addr))
+        print 'Disconnected from '+str(self.addr)
+        self.close()
+        self.server.connections.remove(self)
+
+    def handle_error(self):
+        raise
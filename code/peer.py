@@ -9,15 +9,20 @@ import atexit
 from copy import deepcopy
 import logging.handlers
 import multiprocessing
-import string
-
-from bgp_messages import parse, BGPMessagesQueue
-from rib import RIBPeer
-from as_topology import ASTopology
-from bpa import find_best_fmscore_forward, find_best_fmscore_backward, find_best_fmscore_naive, find_best_fmscore_single
+import socket
+
+from bgp_messages import parse, prefix_to_text, BGPMessagesWindow
+from rib import RIBPeer, ASPathTable
+from as_topology import topology_class
+from prefix_index import PrefixIds
+from bpa import find_best_fmscore_forward, find_best_fmscore_backward, find_best_fmscore_naive, find_best_fmscore_single, IncrementalBPA, \
+find_best_fmscore_forward_numpy, find_best_fmscore_backward_numpy, AsyncBPA, AnytimeBPA
 from burst import Burst
-from encoding import Encoding
+from encoding import Encoding, BackgroundEncoding, VMACCache
+
 
+# Maximum time (in seconds) a peer with work in the background waits for a BGP message (see Peer.idle_timeout)
+IDLE_TIMEOUT = 0.05
 
 # Parameters used for the loggers
 peer_logger = None
@@ -53,18 +58,25 @@ G               The graph of AS paths still available, weighted based on the num
 G_W             The graph of AS paths that have been withdrawn, weighted based on the number of withdrawn paths
 W_queue         The queue of withdrawals.
 p_w, r_w        The precision and recall weights
-bpa_algo        The type of algoruthm to use (bpa-single, bpa-multiple, naive)
+bpa_algo        The type of algoruthm to use (bpa-single, bpa-multiple, bpa-incremental, bpa-numpy, bpa-anytime, naive)
+bpa             The IncrementalBPA of the burst (bpa-incremental only)
 """
 
-def burst_prediction(current_burst, G, G_W, W_queue, p_w, r_w, bpa_algo, peer_as_set):
+def burst_prediction(current_burst, G, G_W, W_queue, p_w, r_w, bpa_algo, peer_as_set, bpa=None):
     current_burst.prediction_done = True
 
     try:
-        if bpa_algo == 'bpa-multiple':
-            best_edge_set_forward, best_fm_score_forward, best_TP_forward, best_FP_forward, best_FN_forward = \
-            find_best_fmscore_forward(G, G_W, len(W_queue)+len(current_burst.deleted_from_W_queue), p_w, r_w, opti=True)
-            best_edge_set_backward, best_fm_score_backward, best_TP_backward, best_FP_backward, best_FN_backward = \
-            find_best_fmscore_backward(G, G_W, len(W_queue)+len(current_burst.deleted_from_W_queue), p_w, r_w, opti=True)
+        if bpa_algo == 'bpa-multiple' or bpa_algo == 'bpa-numpy':
+            if bpa_algo == 'bpa-numpy':
+                best_edge_set_forward, best_fm_score_forward, best_TP_forward, best_FP_forward, best_FN_forward = \
+                find_best_fmscore_forward_numpy(G, G_W, len(W_queue)+len(current_burst.deleted_from_W_queue), p_w, r_w)
+                best_edge_set_backward, best_fm_score_backward, best_TP_backward, best_FP_backward, best_FN_backward = \
+                find_best_fmscore_backward_numpy(G, G_W, len(W_queue)+len(current_burst.deleted_from_W_queue), p_w, r_w)
+            else:
+                best_edge_set_forward, best_fm_score_forward, best_TP_forward, best_FP_forward, best_FN_forward = \
+                find_best_fmscore_forward(G, G_W, len(W_queue)+len(current_burst.deleted_from_W_queue), p_w, r_w, opti=True)
+                best_edge_set_backward, best_fm_score_backward, best_TP_backward, best_FP_backward, best_FN_backward = \
+                find_best_fmscore_backward(G, G_W, len(W_queue)+len(current_burst.deleted_from_W_queue), p_w, r_w, opti=True)
 
             if best_fm_score_forward > best_fm_score_backward:
                 best_edge_set = best_edge_set_forward
@@ -85,6 +97,12 @@ def burst_prediction(current_burst, G, G_W, W_queue, p_w, r_w, bpa_algo, peer_as
                 best_FN = -1
                 best_fm_score = best_fm_score_forward
 
+        elif bpa_algo == 'bpa-incremental':
+            best_edge_set, best_fm_score, best_TP, best_FP, best_FN = bpa.find_best_fmscore(len(W_queue)+len(current_burst.deleted_from_W_queue))
+
+        elif bpa_algo == 'bpa-anytime': # Without time budget
+            best_edge_set, best_fm_score, best_TP, best_FP, best_FN = AnytimeBPA(G, G_W, len(W_queue)+len(current_burst.deleted_from_W_queue), p_w, r_w).run()
+
         elif bpa_algo == 'bpa-single':
             best_edge_set, best_fm_score, best_TP, best_FP, best_FN = find_best_fmscore_single(G, G_W, len(W_queue)+len(current_burst.deleted_from_W_queue), p_w, r_w)
         else:
@@ -108,47 +126,32 @@ def burst_prediction(current_burst, G, G_W, W_queue, p_w, r_w, bpa_algo, peer_as
 def burst_add_edge(current_burst, rib, encoding, last_msg_time, best_edge_set, G, G_W, W_queue, silent):
     for new_edge in current_burst.add_edges_iter(last_msg_time, best_edge_set, G_W):
         for p in G.get_prefixes_edge(new_edge):
-            aspath = rib.rib[p]
+            aspath = rib.get(p)
             is_encoded, depth = encoding.prefix_is_encoded(p, aspath, new_edge[0], new_edge[1])
             current_burst.add_predicted_prefix(last_msg_time, p, is_encoded, depth)
 
-        for p in current_burst.deleted_from_W_queue:
-            for i in range(0, len(p.as_path)-1):
-                if (p.as_path[i] == new_edge[0] and p.as_path[i+1] == new_edge[1]) or (p.as_path[i+1] == new_edge[0] and p.as_path[i] == new_edge[1]):
-                    current_burst.add_predicted_prefix2(p.time, p.prefix, True, 'D')
-                    break
+        # Withdrawals traversing the edge, removed from the queue during the burst (D) or still in the queue (Q)
+        for expired, p in W_queue.edge_messages(new_edge):
+            current_burst.add_predicted_prefix2(p.time, p.prefix, True, 'D' if expired else 'Q')
 
-        for p in W_queue:
-            for i in range(0, len(p.as_path)-1):
-                if (p.as_path[i] == new_edge[0] and p.as_path[i+1] == new_edge[1]) or (p.as_path[i+1] == new_edge[0] and p.as_path[i] == new_edge[1]):
-                    current_burst.add_predicted_prefix2(p.time, p.prefix, True, 'Q')
-                    break
-
-def send_fake_update(p, peer_ip, ts, rib, encoding, socket):
+def send_fake_update(p, peer_ip, ts, rib, encoding, socket, vmac_cache=None):
     # if it is an advertisement
     if rib is not None:
-        # Make the second part of the v_mac (the part where the as-path is encoded)
-        v_mac = ''
-        deep = 1
-        aspath = ''
-        for asn in rib.rib[p]:
-            if deep in encoding.mapping:
-                depth_value = encoding.mapping[deep].get_mapping_string(asn)
-                v_mac += ''+depth_value
-            deep += 1
-            aspath += str(asn)+' '
-        aspath = aspath[:-1]
-
-        v_mac = string.ljust(v_mac, encoding.max_bytes, '0')
-
-        socket.send(peer_ip+'|'+p+'|'+str(ts)+'|'+aspath+'|'+v_mac+'\n')
+        # The as-path and the second part of the v_mac (the part where the as-path is encoded)
+        as_path = rib.get(p)
+        if vmac_cache is not None:
+            aspath_vmac = vmac_cache.get(encoding, as_path)
+        else:
+            aspath_vmac = ' '.join(map(str, as_path))+'|'+encoding.vmac(as_path)
+
+        socket.send(peer_ip+'|'+prefix_to_text(p)+'|'+str(ts)+'|'+aspath_vmac+'\n')
     else: # If it is a withdrawal
-        socket.send(peer_ip+'|'+p+'|'+str(ts)+'\n')
+        socket.send(peer_ip+'|'+prefix_to_text(p)+'|'+str(ts)+'\n')
 
 
 """
-The main function executed when launching a new peer.
-queue           is the shared queue between the main process and the peer processes
+The state machine of one BGP peer: its RIB, its topologies, its encoding, its queue
+of withdrawals and the current burst (if any). Several peers can live in the same process.
 win_size        is the window_size
 nb_withdrawals_burst_start     the number of withdrawals we need to receive in last 5ec to start the burst
 nb_withdrawals_burst_end        the number of withdrawals we need to receive in last 5ec to end the burst
@@ -157,262 +160,541 @@ burst_outdir    where to store information about the bursts (silent needs to Fal
 nb_withdraws_per_cycle After how many new withdrawals BPA needs to run_peer
 silent          print output in files to get information. To speed-up the algo, set to True.
 naive           Use the naive approach if True
+topology        implementation of the AS topologies (networkx or array, see as_topology.topology_class)
+bpa_async       run BPA (bpa-multiple or bpa-numpy) in worker processes while the peer keeps processing the messages (see bpa.AsyncBPA)
+bpa_budget      time budget of bpa-anytime (in ms, None for no budget)
+win_resolution  resolution of the window and of the timestamps of the bursts (in seconds, e.g., 0.001)
+background_encoding compute the encoding in a child process, without blocking the processing of the messages (see encoding.BackgroundEncoding)
+encoding_period recompute the encoding in the background every encoding_period seconds (background_encoding only, 0 to disable)
+global_rib      object used instead of the connection with the global RIB process (see rib.GlobalRIBHandler)
 """
-def run_peer(queue, win_size, nb_withdrawals_burst_start, \
-nb_withdrawals_burst_end, min_bpa_burst_size, burst_outdir, socket_rib_name, \
-nb_withdraws_per_cycle=100, p_w=1, r_w=1, bpa_algo=False, nb_bits_aspath=33, \
-run_encoding_threshold=1000000, global_rib_enabled=True, silent=False):
-
-    global peer_logger
-
-    import socket
-
-    try:
-        os.nice(-20)
-    except OSError:
-        peer_logger.info('Cannot change the nice.')
-
-    # Create the topologies for this peer
-    G = ASTopology(1, silent) # Main topology
-    G_W = ASTopology(nb_withdrawals_burst_start, silent) # Subset of the topology with the withdraws in the queue
-
-    # Current burst (if any)
-    current_burst = None
-
-    # Last time the peer wrote the rib and queue size in the log file
-    last_log_write = 0
-
-    # Socket connected to the global RIB
-    socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-
-    # Exit properly when receiving SIGINT
-    def signal_handler(signal, frame):
-        if current_burst is not None:
-            current_burst.stop(bgp_msg.time)
-
-        socket.close()
-
-        peer_logger.info('Received SIGTERM. Exiting.')
-
-        sys.exit(0)
-
-    signal.signal(signal.SIGTERM, signal_handler)
-
-    peer_id = None
-    peer_as = None
-
-    # Create the RIB for this peer
-    rib = RIBPeer()
-
-    encoding = None
-    # This function create and initialize the encoding
-    def init_encoding():
-        encoding = Encoding(peer_id, G, 'encoding', nb_bits_aspath, 5, output=True)
+class Peer:
+
+    def __init__(self, win_size, nb_withdrawals_burst_start, \
+    nb_withdrawals_burst_end, min_bpa_burst_size, burst_outdir, socket_rib_name, \
+    nb_withdraws_per_cycle=100, p_w=1, r_w=1, bpa_algo=False, nb_bits_aspath=33, \
+    run_encoding_threshold=1000000, global_rib_enabled=True, silent=False, topology='networkx', bpa_async=False, bpa_budget=5, win_resolution=1, background_encoding=False, encoding_period=3600, global_rib=None):
+
+        self.win_size = win_size
+        self.nb_withdrawals_burst_start = nb_withdrawals_burst_start
+        self.nb_withdrawals_burst_end = nb_withdrawals_burst_end
+        self.min_bpa_burst_size = min_bpa_burst_size
+        self.burst_outdir = burst_outdir
+        self.socket_rib_name = socket_rib_name
+        self.nb_withdraws_per_cycle = nb_withdraws_per_cycle
+        self.p_w = p_w
+        self.r_w = r_w
+        self.bpa_algo = bpa_algo
+        self.nb_bits_aspath = nb_bits_aspath
+        self.run_encoding_threshold = run_encoding_threshold
+        self.global_rib_enabled = global_rib_enabled
+        self.silent = silent
+        self.bpa_async = bpa_async
+        self.bpa_budget = bpa_budget
+        self.win_resolution = win_resolution
+        self.background_encoding = background_encoding
+        self.encoding_period = encoding_period
+
+        # Logger of this peer (the main peer logger until the peer id is known)
+        self.logger = peer_logger
+
+        # AS paths of this peer (the RIB and the main topology use their ids), and the ids
+        # of its prefixes given by the RIB (the prefix bitmaps of the main topology use them, if not silent only)
+        self.paths = ASPathTable()
+        self.prefix_ids = PrefixIds() if not silent else None
+
+        # Create the topologies for this peer
+        self.G = topology_class(topology)(1, silent, self.paths, self.prefix_ids) # Main topology
+        self.G_W = topology_class(topology)(nb_withdrawals_burst_start, silent) # Subset of the topology with the withdraws in the queue
+
+        # Current burst (if any), and its incremental BPA (bpa-incremental only)
+        self.current_burst = None
+        self.next_bpa_execution = None
+        self.bpa = None
+
+        # Workers running BPA (bpa_async only, started with the first prediction)
+        self.async_bpa = None
+
+        # Search of the last prediction, if it has not finished within its budget (bpa-anytime only)
+        self.anytime_bpa = None
+
+        # Last time the peer wrote the rib and queue size in the log file
+        self.last_log_write = 0
+
+        # Socket connected to the global RIB (or the global RIB itself, in the same process)
+        self.global_rib = global_rib
+        if global_rib is not None:
+            self.socket = global_rib
+        else:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        self.peer_id = None
+        self.peer_as = None
+        self.peer_as_set = set()
+        self.peer_ip = None
+
+        # Create the RIB for this peer
+        self.rib = RIBPeer(self.paths, self.prefix_ids)
+
+        self.encoding = None
+
+        # VMACs of the AS paths sent in the fake advertisements
+        self.vmac_cache = VMACCache()
+
+        # Encoding computed in the background, and prefixes of the RIB still to send
+        # with the new encoding, rebroadcast_batch per message (background_encoding only).
+        # After a recomputation, only the prefixes whose VMAC changed with the previous
+        # encoding are sent again (AS path -> True if its VMAC changed).
+        self.next_encoding = None
+        self.rebroadcast = None
+        self.rebroadcast_batch = 1000
+        self.previous_encoding = None
+        self.vmac_changed = {}
+
+        # Time of the BGP message that triggered the last computation of the encoding
+        self.last_encoding = None
+
+        # Wall clock time of the last BGP message. The table is considered as loaded when
+        # no message arrives for table_load_delay seconds (background_encoding only).
+        self.last_msg_wall = None
+        self.table_load_delay = 1.
+
+        self.W_queue = BGPMessagesWindow(win_size, win_resolution, not silent) # Window of Withdraws (indexed by AS edge, see burst_add_edge)
+
+        # Last BGP message processed, and the last AS path replaced by an advertisement
+        self.bgp_msg = None
+        self.old_as_path = None
+        self.last_ts = 0
+
+        # True when the peer has received a CLOSE message
+        self.closed = False
+
+    """
+    This function creates and initializes the encoding
+    """
+    def init_encoding(self):
+        self.last_encoding = self.bgp_msg.time
+        encoding = Encoding(self.peer_id, self.G, 'encoding', self.nb_bits_aspath, 5, output=True)
         encoding.compute_encoding()
-        peer_logger.info(str(int(bgp_msg.time))+'\t'+str(len(rib))+'\t'+str(len(W_queue))+'\t'+'Encoding computed!')
+        self.logger.info(str(int(self.bgp_msg.time))+'\t'+str(len(self.rib))+'\t'+str(len(self.W_queue))+'\t'+'Encoding computed!')
 
-        if global_rib_enabled:
-            for p in rib.rib:
-                send_fake_update(p, peer_ip, bgp_msg.time, rib, encoding, socket)
+        if self.global_rib_enabled:
+            for p in self.rib.rib:
+                send_fake_update(p, self.peer_ip, self.bgp_msg.time, self.rib, encoding, self.socket, self.vmac_cache)
 
         return encoding
 
-    #A_queue = BGPMessagesQueue(win_size) # Queue of Updates
-    W_queue = BGPMessagesQueue(win_size) # Queue of Withdraws
-
-    last_ts = 0
-
-    while True:
-
-        while True:
-            bgp_msg = queue.get()
-
-            if bgp_msg is not None:
-                if peer_id is None:
-                    peer_id = bgp_msg.peer_id
-                    peer_as = bgp_msg.peer_as
-                    peer_as_set = set()
-                    last_ts = bgp_msg.time
-                    peer_ip = peer_id.split('-')[-1]
-
-                    peer_handler = logging.handlers.RotatingFileHandler(log_dir+'/peer_'+str(peer_id), maxBytes=200000000000000, backupCount=5)
-                    peer_handler.setFormatter(formatter)
-                    peer_logger.removeHandler(handler)
-                    peer_logger.addHandler(peer_handler)
-
-                    peer_logger.info('Peer_'+str(peer_id)+'_(AS'+str(str(peer_as))+')_started.')
-
-                    if bgp_msg.as_path is not None and len(bgp_msg.as_path) > 0:
-                        if peer_as != bgp_msg.as_path[0]:
-                            peer_logger.warning('Peer AS '+str(peer_as)+' and first AS '+str(bgp_msg.as_path[0])+' in AS path does not match. Setting first AS as peer AS.')
-                            peer_as = bgp_msg.as_path[0]
-
-                    # Make the connection with the global RIB
-                    rib_global_socket_address = '/tmp/'+socket_rib_name
-                    socket.connect(rib_global_socket_address)
-                    peer_logger.info('Peer_'+str(peer_id)+'_(AS'+str(str(peer_as))+') connected with the global RIB.')
-
-                if peer_id != bgp_msg.peer_id:
-                    peer_logger.critical('Received a bgp_message with peer_id: '+str(bgp_msg.peer_id))
-
-                if bgp_msg.mtype == 'A':
-                    # Update the set set of peer_as (useful when doing the naive solution)
-                    if len(bgp_msg.as_path) > 0:
-                        peer_as_set.add(bgp_msg.as_path[0])
-
-                    # Update the RIB for this peer
-                    old_as_path = rib.update(bgp_msg)
+    """
+    Start computing the encoding in the background (background_encoding only).
+    """
+    def start_encoding(self):
+        self.last_encoding = self.bgp_msg.time
+        self.next_encoding = BackgroundEncoding(self.peer_id, self.G, self.nb_bits_aspath, 5)
+        self.logger.info(str(int(self.bgp_msg.time))+'\t'+str(len(self.rib))+'\t'+str(len(self.W_queue))+'\t'+'Encoding started in the background.')
+
+    """
+    Swap in the encoding computed in the background once it is ready. The fake
+    advertisements of the prefixes of the RIB are then sent by send_rebroadcast.
+    If the child process died, the first encoding is computed in the peer (a
+    recomputation is simply dropped, the current encoding is kept).
+    """
+    def poll_encoding(self):
+        try:
+            result = self.next_encoding.poll()
+        except IOError, e:
+            self.next_encoding = None
+            self.logger.error(str(int(self.bgp_msg.time))+'\t'+str(len(self.rib))+'\t'+str(len(self.W_queue))+'\t'+'Background encoding failed ('+str(e)+').')
+            if self.encoding is None:
+                self.encoding = self.init_encoding()
+            return
+
+        if result is not None:
+            encoding = Encoding(self.peer_id, self.G, 'encoding', self.nb_bits_aspath, 5, output=True)
+            encoding.load(result, self.next_encoding.aspaths)
+            self.previous_encoding = self.encoding
+            self.vmac_changed = {}
+            self.encoding = encoding
+            self.next_encoding = None
+            self.logger.info(str(int(self.bgp_msg.time))+'\t'+str(len(self.rib))+'\t'+str(len(self.W_queue))+'\t'+'Encoding computed!')
+
+            if self.global_rib_enabled:
+                self.rebroadcast = iter(list(self.rib.rib))
+
+    """
+    Send the fake advertisements of the next rebroadcast_batch prefixes of the RIB
+    with the new encoding (the prefixes withdrawn in the meantime are skipped).
+    """
+    def send_rebroadcast(self):
+        nb_prefixes = 0
+        for p in self.rebroadcast:
+            if p in self.rib.rib and self.rebroadcast_needed(self.rib.get(p)):
+                send_fake_update(p, self.peer_ip, self.bgp_msg.time, self.rib, self.encoding, self.socket, self.vmac_cache)
+            nb_prefixes += 1
+            if nb_prefixes == self.rebroadcast_batch:
+                return
+        self.rebroadcast = None
+        self.previous_encoding = None
+        self.vmac_changed = {}
+
+    """
+    Returns True if the VMAC of this AS path is not the same with the previous
+    encoding (always True for the first encoding).
+    """
+    def rebroadcast_needed(self, as_path):
+        if self.previous_encoding is None:
+            return True
+        changed = self.vmac_changed.get(as_path)
+        if changed is None:
+            changed = self.previous_encoding.vmac(as_path) != self.encoding.vmac(as_path)
+            self.vmac_changed[as_path] = changed
+        return changed
+
+    """
+    Recompute the encoding in the background every encoding_period seconds, to
+    keep it up to date with the topology (background_encoding only). Neither
+    during a burst, as the predictions sent to the global RIB use the current
+    encoding, nor while the prefixes are sent with the last one.
+    """
+    def refresh_encoding(self):
+        if self.encoding_period > 0 and self.encoding is not None and self.next_encoding is None \
+        and self.rebroadcast is None and self.current_burst is None \
+        and self.bgp_msg.time - self.last_encoding >= self.encoding_period:
+            self.start_encoding()
+
+    """
+    Work which does not depend on the BGP messages: swap in the encoding computed in
+    the background, send the next prefixes of the rebroadcast, start computing the
+    first encoding once the table is loaded, apply the prediction of the BPA
+    workers (bpa_async only) and continue the search of the last prediction
+    (bpa-anytime only). Executed before every BGP message,
+    and by the run loop when no message arrives within idle_timeout seconds.
+    """
+    def background(self):
+        if self.bgp_msg is None:
+            return
+
+        # Swap in the encoding computed in the background (the first one as soon as
+        # possible, the next ones after the burst), and send the prefixes of the RIB with it
+        if self.next_encoding is not None:
+            if self.encoding is None or self.current_burst is None:
+                self.poll_encoding()
+        elif self.background_encoding:
+            if self.encoding is None and len(self.rib.rib) > 0 \
+            and time.time() - self.last_msg_wall >= self.table_load_delay:
+                self.start_encoding()
+            self.refresh_encoding()
+        if self.rebroadcast is not None:
+            self.send_rebroadcast()
+
+        # Apply the result of the last prediction, if it is ready
+        if self.async_bpa is not None and self.current_burst is not None:
+            prediction = self.async_bpa.poll()
+            if prediction is not None:
+                self.logger.info('BPA result computed with '+str(prediction[0][1])+' withdrawals applied with '+str(len(self.current_burst))+' withdrawals.')
+                self.current_burst.prediction_done = True
+                self.apply_prediction(*prediction[1])
+
+        # Continue the search of the last prediction within the budget, and apply the improved sets (bpa-anytime only)
+        if self.anytime_bpa is not None and self.current_burst is not None:
+            best_edge_set = self.anytime_bpa.result()[0]
+            prediction = self.anytime_bpa.run(self.bpa_budget/1000. if self.bpa_budget is not None else None)
+            if prediction[0] != best_edge_set:
+                self.logger.info('BPA anytime: improved prediction after '+str(self.anytime_bpa.position)+'/'+str(len(self.anytime_bpa.candidates))+' nodes.')
+                self.apply_prediction(*prediction)
+            if self.anytime_bpa.done():
+                self.anytime_bpa = None
+
+    """
+    Maximum time the run loop can wait for a BGP message before executing background:
+    0 during a rebroadcast (the prefixes are streamed while no message arrives)
+    or while the search of bpa-anytime continues, IDLE_TIMEOUT while waiting for the encoding, for the prediction of the BPA
+    workers or for the end of the table load, and None if there is no work in
+    the background.
+    """
+    def idle_timeout(self):
+        if self.rebroadcast is not None:
+            return 0
+        if self.anytime_bpa is not None and self.current_burst is not None:
+            return 0
+        if self.next_encoding is not None:
+            return IDLE_TIMEOUT
+        if self.async_bpa is not None and self.current_burst is not None and self.async_bpa.waiting():
+            return IDLE_TIMEOUT
+        if self.background_encoding and self.encoding is None and len(self.rib.rib) > 0:
+            return IDLE_TIMEOUT
+        return None
+
+    """
+    Initialize the peer with the first BGP message received: peer id, logger and
+    connection with the global RIB.
+    """
+    def start(self, bgp_msg):
+        self.peer_id = bgp_msg.peer_id
+        self.peer_as = bgp_msg.peer_as
+        self.last_ts = bgp_msg.time
+        self.peer_ip = self.peer_id.split('-')[-1]
+
+        # The logger is global to the process, it already has its handler if the peer was hosted before (pool, replay)
+        self.logger = logging.getLogger('PeerLogger.'+str(self.peer_id))
+        self.logger.propagate = False
+        if len(self.logger.handlers) == 0:
+            peer_handler = logging.handlers.RotatingFileHandler(log_dir+'/peer_'+str(self.peer_id), maxBytes=200000000000000, backupCount=5)
+            peer_handler.setFormatter(formatter)
+            self.logger.addHandler(peer_handler)
+
+        self.logger.info('Peer_'+str(self.peer_id)+'_(AS'+str(str(self.peer_as))+')_started.')
+
+        if bgp_msg.as_path is not None and len(bgp_msg.as_path) > 0:
+            if self.peer_as != bgp_msg.as_path[0]:
+                self.logger.warning('Peer AS '+str(self.peer_as)+' and first AS '+str(bgp_msg.as_path[0])+' in AS path does not match. Setting first AS as peer AS.')
+                self.peer_as = bgp_msg.as_path[0]
+
+        # Make the connection with the global RIB
+        if self.global_rib is None:
+            rib_global_socket_address = '/tmp/'+self.socket_rib_name
+            self.socket.connect(rib_global_socket_address)
+        self.logger.info('Peer_'+str(self.peer_id)+'_(AS'+str(str(self.peer_as))+') connected with the global RIB.')
+
+    """
+    Process one BGP message.
+    Returns True if the inference algorithm must be executed (see run_bpa).
+    """
+    def process(self, bgp_msg):
+        G = self.G
+        G_W = self.G_W
+        W_queue = self.W_queue
+        rib = self.rib
+
+        if bgp_msg is None:
+            return False
+
+        self.bgp_msg = bgp_msg
+
+        if self.peer_id is None:
+            self.start(bgp_msg)
+
+        if self.peer_id != bgp_msg.peer_id:
+            self.logger.critical('Received a bgp_message with peer_id: '+str(bgp_msg.peer_id))
+
+        self.background()
+        self.last_msg_wall = time.time()
+
+        if bgp_msg.mtype == 'A':
+            # Update the set set of peer_as (useful when doing the naive solution)
+            if len(bgp_msg.as_path) > 0:
+                self.peer_as_set.add(bgp_msg.as_path[0])
+
+            # Update the RIB for this peer
+            old_path_id, path_id, pid = rib.update_path(bgp_msg)
+            self.old_as_path = self.paths.get(old_path_id)
+
+            # Replace the old as-path by the new one in the main graph for this prefix (if it has changed)
+            if old_path_id != path_id:
+                G.remove_path(old_path_id, pid=pid)
+                G.add_path(path_id, pid=pid)
+
+            # The AS paths advertised while an encoding is computed in the background are added to it
+            if self.next_encoding is not None and old_path_id != path_id:
+                self.next_encoding.advertisement(self.paths.get(path_id))
+
+            # Update the encoding, and send the fake advertisement to the global RIB
+            if self.encoding is not None:
+                self.encoding.advertisement_path(old_path_id, path_id)
+                if self.global_rib_enabled: send_fake_update(bgp_msg.prefix, self.peer_ip, bgp_msg.time, rib, self.encoding, self.socket, self.vmac_cache)
+            elif self.next_encoding is None and len(rib.rib) > self.run_encoding_threshold:
+                if self.background_encoding:
+                    self.start_encoding()
+                else:
+                    self.encoding = self.init_encoding()
 
-                    # Remove the old as-path in the main graph for this prefix
-                    G.remove(old_as_path, bgp_msg.prefix)
+            self.paths.release(old_path_id)
 
-                    # Add the new as-path in both the main graph and the graph of advertisments
-                    G.add(bgp_msg.as_path, bgp_msg.prefix)
+        elif bgp_msg.mtype == 'W':
+            # Create the encoding if not done yet
+            if self.encoding is None and self.next_encoding is None:
+                if self.background_encoding:
+                    self.start_encoding()
+                else:
+                    self.encoding = self.init_encoding()
 
-                    # Update the encoding, and send the fake advertisement to the global RIB
-                    if encoding is not None:
-                        encoding.advertisement(old_as_path, bgp_msg.as_path)
-                        if global_rib_enabled: send_fake_update(bgp_msg.prefix, peer_ip, bgp_msg.time, rib, encoding, socket)
-                    elif len(rib.rib) > run_encoding_threshold:
-                            encoding = init_encoding()
+            # Update the RIB for this peer
+            path_id, pid = rib.withdraw_path(bgp_msg)
+            bgp_msg.as_path = list(self.paths.get(path_id))
 
-                elif bgp_msg.mtype == 'W':
-                    # Create the encoding if not done yet
-                    if encoding is None:
-                        encoding = init_encoding()
+            # Remove the old as-path in the main graph for this prefix
+            G.remove_path(path_id, pid=pid)
 
-                    # Update the RIB for this peer
-                    bgp_msg.as_path = rib.withdraw(bgp_msg)
+            # Add the withdrawn as-path in the graph of withdraws
+            G_W.add(bgp_msg.as_path)
 
-                    # Remove the old as-path in the main graph for this prefix
-                    G.remove(bgp_msg.as_path, bgp_msg.prefix)
+            # Update the queue of withdraws
+            if bgp_msg.as_path != []:
+                W_queue.append(bgp_msg)
 
-                    # Add the withdrawn as-path in the graph of withdraws
-                    G_W.add(bgp_msg.as_path)
+            # Update the encoding
+            if self.encoding is not None: self.encoding.withdraw_path(path_id)
+            self.paths.release(path_id)
 
-                    # Update the queue of withdraws
-                    if bgp_msg.as_path != []:
-                        W_queue.append(bgp_msg)
+            # Send the withdrawal to the global RIB
+            if self.global_rib_enabled: send_fake_update(bgp_msg.prefix, self.peer_ip, bgp_msg.time, None, None, self.socket)
 
-                    # Update the encoding
-                    encoding.withdraw(bgp_msg.as_path)
 
-                    # Send the withdrawal to the global RIB
-                    if global_rib_enabled: send_fake_update(bgp_msg.prefix, peer_ip, bgp_msg.time, None, None, socket)
+        elif bgp_msg.mtype == 'CLOSE':
 
+            # CLOSE this peer. Clear all the topologies, ribs, queues, bursts, etc
+            if self.current_burst is not None:
+                best_edge_set, best_fm_score, best_TP, best_FP, best_FN = burst_prediction(self.current_burst, G, G_W, W_queue, self.p_w, self.r_w, self.bpa_algo, self.peer_as_set, self.bpa)
+                self.current_burst.fd_predicted.write('PREDICTION_END_CLOSE|'+self.bpa_algo+'|'+str(len(self.current_burst))+'|'+str(best_fm_score)+'|'+str(best_TP)+'|'+str(best_FN)+'|'+str(best_FP)+'\n')
+                self.current_burst.fd_predicted.write('PREDICTION_END_EDGE|')
+                res = ''
+                depth = 9999999999
+                for e in best_edge_set:
+                    depth = min(G_W.get_depth(e[0], e[1]), depth)
+                    res += str(e[0])+'-'+str(e[1])+','
 
-                elif bgp_msg.mtype == 'CLOSE':
+                self.current_burst.fd_predicted.write(res[:len(res)-1]+'|'+str(depth)+'\n')
 
-                    # CLOSE this peer. Clear all the topologies, ribs, queues, bursts, etc
-                    if current_burst is not None:
-                        best_edge_set, best_fm_score, best_TP, best_FP, best_FN = burst_prediction(current_burst, G, G_W, W_queue, p_w, r_w, bpa_algo, peer_as_set)
-                        current_burst.fd_predicted.write('PREDICTION_END_CLOSE|'+bpa_algo+'|'+str(len(current_burst))+'|'+str(best_fm_score)+'|'+str(best_TP)+'|'+str(best_FN)+'|'+str(best_FP)+'\n')
-                        current_burst.fd_predicted.write('PREDICTION_END_EDGE|')
-                        res = ''
-                        depth = 9999999999
-                        for e in best_edge_set:
-                            depth = min(G_W.get_depth(e[0], e[1]), depth)
-                            res += str(e[0])+'-'+str(e[1])+','
+                #G_W.draw_graph(peer_as)
 
-                        current_burst.fd_predicted.write(res[:len(res)-1]+'|'+str(depth)+'\n')
+                self.stop_burst(bgp_msg.time)
 
-                        #G_W.draw_graph(peer_as)
+            # Withdraw all the routes advertised by this peer
+            if self.global_rib_enabled:
+                for p in rib.rib:
+                    send_fake_update(p, self.peer_ip, -1, None, None, self.socket)
 
-                        current_burst.stop(bgp_msg.time)
-                        current_burst = None
+            self.logger.info('Received CLOSE. CLEANING the peer.')
 
-                    # Withdraw all the routes advertised by this peer
-                    if global_rib_enabled:
-                        for p in rib.rib:
-                            send_fake_update(p, peer_ip, -1, None, None, socket)
+            # Stop this peer
+            self.closed = True
+            return False
+        else:
+            self.logger.info(bgp_msg)
+
+        # Expire the withdrawals that have left the window. During a burst, the buckets of withdrawals expire one
+        # by one (oldest first), to find when the number of withdrawals goes below the end threshold
+        if self.current_burst is not None:
+            for bucket in W_queue.expire(bgp_msg.time):
+                self.current_burst.deleted_from_W_queue.extend(bucket.messages)
+                self.current_burst.deleted_buckets.append(bucket)
+
+                # Remove the current burst (if any) if it the size of the withdraws is lower than w_threshold (meaning it has finished)
+                if len(W_queue) < self.nb_withdrawals_burst_end:
+                    self.current_burst.last_ts = W_queue.expiry_time(bucket)
+
+                    # Execute BPA at the end of the burst if the burst is large enough
+                    best_edge_set, best_fm_score, best_TP, best_FN, best_FP = burst_prediction(self.current_burst, G, G_W, W_queue, self.p_w, self.r_w, self.bpa_algo, self.peer_as_set, self.bpa)
+                    self.current_burst.fd_predicted.write('PREDICTION_END|'+self.bpa_algo+'|'+str(len(self.current_burst))+'|'+str(best_fm_score)+'|'+str(best_TP)+'|'+str(best_FN)+'|'+str(best_FP)+'\n')
+                    self.current_burst.fd_predicted.write('PREDICTION_END_EDGE|')
+
+                    # Print some information about the prediction on the prediction file
+                    res = ''
+                    depth = 9999999999
+                    for e in best_edge_set:
+                        res += str(e[0])+'-'+str(e[1])+','
+                        depth = min(G_W.get_depth(e[0], e[1]), depth)
+                    self.current_burst.fd_predicted.write(res[:len(res)-1]+'|'+str(depth)+'\n')
+
+                    #G_W.draw_graph(peer_as, G, current_burst, outfile='as_graph_'+str(current_burst.start_time)+'.dot', threshold=500)
+
+                    # Update the graph of withdrawals (one removal per AS path of every bucket)
+                    for expired in self.current_burst.deleted_buckets:
+                        for as_path, count in expired.paths.iteritems():
+                            G_W.remove(as_path, count=count)
+                        W_queue.release(expired)
+
+                    self.stop_burst(bgp_msg.time)
+                    break
+            else:
+                self.current_burst.last_ts = bgp_msg.time
+
+        # Update the graph of withdraws.
+        if self.current_burst is None:
+            for bucket in W_queue.expire(bgp_msg.time):
+                for as_path, count in bucket.paths.iteritems():
+                    G_W.remove(as_path, count=count)
+                W_queue.release(bucket)
+
+        # Update the last timestamp seen
+        self.last_ts = bgp_msg.time
+
+        # Add the updates in the real prefixes set of the burst, if any
+        if self.current_burst is not None: #and not silent:
+            if bgp_msg.as_path != []:
+                self.old_as_path = bgp_msg.as_path if bgp_msg.mtype == 'W' else self.old_as_path
+                self.current_burst.add_real_prefix(bgp_msg.time, bgp_msg.prefix, bgp_msg.mtype, self.old_as_path)
+
+        # If we are not in the burst yet, we create the burst
+        if self.current_burst is None and len(W_queue) >= self.nb_withdrawals_burst_start:
+            self.current_burst = Burst(self.peer_id, bgp_msg.time, self.win_size, self.burst_outdir, self.encoding, W_queue, self.silent, self.win_resolution)
+            if self.bpa_algo == 'bpa-incremental':
+                self.bpa = IncrementalBPA(G, G_W, self.p_w, self.r_w)
+            self.next_bpa_execution = self.min_bpa_burst_size
+
+        # Print some log ...
+        if (bgp_msg.time > self.last_log_write) or bgp_msg.time-self.last_log_write >= 3600:
+            self.logger.info(str(int(bgp_msg.time))+'\t'+str(len(rib))+'\t'+str(len(W_queue)))
+            self.last_log_write = bgp_msg.time
+
+        # Execute BPA if there is a burst and
+        # i) the current burst is greater than the minimum required
+        # ii) we have wait the number of withdrawals required per cycle or the queue is empty
+        if self.current_burst is not None:
+            total_current_burst_size = len(self.current_burst)+self.nb_withdrawals_burst_start
+            if total_current_burst_size >= self.min_bpa_burst_size and total_current_burst_size > self.next_bpa_execution:#\
+                if self.nb_withdraws_per_cycle > 0 and total_current_burst_size < 12505:
+                    self.next_bpa_execution += self.nb_withdraws_per_cycle
+                else:
+                    self.next_bpa_execution = 999999999999
+                return True
 
-                    peer_logger.info('Received CLOSE. CLEANING the peer.')
+        return False
 
-                    # Stop this peer
-                    os.kill(os.getpid(), signal.SIGTERM)
-                else:
-                    peer_logger.info(bgp_msg)
-
-                # Make sure to compute start en end time of burst with a second granularity (only if ther is a burst)
-                if current_burst is not None:
-                    while (last_ts != bgp_msg.time):
-                        last_ts += 1
-
-                        # Update the graph of withdraws
-                        for w in W_queue.refresh_iter(last_ts):
-                            current_burst.deleted_from_W_queue.append(w)
-
-                        # Remove the current burst (if any) if it the size of the withdraws is lower than w_threshold (meaning it has finished)
-                        if len(W_queue) < nb_withdrawals_burst_end: #current_burst.is_expired(bgp_msg.time):
-                            # Execute BPA at the end of the burst if the burst is large enough
-                            best_edge_set, best_fm_score, best_TP, best_FN, best_FP = burst_prediction(current_burst, G, G_W, W_queue, p_w, r_w, bpa_algo, peer_as_set)
-                            current_burst.fd_predicted.write('PREDICTION_END|'+bpa_algo+'|'+str(len(current_burst))+'|'+str(best_fm_score)+'|'+str(best_TP)+'|'+str(best_FN)+'|'+str(best_FP)+'\n')
-                            current_burst.fd_predicted.write('PREDICTION_END_EDGE|')
-
-                            # Print some information about the prediction on the prediction file
-                            res = ''
-                            depth = 9999999999
-                            for e in best_edge_set:
-                                res += str(e[0])+'-'+str(e[1])+','
-                                depth = min(G_W.get_depth(e[0], e[1]), depth)
-                            current_burst.fd_predicted.write(res[:len(res)-1]+'|'+str(depth)+'\n')
-
-                            #G_W.draw_graph(peer_as, G, current_burst, outfile='as_graph_'+str(current_burst.start_time)+'.dot', threshold=500)
-
-                            # Update the graph of withdrawals
-                            for w in current_burst.deleted_from_W_queue:
-                                G_W.remove(w.as_path)
-
-                            current_burst.stop(bgp_msg.time)
-                            current_burst = None
-                            break
-                        else:
-                            current_burst.last_ts = last_ts
-
-                # Update the graph of withdraws.
-                if current_burst is None:
-                    for w in W_queue.refresh_iter(bgp_msg.time):
-                        G_W.remove(w.as_path)
-
-                # Update the last timestamp seen
-                last_ts = bgp_msg.time
-
-                # Add the updates in the real prefixes set of the burst, if any
-                if current_burst is not None: #and not silent:
-                    if bgp_msg.as_path != []:
-                        old_as_path = bgp_msg.as_path if bgp_msg.mtype == 'W' else old_as_path
-                        current_burst.add_real_prefix(bgp_msg.time, bgp_msg.prefix, bgp_msg.mtype, old_as_path)
-
-                # If we are not in the burst yet, we create the burst
-                if current_burst is None and len(W_queue) >= nb_withdrawals_burst_start:
-                    current_burst = Burst(peer_id, bgp_msg.time, win_size, burst_outdir, encoding, W_queue, silent)
-                    next_bpa_execution = min_bpa_burst_size
-
-                # Print some log ...
-                if (bgp_msg.time > last_log_write) or bgp_msg.time-last_log_write >= 3600:
-                    peer_logger.info(str(int(bgp_msg.time))+'\t'+str(len(rib))+'\t'+str(len(W_queue)))
-                    last_log_write = bgp_msg.time
-
-                # Execute BPA if there is a burst and
-                # i) the current burst is greater than the minimum required
-                # ii) we have wait the number of withdrawals required per cycle or the queue is empty
-                if current_burst is not None:
-                    total_current_burst_size = len(current_burst)+nb_withdrawals_burst_start
-                    if total_current_burst_size >= min_bpa_burst_size and total_current_burst_size > next_bpa_execution:#\
-                        if nb_withdraws_per_cycle > 0 and total_current_burst_size < 12505:
-                            next_bpa_execution += nb_withdraws_per_cycle
-                        else:
-                            next_bpa_execution = 999999999999
-                        break
+    """
+    Run the inference algorithm on the current burst, and inform the global RIB
+    about the failed links found. With bpa_async, the workers receive a snapshot
+    of the topologies and the result is applied later on (see process).
+    """
+    def run_bpa(self):
+        G = self.G
+        G_W = self.G_W
+        current_burst = self.current_burst
 
         #print ('Queue size: '+str(len(rib))+'\t'+str(len(W_queue))+'\t'+str(len(current_burst)+nb_withdrawals_burst_start))
 
         if current_burst is not None:
+            if self.bpa_async:
+                if self.async_bpa is None:
+                    self.async_bpa = AsyncBPA(self.p_w, self.r_w)
+                self.async_bpa.submit(len(current_burst), G, G_W, len(self.W_queue)+len(current_burst.deleted_from_W_queue))
+            elif self.bpa_algo == 'bpa-anytime':
+                # Apply the best set found within the budget, the search continues with the next messages
+                current_burst.prediction_done = True
+                self.anytime_bpa = AnytimeBPA(G, G_W, len(self.W_queue)+len(current_burst.deleted_from_W_queue), self.p_w, self.r_w)
+                self.apply_prediction(*self.anytime_bpa.run(self.bpa_budget/1000. if self.bpa_budget is not None else None))
+                if self.anytime_bpa.done():
+                    self.anytime_bpa = None
+            else:
+                # Compute the set of edges with the highest FM score
+                self.apply_prediction(*burst_prediction(current_burst, G, G_W, self.W_queue, self.p_w, self.r_w, self.bpa_algo, self.peer_as_set, self.bpa))
+
+    """
+    Inform the global RIB about the failed links predicted for the current burst.
+    """
+    def apply_prediction(self, best_edge_set, best_fm_score, best_TP, best_FP, best_FN):
+        G = self.G
+        G_W = self.G_W
+        encoding = self.encoding
+        current_burst = self.current_burst
+
+        # The encoding may still be computed in the background
+        if encoding is None:
+            self.logger.warning('Prediction not applied, the encoding is not computed yet.')
+            return
 
-            # Compute the set of edges with the highest FM score
-            best_edge_set, best_fm_score, best_TP, best_FP, best_FN = burst_prediction(current_burst, G, G_W, W_queue, p_w, r_w, bpa_algo, peer_as_set)
+        if current_burst is not None:
             # Load that set in the burst
-            if not silent: burst_add_edge(current_burst, rib, encoding, bgp_msg.time, best_edge_set, G, G_W, W_queue, silent)
+            if not self.silent: burst_add_edge(current_burst, self.rib, encoding, self.bgp_msg.time, best_edge_set, G, G_W, self.W_queue, self.silent)
 
             # Inform the global RIB about the set of failed links
             for e in best_edge_set:
@@ -440,11 +722,11 @@ run_encoding_threshold=1000000, global_rib_enabled=True, silent=False):
                                         vmac_partial += '0' * encoding.mapping[i].nb_bytes
                                         bitmask_partial += '0' * encoding.mapping[i].nb_bytes
 
-                            if global_rib_enabled:
-                                socket.send('FR|'+peer_ip+'|'+vmac_partial+'|'+bitmask_partial+'|'+str(d)+'|'+str(last_ts)+'\n')
+                            if self.global_rib_enabled:
+                                self.socket.send('FR|'+self.peer_ip+'|'+vmac_partial+'|'+bitmask_partial+'|'+str(d)+'|'+str(self.last_ts)+'\n')
 
             # Print information about the perdiction in the predicted file
-            current_burst.fd_predicted.write('PREDICTION|'+bpa_algo+'|'+str(len(current_burst))+'|'+str(best_fm_score)+'|'+str(best_TP)+'|'+str(best_FP)+'|'+str(best_FN)+'\n')
+            current_burst.fd_predicted.write('PREDICTION|'+self.bpa_algo+'|'+str(len(current_burst))+'|'+str(best_fm_score)+'|'+str(best_TP)+'|'+str(best_FP)+'|'+str(best_FN)+'\n')
             current_burst.fd_predicted.write('PREDICTION_EDGE|')
             res = ''
             depth = 9999999999
@@ -452,3 +734,86 @@ run_encoding_threshold=1000000, global_rib_enabled=True, silent=False):
                 depth = min(G_W.get_depth(e[0], e[1]), depth)
                 res += str(e[0])+'-'+str(e[1])+','
             current_burst.fd_predicted.write(res[:len(res)-1]+'|'+str(depth)+'\n')
+
+    """
+    Stop the peer: close the current burst (if any) and the connection with the global RIB.
+    """
+    def stop(self):
+        if self.current_burst is not None:
+            self.stop_burst(self.bgp_msg.time)
+
+        if self.async_bpa is not None:
+            self.async_bpa.stop()
+            self.async_bpa = None
+
+        if self.next_encoding is not None:
+            self.next_encoding.stop()
+            self.next_encoding = None
+
+        self.logger.info('VMAC cache '+str(self.vmac_cache))
+
+        self.socket.close()
+
+    """
+    Stop the current burst.
+    """
+    def stop_burst(self, ts):
+        self.current_burst.stop(ts)
+        self.current_burst = None
+
+        if self.bpa is not None:
+            self.bpa.detach()
+            self.bpa = None
+
+        if self.async_bpa is not None:
+            self.async_bpa.reset()
+
+        self.anytime_bpa = None
+
+
+"""
+The main function executed when launching a new peer process.
+queue           is the shared channel between the main process and the peer processes
+The other parameters are the parameters of Peer.
+"""
+def run_peer(queue, *args):
+
+    try:
+        os.nice(-20)
+    except OSError:
+        peer_logger.info('Cannot change the nice.')
+
+    peer = Peer(*args)
+
+    # Last time (wall clock) the peer wrote the transport statistics in the log file
+    last_stats_write = time.time()
+
+    # Exit properly when receiving SIGINT
+    def signal_handler(signal, frame):
+        peer.stop()
+        peer.logger.info('Transport '+str(queue.receiver_stats))
+
+        peer.logger.info('Received SIGTERM. Exiting.')
+
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    # The handler of the main process is inherited, the children of the peer (e.g., background encoding) are not peers
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+    while True:
+        bgp_msg = queue.get(peer.idle_timeout())
+
+        if bgp_msg is None:
+            peer.background()
+        elif peer.process(bgp_msg):
+            peer.run_bpa()
+
+        if peer.closed:
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        if time.time() - last_stats_write >= 60:
+            peer.logger.info('Transport '+str(queue.receiver_stats))
+            peer.logger.info('VMAC cache '+str(peer.vmac_cache))
+            last_stats_write = time.time()
@@ -10,8 +10,9 @@ from copy import deepcopy
 import logging.handlers
 import multiprocessing
 import string
+import socket
 
-from bgp_messages import parse, BGPMessagesQueue
+from bgp_messages import parse, BGPMessagesWindow
 from rib import RIBPeer
 from burst import Burst
 
@@ -41,124 +42,203 @@ def peer_bpavalidation_init_logger(logdir_name):
 
 
 """
-The main function executed when launching a new peer.
-queue           is the shared queue between the main process and the peer processes
+The state of one peer used to validate BPA: its RIB, its queue of updates
+and the current burst (if any). Several peers can live in the same process.
 win_size        is the window_size
 nb_withdrawals_burst_start     the number of withdrawals we need to receive in last 5ec to start the burst
 nb_withdrawals_burst_end        the number of withdrawals we need to receive in last 5ec to end the burst
 min_bpa_burst_size  Minimum burst size before starting to run BPA
 burst_outdir    where to store information about the bursts (silent needs to False)
+socket_rib_name name of the socket of the global RIB (not used, the validation does not talk to the global RIB)
 nb_withdraws_per_cycle After how many new withdrawals BPA needs to run_peer
 silent          print output in files to get information. To speed-up the algo, set to True.
 naive           Use the naive approach if True
+topology        not used (the validation does not build the AS topologies)
+bpa_async       not used (the validation does not run BPA)
+bpa_budget      not used (the validation does not run BPA)
+win_resolution  resolution of the window (in seconds)
+background_encoding not used (the validation does not compute the encoding)
+encoding_period not used (the validation does not compute the encoding)
+global_rib      not used (see socket_rib_name)
 """
-def run_peer_bpavalidation(queue, win_size, nb_withdrawals_burst_start, \
-nb_withdrawals_burst_end, min_bpa_burst_size, burst_outdir, \
-nb_withdraws_per_cycle=100, p_w=1, r_w=1, bpa_algo=False, nb_bits_aspath=33, \
-run_encoding_threshold=1000000, global_rib_enabled=True, silent=False):
+class PeerBPAValidation:
 
-    import socket
+    def __init__(self, win_size, nb_withdrawals_burst_start, \
+    nb_withdrawals_burst_end, min_bpa_burst_size, burst_outdir, socket_rib_name, \
+    nb_withdraws_per_cycle=100, p_w=1, r_w=1, bpa_algo=False, nb_bits_aspath=33, \
+    run_encoding_threshold=1000000, global_rib_enabled=True, silent=False, topology='networkx', bpa_async=False, bpa_budget=5, win_resolution=1, background_encoding=False, encoding_period=3600, global_rib=None):
+
+        self.win_size = win_size
+        self.nb_withdrawals_burst_start = nb_withdrawals_burst_start
+        self.nb_withdrawals_burst_end = nb_withdrawals_burst_end
+        self.burst_outdir = burst_outdir
+        self.silent = silent
+
+        # Logger of this peer (the main peer logger until the peer id is known)
+        self.logger = peer_logger
+
+        # Last time the peer wrote the rib and queue size in the log file
+        self.last_log_write = 0
+
+        # Socket connected to the global RIB
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        # Current burst (if any)
+        self.current_burst = None
+
+        self.peer_id = None
+        self.peer_as = None
+
+        # Create the RIB for this peer
+        self.rib = RIBPeer()
+
+        self.U_queue = BGPMessagesWindow(win_size, win_resolution) # Window of Updates (advertisement or withdrawals)
+
+        # Last BGP message processed
+        self.bgp_msg = None
+        self.last_ts = 0
+
+        # Never set, the validation keeps running until it is killed
+        self.closed = False
+
+    """
+    Process one BGP message.
+    Returns True if the inference algorithm must be executed, which never
+    happens when validating BPA.
+    """
+    def process(self, bgp_msg):
+        rib = self.rib
+        U_queue = self.U_queue
+
+        if bgp_msg is None:
+            return False
+
+        self.bgp_msg = bgp_msg
+
+        if self.peer_id is None:
+            self.peer_id = bgp_msg.peer_id
+            self.peer_as = bgp_msg.peer_as
+            self.last_ts = bgp_msg.time
+            self.last_log_write = bgp_msg.time
+
+            # The logger is global to the process, it already has its handler if the peer was hosted before (pool, replay)
+            self.logger = logging.getLogger('PeerLogger.'+str(self.peer_id))
+            self.logger.propagate = False
+            if len(self.logger.handlers) == 0:
+                peer_handler = logging.handlers.RotatingFileHandler(log_dir+'/peer_'+str(self.peer_id), maxBytes=200000000000000, backupCount=5)
+                peer_handler.setFormatter(formatter)
+                self.logger.addHandler(peer_handler)
+
+            self.logger.info('Peer_'+str(self.peer_id)+'_(AS'+str(str(self.peer_as))+')_started.')
+
+            if bgp_msg.as_path is not None and len(bgp_msg.as_path) > 0:
+                if self.peer_as != bgp_msg.as_path[0]:
+                    self.logger.warning('Peer AS '+str(self.peer_as)+' and first AS '+str(bgp_msg.as_path[0])+' in AS path does not match. Setting first AS as peer AS.')
+                    self.peer_as = bgp_msg.as_path[0]
+
+        if self.peer_id != bgp_msg.peer_id:
+            self.logger.critical('Received a bgp_message with peer_id: '+str(bgp_msg.peer_id))
+
+        if bgp_msg.mtype == 'A':
+            # Update the RIB for this peer
+            bgp_msg.as_path = rib.update(bgp_msg)
+
+            # Update the queue of updates
+            if bgp_msg.as_path != []:
+                U_queue.append(bgp_msg)
+
+        elif bgp_msg.mtype == 'W':
+            # Update the RIB for this peer
+            bgp_msg.as_path = rib.withdraw(bgp_msg)
+
+            # Update the queue of withdraws
+            if bgp_msg.as_path != []:
+                U_queue.append(bgp_msg)
+
+        else:
+            self.logger.info(bgp_msg)
+
+        # Expire the updates that have left the window
+        U_queue.refresh(bgp_msg.time)
+
+        # Print the size of the queue (at most once per second)
+        if bgp_msg.time - self.last_log_write >= 1:
+            self.logger.info(str(int(bgp_msg.time))+' '+str(len(rib))+' '+str(len(U_queue)))
+            self.last_log_write = bgp_msg.time
+
+        # Stop the burst if the size of the queue is lower than the threshold
+        if self.current_burst is not None:
+            if len(U_queue) < self.nb_withdrawals_burst_end:
+                self.current_burst.stop(bgp_msg.time)
+                self.current_burst = None
+            else:
+                self.current_burst.add_real_prefix(bgp_msg.time, bgp_msg.prefix, bgp_msg.mtype, bgp_msg.as_path)
+
+        # Create a burst if the size of the is higher than the threshold
+        if self.current_burst is None:
+            if len(U_queue) > self.nb_withdrawals_burst_start:
+                burst_start_time = U_queue[100].time if len(U_queue) > 100 else U_queue[0].time
+                self.current_burst = Burst(self.peer_id, bgp_msg.time, self.win_size, self.burst_outdir, burst_start_time, self.silent)
+
+        return False
+
+    def run_bpa(self):
+        pass
+
+    """
+    There is no work in the background (see Peer.idle_timeout).
+    """
+    def idle_timeout(self):
+        return None
+
+    def background(self):
+        pass
+
+    """
+    Stop the peer: close the current burst (if any) and the socket.
+    """
+    def stop(self):
+        if self.current_burst is not None:
+            self.current_burst.stop(self.bgp_msg.time)
+            self.current_burst = None
+
+        self.socket.close()
+
+
+"""
+The main function executed when launching a new peer process.
+queue           is the shared channel between the main process and the peer processes
+The other parameters are the parameters of PeerBPAValidation.
+"""
+def run_peer_bpavalidation(queue, *args):
 
     try:
         os.nice(-20)
     except OSError:
         peer_logger.info('Cannot change the nice.')
 
-    # Last time the peer wrote the rib and queue size in the log file
-    last_log_write = 0
+    peer = PeerBPAValidation(*args)
 
-    # Socket connected to the global RIB
-    socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-
-    # Current burst (if any)
-    current_burst = None
+    # Last time (wall clock) the peer wrote the transport statistics in the log file
+    last_stats_write = time.time()
 
     # Exit properly when receiving SIGINT
     def signal_handler(signal, frame):
-        if current_burst is not None:
-            current_burst.stop(bgp_msg.time)
-
-        socket.close()
-        peer_logger.info('Received SIGTERM. Exiting.')
+        peer.stop()
+        peer.logger.info('Transport '+str(queue.receiver_stats))
+        peer.logger.info('Received SIGTERM. Exiting.')
         sys.exit(0)
 
     signal.signal(signal.SIGTERM, signal_handler)
 
-    peer_id = None
-    peer_as = None
-
-    # Create the RIB for this peer
-    rib = RIBPeer()
-
-    U_queue = BGPMessagesQueue(win_size) # Queue of Updates (advertisement or withdrawals)
-
-    last_ts = 0
+    # The handler of the main process is inherited, the children of the peer (e.g., background encoding) are not peers
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
 
     while True:
+        bgp_msg = queue.get()
+
+        peer.process(bgp_msg)
 
-        while True:
-            bgp_msg = queue.get()
-
-            if bgp_msg is not None:
-                if peer_id is None:
-                    peer_id = bgp_msg.peer_id
-                    peer_as = bgp_msg.peer_as
-                    peer_as_set = set()
-                    last_ts = bgp_msg.time
-                    last_log_write = bgp_msg.time
-                    peer_ip = peer_id.split('-')[-1]
-
-                    peer_handler = logging.handlers.RotatingFileHandler(log_dir+'/peer_'+str(peer_id), maxBytes=200000000000000, backupCount=5)
-                    peer_handler.setFormatter(formatter)
-                    peer_logger.removeHandler(handler)
-                    peer_logger.addHandler(peer_handler)
-
-                    peer_logger.info('Peer_'+str(peer_id)+'_(AS'+str(str(peer_as))+')_started.')
-
-                    if bgp_msg.as_path is not None and len(bgp_msg.as_path) > 0:
-                        if peer_as != bgp_msg.as_path[0]:
-                            peer_logger.warning('Peer AS '+str(peer_as)+' and first AS '+str(bgp_msg.as_path[0])+' in AS path does not match. Setting first AS as peer AS.')
-                            peer_as = bgp_msg.as_path[0]
-
-                if peer_id != bgp_msg.peer_id:
-                    peer_logger.critical('Received a bgp_message with peer_id: '+str(bgp_msg.peer_id))
-
-                if bgp_msg.mtype == 'A':
-                    # Update the RIB for this peer
-                    bgp_msg.as_path = rib.update(bgp_msg)
-
-                    # Update the queue of updates
-                    if bgp_msg.as_path != []:
-                        U_queue.append(bgp_msg)
-
-                elif bgp_msg.mtype == 'W':
-                    # Update the RIB for this peer
-                    bgp_msg.as_path = rib.withdraw(bgp_msg)
-
-                    # Update the queue of withdraws
-                    if bgp_msg.as_path != []:
-                        U_queue.append(bgp_msg)
-
-                else:
-                    peer_logger.info(bgp_msg)
-
-                # Print size of hte queue for each second
-                while last_log_write < bgp_msg.time:
-                    # Refresh the queue
-                    U_queue.refresh(last_log_write)
-                    peer_logger.info(str(int(last_log_write))+' '+str(len(rib))+' '+str(len(U_queue)))
-                    last_log_write += 1
-
-                # Stop the burst if the size of the queue is lower than the threshold
-                if current_burst is not None:
-                    if len(U_queue) < nb_withdrawals_burst_end:
-                        current_burst.stop(bgp_msg.time)
-                        current_burst = None
-                    else:
-                        current_burst.add_real_prefix(bgp_msg.time, bgp_msg.prefix, bgp_msg.mtype, bgp_msg.as_path)
-
-                # Create a burst if the size of the is higher than the threshold
-                if current_burst is None:
-                    if len(U_queue) > nb_withdrawals_burst_start:
-                        burst_start_time = U_queue[100].time if len(U_queue) > 100 else U_queue[0].time
-                        current_burst = Burst(peer_id, bgp_msg.time, win_size, burst_outdir, burst_start_time, silent)
+        if time.time() - last_stats_write >= 60:
+            peer.logger.info('Transport '+str(queue.receiver_stats))
+            last_stats_write = time.time()
@@ -0,0 +1,350 @@
+import sys
+import os
+import time
+import signal
+import logging
+import struct
+import hashlib
+import bisect
+import multiprocessing
+
+from peer import IDLE_TIMEOUT
+
+"""
+Consistent hashing of the peer ids on the workers, with bounded loads.
+Every worker is placed nb_replicas times on the ring. A peer goes to the first
+worker found clockwise from the hash of its peer id whose load is below
+(1+epsilon) times the average load, so that a few heavy peers hashed close to
+each other do not all end up on the same worker.
+The load of a worker is the sum of the weights of the peers assigned to it.
+"""
+class HashRing:
+
+    def __init__(self, nodes, nb_replicas=100, epsilon=0.25):
+        self.nodes = list(nodes)
+        self.epsilon = epsilon
+        self.load = {}
+
+        self.ring = []
+        for node in self.nodes:
+            self.load[node] = 0.
+            for i in range(0, nb_replicas):
+                self.ring.append((self.hash(str(node)+'-'+str(i)), node))
+        self.ring.sort()
+        self.hashes = [h for h, node in self.ring]
+
+    @staticmethod
+    def hash(key):
+        return struct.unpack('>Q', hashlib.md5(key).digest()[:8])[0]
+
+    """
+    Returns the maximum load a worker can have if a new peer of weight _weight_
+    is added.
+    """
+    def capacity(self, weight=1.):
+        return (1+self.epsilon) * (sum(self.load.values())+weight) / len(self.nodes)
+
+    """
+    Returns the worker to use for the key, without modifying the loads.
+    """
+    def lookup(self, key, weight=1.):
+        capacity = self.capacity(weight)
+        start = bisect.bisect(self.hashes, self.hash(key))
+
+        for i in range(0, len(self.ring)):
+            node = self.ring[(start+i) % len(self.ring)][1]
+            if self.load[node] < capacity:
+                return node
+
+        return self.ring[start % len(self.ring)][1]
+
+    def add_load(self, node, weight):
+        self.load[node] += weight
+
+    def remove_load(self, node, weight):
+        self.load[node] = max(0., self.load[node]-weight)
+
+    """
+    Returns True if the most loaded worker is above the bounded load.
+    """
+    def is_skewed(self):
+        return max(self.load.values()) > self.capacity(0)
+
+    """
+    Returns the worker with the lowest load.
+    """
+    def least_loaded(self):
+        return min(self.nodes, key=lambda node: self.load[node])
+
+
+"""
+Fixed pool of worker processes, each of them hosting the state machines of
+many peers. This replaces the one process per peer model when there are hundreds
+of BGP sessions, most of them idle.
+
+The dispatcher calls put for every BGP message: the first message of a peer
+assigns the peer to a worker (see HashRing), and a CLOSE message releases it.
+The weight of a peer is its message rate (EWMA, in messages per second),
+and is kept after a CLOSE so that a peer reconnecting is placed according to
+its past load. The state of a peer is never moved from a worker to another
+(it holds the connection with the global RIB and the files of the current burst),
+rebalancing thus happens when peers are (re)assigned: while the load is skewed
+(see update_load), the new and reconnecting peers go to the least loaded worker.
+
+The workers which die are restarted by flush_expired, called from the main loop
+(the SIGCHLD handler only calls worker_exited).
+
+nb_workers      the number of worker processes
+target          the function executed by a worker (see run_peer_worker)
+args            the arguments given to target after the channel
+new_channel     function returning a new channel (BatchChannel or RingChannel)
+"""
+class PeerPool:
+
+    def __init__(self, nb_workers, target, args, new_channel, logger=None, epsilon=0.25, load_period=10):
+        self.target = target
+        self.args = args
+        self.new_channel = new_channel
+        self.logger = logger
+        self.load_period = load_period
+
+        self.ring = HashRing(range(0, nb_workers), epsilon=epsilon)
+
+        # peer_id -> worker
+        self.assignment = {}
+        # peer_id -> weight (messages per second)
+        self.peer_weight = {}
+        # peer_id -> number of messages since the last load update
+        self.peer_counter = {}
+        self.last_load_update = time.time()
+        # True if the load of the workers was skewed at the last update
+        self.skewed = False
+
+        # True if a child process exited since the last check of the workers
+        self.exited = False
+
+        self.workers = [None] * nb_workers
+        self.channels = [None] * nb_workers
+        for i in range(0, nb_workers):
+            self.start_worker(i)
+
+    def start_worker(self, i):
+        self.channels[i] = self.new_channel()
+        self.workers[i] = multiprocessing.Process(target=self.target, args=(self.channels[i],)+tuple(self.args))
+        self.workers[i].start()
+        self.channels[i].process = self.workers[i]
+
+        if self.logger is not None:
+            self.logger.info('Started peer worker '+str(i))
+
+    """
+    Returns the worker hosting the peer, and assign it if it is a new peer.
+    """
+    def get_worker(self, peer_id):
+        worker = self.assignment.get(peer_id)
+        if worker is None:
+            weight = self.peer_weight.get(peer_id, 1.)
+            if self.skewed:
+                worker = self.ring.least_loaded()
+            else:
+                worker = self.ring.lookup(peer_id, weight)
+            self.ring.add_load(worker, weight)
+            self.assignment[peer_id] = worker
+            self.peer_weight[peer_id] = weight
+            self.peer_counter[peer_id] = 0
+
+            if self.logger is not None:
+                self.logger.info('Peer '+peer_id+' assigned to worker '+str(worker))
+
+        return worker
+
+    """
+    Returns the channel towards the worker hosting the peer (None if the peer is not assigned).
+    """
+    def channel_of(self, peer_id):
+        worker = self.assignment.get(peer_id)
+        return self.channels[worker] if worker is not None else None
+
+    def release(self, peer_id):
+        worker = self.assignment.pop(peer_id, None)
+        if worker is not None:
+            self.ring.remove_load(worker, self.peer_weight[peer_id])
+
+    """
+    Send a BGP message to the worker of its peer. If the worker cannot receive
+    it (IOError, e.g., the worker died while its ring was full), the worker is
+    restarted and the message is lost.
+    """
+    def put(self, bgp_msg):
+        worker = self.get_worker(bgp_msg.peer_id)
+        channel = self.channels[worker]
+        try:
+            channel.put(bgp_msg)
+        except IOError, e:
+            # Only restart the worker if it has not been restarted in the meantime
+            if channel is self.channels[worker]:
+                if self.logger is not None:
+                    self.logger.error('Peer worker '+str(worker)+' cannot receive messages ('+str(e)+'), restarting it.')
+                self.workers[worker].terminate()
+                self.workers[worker].join()
+                self.check_workers()
+            return
+        self.peer_counter[bgp_msg.peer_id] += 1
+
+        if bgp_msg.mtype == 'CLOSE':
+            # Make sure the CLOSE is not delayed, the peer might reconnect on another worker
+            self.channels[worker].flush()
+            self.release(bgp_msg.peer_id)
+
+    def flush_expired(self, now):
+        if self.exited:
+            self.exited = False
+            self.check_workers()
+
+        if now - self.last_load_update >= self.load_period:
+            self.update_load(now)
+
+        timeout = None
+        for channel in self.channels:
+            remaining = channel.flush_expired(now)
+            if remaining is not None and (timeout is None or remaining < timeout):
+                timeout = remaining
+        return timeout
+
+    """
+    Update the weight of every peer with the number of messages received in
+    the last period, and the load of the workers accordingly.
+    """
+    def update_load(self, now, alpha=0.5):
+        period = max(now - self.last_load_update, 1e-3)
+        self.last_load_update = now
+
+        for worker in self.ring.load:
+            self.ring.load[worker] = 0.
+
+        for peer_id, counter in self.peer_counter.items():
+            self.peer_weight[peer_id] = alpha * (1. + counter/period) + (1-alpha) * self.peer_weight[peer_id]
+            self.peer_counter[peer_id] = 0
+            if peer_id in self.assignment:
+                self.ring.add_load(self.assignment[peer_id], self.peer_weight[peer_id])
+
+        self.skewed = self.ring.is_skewed()
+        if self.logger is not None and self.skewed:
+            self.logger.warning('Peer workers load is skewed, new peers go to the least loaded worker: '+', '.join('%d:%.1f' % (w, l) for w, l in sorted(self.ring.load.items())))
+
+    """
+    Called by the SIGCHLD handler. The workers are checked later on by
+    flush_expired, in the main loop, rather than forking in the handler.
+    """
+    def worker_exited(self):
+        self.exited = True
+
+    """
+    Restart the workers which died. The peers they were hosting are released,
+    they will be assigned again when they send their next message.
+    """
+    def check_workers(self):
+        for i in range(0, len(self.workers)):
+            if self.workers[i] is not None and not self.workers[i].is_alive():
+                if self.logger is not None:
+                    self.logger.error('Peer worker '+str(i)+' died. Transport '+str(self.channels[i].sender_stats))
+
+                for peer_id, worker in self.assignment.items():
+                    if worker == i:
+                        self.release(peer_id)
+
+                self.channels[i].close()
+                self.start_worker(i)
+
+    def stats(self):
+        res = []
+        for i in range(0, len(self.workers)):
+            nb_peers = len([w for w in self.assignment.values() if w == i])
+            res.append('worker_'+str(i)+' peers:'+str(nb_peers)+' load:'+('%.1f' % self.ring.load[i])+' '+str(self.channels[i].sender_stats))
+        return res
+
+    def terminate(self):
+        for worker in self.workers:
+            try:
+                worker.terminate()
+            except:
+                pass
+
+
+"""
+The main function executed by a worker of the pool.
+queue           is the channel between the main process and this worker
+peer_class      the class of the peers hosted (Peer or PeerBPAValidation)
+The other parameters are the parameters of peer_class.
+"""
+def run_peer_worker(queue, peer_class, *args):
+
+    logger = logging.getLogger('PeerLogger')
+
+    try:
+        os.nice(-20)
+    except OSError:
+        logger.info('Cannot change the nice.')
+
+    # peer_id -> peer state machine
+    peers = {}
+
+    # Last time (wall clock) the worker wrote the transport statistics in the log file
+    last_stats_write = time.time()
+
+    # Exit properly when receiving SIGTERM
+    def signal_handler(signal, frame):
+        for peer in peers.values():
+            peer.stop()
+        logger.info('Worker '+str(os.getpid())+' transport '+str(queue.receiver_stats))
+        logger.info('Worker '+str(os.getpid())+' received SIGTERM. Exiting.')
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    # The handler of the main process is inherited, the children of the peer (e.g., background encoding) are not peers
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+    # Peers with work in the background (see Peer.idle_timeout). It is executed when
+    # no message arrives within timeout seconds, and at least every IDLE_TIMEOUT seconds.
+    waiting = set()
+    timeout = None
+    last_background = time.time()
+
+    while True:
+        bgp_msg = queue.get(timeout)
+
+        if bgp_msg is not None:
+            peer = peers.get(bgp_msg.peer_id)
+            if peer is None:
+                peer = peer_class(*args)
+                peers[bgp_msg.peer_id] = peer
+
+            if peer.process(bgp_msg):
+                peer.run_bpa()
+
+            if peer.closed:
+                peer.stop()
+                peer.logger.info('Peer stopped, '+str(len(peers)-1)+' peers left in worker '+str(os.getpid())+'.')
+                del peers[bgp_msg.peer_id]
+                waiting.discard(bgp_msg.peer_id)
+            elif peer.idle_timeout() is not None:
+                waiting.add(bgp_msg.peer_id)
+                if timeout is None:
+                    timeout = IDLE_TIMEOUT
+
+        if len(waiting) > 0 and (bgp_msg is None or time.time() - last_background >= IDLE_TIMEOUT):
+            timeout = None
+            for peer_id in list(waiting):
+                peer = peers[peer_id]
+                peer.background()
+                peer_timeout = peer.idle_timeout()
+                if peer_timeout is None:
+                    waiting.discard(peer_id)
+                elif timeout is None or peer_timeout < timeout:
+                    timeout = peer_timeout
+            last_background = time.time()
+
+        if time.time() - last_stats_write >= 60:
+            logger.info('Worker '+str(os.getpid())+' peers:'+str(len(peers))+' transport '+str(queue.receiver_stats))
+            last_stats_write = time.time()
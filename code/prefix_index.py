@@ -0,0 +1,215 @@
+import bisect
+from array import array
+
+"""
+Compact index of the prefixes traversing every edge of an AS topology.
+
+The prefixes of a peer get dense integer ids (PrefixIds), and every edge keeps
+the ids of its prefixes in a Bitmap instead of a set of prefixes. A Bitmap is
+split in chunks of 65536 ids (as in Roaring bitmaps): a chunk with few ids is a
+sorted array of 16-bit integers (2 bytes per id), a chunk with more than
+ARRAY_MAX ids is a plain bitmap of 8 kB (1 bit per possible id). A set costs
+several tens of bytes per element instead.
+"""
+
+ARRAY_MAX = 4096
+DENSE_SIZE = 8192
+
+# Position of the bits set in every byte
+BYTE_BITS = [tuple(i for i in range(0, 8) if byte & (1 << i)) for byte in range(0, 256)]
+
+
+"""
+Dense integer ids of the prefixes of a peer. The RIB of the peer gives an id to
+a prefix when it is advertised, keeps it next to the path id of the prefix, and
+releases it when the prefix is withdrawn (see rib.RIBPeer). There is thus no
+prefix -> id dictionary besides the RIB, and the ids are reused: they stay as
+dense as the prefixes currently in the RIB, whatever the churn.
+"""
+class PrefixIds:
+
+    def __init__(self):
+        self.prefixes = []
+        self.free = []
+        self.nb_ids = 0
+
+    """
+    Returns a new id for a prefix.
+    """
+    def new(self, prefix):
+        if len(self.free) > 0:
+            pid = self.free.pop()
+            self.prefixes[pid] = prefix
+        else:
+            pid = len(self.prefixes)
+            self.prefixes.append(prefix)
+        self.nb_ids += 1
+        return pid
+
+    def release(self, pid):
+        self.prefixes[pid] = None
+        self.free.append(pid)
+        self.nb_ids -= 1
+
+    def prefix(self, pid):
+        return self.prefixes[pid]
+
+    def __len__(self):
+        return self.nb_ids
+
+
+"""
+A chunk with more than ARRAY_MAX ids: one bit per possible id.
+"""
+class DenseChunk(object):
+    __slots__ = ['bits', 'count']
+
+    def __init__(self, values=()):
+        self.bits = bytearray(DENSE_SIZE)
+        self.count = 0
+        for low in values:
+            self.add(low)
+
+    def add(self, low):
+        mask = 1 << (low & 7)
+        if not self.bits[low >> 3] & mask:
+            self.bits[low >> 3] |= mask
+            self.count += 1
+            return True
+        return False
+
+    def remove(self, low):
+        mask = 1 << (low & 7)
+        if self.bits[low >> 3] & mask:
+            self.bits[low >> 3] &= ~mask & 0xff
+            self.count -= 1
+            return True
+        return False
+
+    def __contains__(self, low):
+        return bool(self.bits[low >> 3] & (1 << (low & 7)))
+
+    def __iter__(self):
+        bits = self.bits
+        for i in range(0, DENSE_SIZE):
+            if bits[i]:
+                base = i << 3
+                for bit in BYTE_BITS[bits[i]]:
+                    yield base | bit
+
+    def __len__(self):
+        return self.count
+
+
+class Bitmap(object):
+    __slots__ = ['chunks']
+
+    def __init__(self, values=()):
+        # Upper 16 bits of the ids -> sorted array('H') or DenseChunk with the lower 16 bits
+        self.chunks = {}
+        for value in values:
+            self.add(value)
+
+    def add(self, value):
+        high = value >> 16
+        low = value & 0xffff
+        chunk = self.chunks.get(high)
+
+        if chunk is None:
+            self.chunks[high] = array('H', [low])
+        elif type(chunk) is DenseChunk:
+            chunk.add(low)
+        else:
+            # New prefixes often get the highest ids, hence they are often appended
+            if chunk[-1] < low:
+                chunk.append(low)
+            else:
+                i = bisect.bisect_left(chunk, low)
+                if chunk[i] == low:
+                    return
+                chunk.insert(i, low)
+            if len(chunk) > ARRAY_MAX:
+                self.chunks[high] = DenseChunk(chunk)
+
+    def remove(self, value):
+        high = value >> 16
+        low = value & 0xffff
+        chunk = self.chunks[high]
+
+        if type(chunk) is DenseChunk:
+            if not chunk.remove(low):
+                raise KeyError(value)
+            # Back to an array when the chunk is half empty
+            if len(chunk) <= ARRAY_MAX/2:
+                self.chunks[high] = array('H', chunk)
+        else:
+            i = bisect.bisect_left(chunk, low)
+            if i == len(chunk) or chunk[i] != low:
+                raise KeyError(value)
+            del chunk[i]
+            if len(chunk) == 0:
+                del self.chunks[high]
+
+    def __contains__(self, value):
+        chunk = self.chunks.get(value >> 16)
+        if chunk is None:
+            return False
+        elif type(chunk) is DenseChunk:
+            return (value & 0xffff) in chunk
+        else:
+            low = value & 0xffff
+            i = bisect.bisect_left(chunk, low)
+            return i < len(chunk) and chunk[i] == low
+
+    """
+    Yields the ids in increasing order.
+    """
+    def __iter__(self):
+        for high in sorted(self.chunks):
+            base = high << 16
+            for low in self.chunks[high]:
+                yield base | low
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self.chunks.itervalues())
+
+    """
+    Add all the ids of another bitmap in this one.
+    """
+    def update(self, other):
+        for high, other_chunk in other.chunks.iteritems():
+            chunk = self.chunks.get(high)
+            if chunk is None:
+                if type(other_chunk) is DenseChunk:
+                    chunk = DenseChunk()
+                    chunk.bits[:] = other_chunk.bits
+                    chunk.count = other_chunk.count
+                else:
+                    chunk = array('H', other_chunk)
+                self.chunks[high] = chunk
+            elif type(chunk) is DenseChunk:
+                for low in other_chunk:
+                    chunk.add(low)
+            elif type(other_chunk) is DenseChunk or len(chunk)+len(other_chunk) > ARRAY_MAX:
+                dense = DenseChunk(chunk)
+                for low in other_chunk:
+                    dense.add(low)
+                self.chunks[high] = dense
+            else:
+                self.chunks[high] = array('H', sorted(set(chunk).union(other_chunk)))
+        return self
+
+    def __or__(self, other):
+        return Bitmap().update(self).update(other)
+
+    """
+    Returns the number of bytes used by the chunks.
+    """
+    def nbytes(self):
+        res = 0
+        for chunk in self.chunks.itervalues():
+            if type(chunk) is DenseChunk:
+                res += DENSE_SIZE
+            else:
+                res += chunk.buffer_info()[1] * chunk.itemsize
+        return res
@@ -0,0 +1,100 @@
+import time
+
+from framing import ReceiveBuffer
+from feed_protocol import FeedReader
+
+"""
+Replay of a feed (a file with the text lines or the binary frames that would be
+sent to SWIFT) in a single process: no socket, no child process. The messages
+are given to the peers (Peer or PeerBPAValidation) in the order of the file, and
+the peers send their fake updates directly to the global RIB (see
+rib.GlobalRIBHandler). Everything is driven by the timestamps of the messages, so
+the feed is processed as fast as possible, and two replays of the same feed
+produce the same output.
+
+peer_class      the class of the peers
+peer_args       the arguments of peer_class
+global_rib      the GlobalRIBHandler shared by all the peers
+"""
+class Replay:
+
+    def __init__(self, peer_class, peer_args, global_rib, logger=None):
+        self.peer_class = peer_class
+        self.peer_args = peer_args
+        self.global_rib = global_rib
+        self.logger = logger
+
+        # peer_id -> peer state machine
+        self.peers = {}
+
+        self.nb_messages = 0
+        self.nb_errors = 0
+
+    def report_errors(self, lines):
+        for line in lines:
+            self.nb_errors += 1
+            print 'Error: '+line
+
+    """
+    Yields the BGP messages of the file, read by chunks of chunk_size bytes.
+    """
+    def messages(self, filename, chunk_size=1048576):
+        reader = FeedReader(ReceiveBuffer(), self.report_errors)
+
+        with open(filename, 'rb') as fd:
+            while True:
+                data = fd.read(chunk_size)
+                if len(data) == 0:
+                    # The last line of a text file may not end with a newline
+                    if reader.binary is False:
+                        reader.buffer.feed('\n')
+                        for bgp_msg in reader.messages():
+                            yield bgp_msg
+                    return
+
+                reader.buffer.feed(data)
+                for bgp_msg in reader.messages():
+                    yield bgp_msg
+
+                # The rest of a file with a malformed frame cannot be read
+                if reader.error is not None:
+                    return
+
+    def process(self, bgp_msg):
+        peer = self.peers.get(bgp_msg.peer_id)
+        if peer is None:
+            if self.logger is not None:
+                self.logger.info('Starting new peer '+bgp_msg.peer_id)
+            peer = self.peer_class(*self.peer_args, global_rib=self.global_rib)
+            self.peers[bgp_msg.peer_id] = peer
+
+        # The peers keep the messages (e.g., in their queue of withdrawals)
+        if peer.process(bgp_msg.detach()):
+            peer.run_bpa()
+
+        if peer.closed:
+            peer.stop()
+            del self.peers[bgp_msg.peer_id]
+
+    """
+    Replay the file. The peers which are not closed at the end of the file are stopped.
+    Returns the number of messages processed and the time it took (in seconds).
+    """
+    def run(self, filename):
+        start = time.time()
+
+        for bgp_msg in self.messages(filename):
+            if bgp_msg is not None:
+                self.nb_messages += 1
+                self.process(bgp_msg)
+
+        for peer in self.peers.values():
+            peer.stop()
+        self.peers = {}
+        self.global_rib.delete_flows()
+
+        duration = time.time() - start
+        if self.logger is not None:
+            self.logger.info('Replay of '+filename+': '+str(self.nb_messages)+' messages in '+('%.2f' % duration)+'s.')
+
+        return self.nb_messages, duration
@@ -10,20 +10,131 @@ from rib_global import RIBGlobal
 import atexit
 import time
 from vnh import VirtualNextHops, FlowsQueue
+from framing import ReceiveBuffer
+from bgp_messages import prefix_to_text
+
+# Id of the empty AS path in every ASPathTable
+EMPTY_PATH = 0
+
+# Position of the prefix id in the values of the RIB of a peer (see RIBPeer)
+PREFIX_ID_SHIFT = 32
+PATH_ID_MASK = (1 << PREFIX_ID_SHIFT) - 1
+
+"""
+Intern table of the AS paths of a peer. Most prefixes share their AS path with
+many other prefixes, so every distinct AS path is stored once (as a tuple) and
+identified by an integer, the path id. Every path has a reference counter, and
+its id is reused once no prefix uses it anymore. The empty AS path always has
+the id EMPTY_PATH (it is not counted).
+"""
+class ASPathTable:
+    def __init__(self):
+        self.ids = {(): EMPTY_PATH}
+        self.paths = [()]
+        self.refcount = [0]
+        self.free = []
+
+    """
+    Returns the id of an AS path (list or tuple), and takes a reference on it.
+    """
+    def intern(self, as_path):
+        if not as_path:
+            return EMPTY_PATH
+        as_path = tuple(as_path)
+        path_id = self.ids.get(as_path)
+        if path_id is None:
+            if len(self.free) > 0:
+                path_id = self.free.pop()
+                self.paths[path_id] = as_path
+            else:
+                path_id = len(self.paths)
+                self.paths.append(as_path)
+                self.refcount.append(0)
+            self.ids[as_path] = path_id
+        self.refcount[path_id] += 1
+        return path_id
+
+    """
+    Releases a reference on an AS path. The path is deleted with its last reference.
+    """
+    def release(self, path_id):
+        if path_id == EMPTY_PATH:
+            return
+        self.refcount[path_id] -= 1
+        if self.refcount[path_id] == 0:
+            del self.ids[self.paths[path_id]]
+            self.paths[path_id] = None
+            self.free.append(path_id)
+
+    def get(self, path_id):
+        return self.paths[path_id]
 
+    def __len__(self):
+        return len(self.ids)-1
+
+
+"""
+RIB of a peer: the AS path of every prefix (integer, see bgp_messages.prefix_to_int)
+advertised by this peer. The AS paths are stored as ids in an ASPathTable.
+With prefix_ids (see prefix_index.PrefixIds), every prefix also gets an id, kept
+in the upper bits of its path id (above PREFIX_ID_SHIFT), which the topology of
+the peer uses in its prefix bitmaps.
+"""
 class RIBPeer:
-    def __init__(self):
+    def __init__(self, paths=None, prefix_ids=None):
         self.rib = {}
+        self.paths = paths if paths is not None else ASPathTable()
+        self.prefix_ids = prefix_ids
+
+    """
+    Update (or create) the AS path for a prefix. Returns the id of the previous
+    AS path, the id of the new one and the id of the prefix (None without
+    prefix_ids). The reference on the previous AS path is given to the caller,
+    which must release it.
+    """
+    def update_path(self, bgp_msg):
+        path_id = self.paths.intern(bgp_msg.as_path)
+        value = self.rib.get(bgp_msg.prefix)
+
+        if self.prefix_ids is None:
+            self.rib[bgp_msg.prefix] = path_id
+            return (value if value is not None else EMPTY_PATH), path_id, None
+
+        if value is None:
+            old_path_id = EMPTY_PATH
+            pid = self.prefix_ids.new(bgp_msg.prefix)
+        else:
+            old_path_id = value & PATH_ID_MASK
+            pid = value >> PREFIX_ID_SHIFT
+        self.rib[bgp_msg.prefix] = path_id | (pid << PREFIX_ID_SHIFT)
+
+        return old_path_id, path_id, pid
+
+    """
+    Delete this prefix, and returns the id of the last AS path known for this
+    prefix and the id of the prefix (None without prefix_ids, or if the prefix
+    is unknown). The reference on this AS path is given to the caller, which must
+    release it. The id of the prefix is released, it can be given again to the
+    next prefix advertised.
+    """
+    def withdraw_path(self, bgp_msg):
+        value = self.rib.pop(bgp_msg.prefix, None)
+        if value is None:
+            return EMPTY_PATH, None
+        if self.prefix_ids is None:
+            return value, None
+
+        pid = value >> PREFIX_ID_SHIFT
+        self.prefix_ids.release(pid)
+        return value & PATH_ID_MASK, pid
 
     """
     Update (or create) the AS path for a prefix and returns the previous AS path used
     """
     def update(self, bgp_msg):
-        if bgp_msg.prefix in self.rib:
-            as_path = self.rib[bgp_msg.prefix]
-        else:
-            as_path = []
-        self.rib[bgp_msg.prefix] = bgp_msg.as_path
+        old_path_id, path_id, pid = self.update_path(bgp_msg)
+        as_path = list(self.paths.get(old_path_id))
+        self.paths.release(old_path_id)
 
         return as_path
 
@@ -31,12 +142,17 @@ class RIBPeer:
     Delete this prefix, and returns the last AS path known for this prefix
     """
     def withdraw(self, bgp_msg):
-        if bgp_msg.prefix in self.rib:
-            as_path = self.rib[bgp_msg.prefix]
-            del self.rib[bgp_msg.prefix]
-            return as_path
-        else:
-            return []
+        path_id, pid = self.withdraw_path(bgp_msg)
+        as_path = list(self.paths.get(path_id))
+        self.paths.release(path_id)
+
+        return as_path
+
+    """
+    Returns the AS path (tuple) of a prefix.
+    """
+    def get(self, prefix):
+        return self.paths.get(self.rib[prefix] & PATH_ID_MASK)
 
     def __len__(self):
         return len(self.rib)
@@ -44,7 +160,7 @@ class RIBPeer:
     def __str__(self):
         res = ''
         for i in self.rib:
-            res += str(i)+'\t'+str(self.rib[i])+'\n'
+            res += prefix_to_text(i)+'\t'+str(list(self.get(i)))+'\n'
         return res
 
 # Parameters used for the loggers
@@ -65,6 +181,113 @@ def rib_init_logger(logdir_name):
     rib_logger = rib_logger_loc
 
 
+"""
+Processes the lines the peers send to the global RIB: the fake updates
+(advertisements and withdrawals, with the virtual MAC address of the AS path)
+and the fast reroute requests (lines starting with FR).
+It is used by the global RIB process, and directly by the peers when the
+feed is replayed in a single process (see replay.py). In that case, it is given
+to the peers instead of their socket, hence the send and close methods.
+With apply_flows False (replay), the rules of the switch are only written in
+files, ovs-ofctl is not called.
+"""
+class GlobalRIBHandler:
+
+    def __init__(self, nb_bits_nexthop, apply_flows=True):
+        # The Global RIB
+        self.rib_global = RIBGlobal()
+
+        # The virtual nexthops handler
+        self.vnh = VirtualNextHops(self.rib_global, nb_bits_nexthop, logger=rib_logger, apply_flows=apply_flows)
+
+        # Install and delete the rules in the switch with ovs-ofctl (otherwise they are only written in files)
+        self.apply_flows = apply_flows
+
+        self.OFFlowsQueue = FlowsQueue(60*5) # Backup rules deleted after 5 minutes
+
+        # Used when the peers call send directly
+        self.buffer = ReceiveBuffer()
+
+    def process_line(self, data_line):
+        rib_global = self.rib_global
+        vnh = self.vnh
+
+        """ In case the peer wants to fast reroute"""
+        if data_line.startswith('FR'):
+            data_line_tab = data_line.split('|')
+            peer_ip = data_line_tab[1]
+            vmac_partial = data_line_tab[2]
+            bitmask_partial = data_line_tab[3]
+            depth = int(data_line_tab[4])
+            ts = int(float(data_line_tab[5]))
+
+            for f in vnh.insert_backup_rules(peer_ip, depth, vmac_partial, bitmask_partial):
+                self.OFFlowsQueue.append((ts, f))
+
+        else:
+            data_line_tab = data_line.split('|')
+            peer_ip = data_line_tab[0]
+            prefix = data_line_tab[1]
+            ts = float(data_line_tab[2])
+
+            for f in self.OFFlowsQueue.refresh_iter(ts):
+                with open('deleted_rules', 'a') as fd_del:
+                    fd_del.write(f+'\n')
+                if self.apply_flows:
+                    os.system('ovs-ofctl del-flows s1 '+f)
+
+            """ In case it is an advertisement """
+            if len(data_line_tab) == 5:
+                v_mac = data_line_tab[4]
+
+                if len(data_line_tab[3]) > 0:
+                    try:
+                        as_path = map(lambda x:int(x), data_line_tab[3].split(' '))
+                    except:
+                        print data_line_tab
+                        as_path = []
+                else:
+                    as_path = []
+                bgproute = BGPRoute(prefix, peer_ip, as_path, v_mac)
+                prev_prim, new_prim, bgproute, prev_backup, new_backup = rib_global.announce(bgproute)
+
+                vnh_ip, vnh_mac = vnh.get_VNH(prefix)
+                print 'A|'+str(prefix)+'|'+str(vnh_ip)+'|('+str(vnh_mac)+')|'+str(' '.join(map(lambda x:str(x), new_prim.as_path)))
+
+                """ In case it is a withdrawal """
+            else:
+                prev_prim, new_prim, bgproute, prev_backup, new_backup = rib_global.withdraw(peer_ip, data_line_tab[1])
+
+                if new_prim is not None:
+                    vnh_ip, vnh_mac = vnh.get_VNH(prefix)
+                    print 'A|'+str(prefix)+'|'+str(vnh_ip)+'|('+str(vnh_mac)+')|'+str(' '.join(map(lambda x:str(x), new_prim.as_path)))
+                else:
+                    if prev_prim is not None:
+                        print 'W|'+str(prefix)
+
+    """
+    Process the complete lines in data, as if they were received from a peer.
+    """
+    def send(self, data):
+        self.buffer.feed(data)
+        for data_line in self.buffer.lines():
+            self.process_line(data_line)
+        return len(data)
+
+    def close(self):
+        pass
+
+    """
+    Delete all the backup flows.
+    """
+    def delete_flows(self):
+        for ts, f in self.OFFlowsQueue:
+            with open('deleted_rules', 'a') as fd_del:
+                fd_del.write(f+'\n')
+            if self.apply_flows:
+                os.system('ovs-ofctl del-flows s1 '+f)
+
+
 def rib_global(port, nb_bits_nexthop, dirname, socket_rib_name):
     import socket
 
@@ -85,15 +308,15 @@ def rib_global(port, nb_bits_nexthop, dirname, socket_rib_name):
     socket.bind(rib_global_socket_address)
     socket.listen(5)
 
+    # The Global RIB, and the virtual nexthops handler
+    handler = GlobalRIBHandler(nb_bits_nexthop)
+
     # Exit properly when receiving SIGINT
     def signal_handler(signal, frame):
         rib_logger.info('Received SIGTERM. Exiting.')
 
         # Deleting all the backup flows
-        for ts, f in OFFlowsQueue:
-            with open('deleted_rules', 'a') as fd_del:
-                fd_del.write(f+'\n')
-            os.system('ovs-ofctl del-flows s1 '+f)
+        handler.delete_flows()
 
         socket.close()
         sys.exit(0)
@@ -104,16 +327,8 @@ def rib_global(port, nb_bits_nexthop, dirname, socket_rib_name):
         socket.close()
     atexit.register(exit_handler)
 
-    # The Global RIB
-    rib_global = RIBGlobal()
-
-    # The virtual nexthops handler
-    vnh = VirtualNextHops(rib_global, nb_bits_nexthop, logger=rib_logger)
-
-    OFFlowsQueue = FlowsQueue(60*5) # Backup rules deleted after 5 minutes
-
     sock_list = [socket]
-    data_dic = {}
+    buffer_dic = {}
 
     while True:
 
@@ -123,75 +338,15 @@ def rib_global(port, nb_bits_nexthop, dirname, socket_rib_name):
             if sock == socket:
                 (newsock, address) = sock.accept()
                 sock_list.append(newsock)
-                data_dic[newsock] = ''
+                buffer_dic[newsock] = ReceiveBuffer()
                 rib_logger.info('New connection from '+str(address))
             else:
-                data_tmp = sock.recv(100000000)
-
-                if len(data_tmp) == 0:
+                if buffer_dic[sock].recv_from(sock) == 0:
                     rib_logger.info('One peer has Disconnected')
                     sock.close()
                     sock_list.remove(sock)
+                    del buffer_dic[sock]
 
                 else:
-                    data_dic[sock] += data_tmp
-
-                    next_data = ''
-                    while data_dic[sock][-1] != '\n':
-                        next_data = data_dic[sock][-1]+next_data
-                        data_dic[sock] = data_dic[sock][:-1]
-
-                    """ In case the peer wants to fast reroute"""
-                    for data_line in data_dic[sock].rstrip('\n').split('\n'):
-                        if data_line.startswith('FR'):
-                            data_line_tab = data_line.split('|')
-                            peer_ip = data_line_tab[1]
-                            vmac_partial = data_line_tab[2]
-                            bitmask_partial = data_line_tab[3]
-                            depth = int(data_line_tab[4])
-                            ts = int(float(data_line_tab[5]))
-
-                            for f in vnh.insert_backup_rules(peer_ip, depth, vmac_partial, bitmask_partial):
-                                OFFlowsQueue.append((ts, f))
-
-                        else:
-                            data_line_tab = data_line.split('|')
-                            peer_ip = data_line_tab[0]
-                            prefix = data_line_tab[1]
-                            ts = float(data_line_tab[2])
-
-                            for f in OFFlowsQueue.refresh_iter(ts):
-                                with open('deleted_rules', 'a') as fd_del:
-                                    fd_del.write(f+'\n')
-                                os.system('ovs-ofctl del-flows s1 '+f)
-
-                            """ In case it is an advertisement """
-                            if len(data_line_tab) == 5:
-                                v_mac = data_line_tab[4]
-
-                                if len(data_line_tab[3]) > 0:
-                                    try:
-                                        as_path = map(lambda x:int(x), data_line_tab[3].split(' '))
-                                    except:
-                                        print data_line_tab
-                                        as_path = []
-                                else:
-                                    as_path = []
-                                bgproute = BGPRoute(prefix, peer_ip, as_path, v_mac)
-                                prev_prim, new_prim, bgproute, prev_backup, new_backup = rib_global.announce(bgproute)
-
-                                vnh_ip, vnh_mac = vnh.get_VNH(prefix)
-                                print 'A|'+str(prefix)+'|'+str(vnh_ip)+'|('+str(vnh_mac)+')|'+str(' '.join(map(lambda x:str(x), new_prim.as_path)))
-
-                                """ In case it is a withdrawal """
-                            else:
-                                prev_prim, new_prim, bgproute, prev_backup, new_backup = rib_global.withdraw(peer_ip, data_line_tab[1])
-
-                                if new_prim is not None:
-                                    vnh_ip, vnh_mac = vnh.get_VNH(prefix)
-                                    print 'A|'+str(prefix)+'|'+str(vnh_ip)+'|('+str(vnh_mac)+')|'+str(' '.join(map(lambda x:str(x), new_prim.as_path)))
-                                else:
-                                    if prev_prim is not None:
-                                        print 'W|'+str(prefix)
-
-                    data_dic[sock] = next_data
+                    for data_line in buffer_dic[sock].lines():
+                        handler.process_line(data_line)
@@ -11,11 +11,16 @@ import logging.handlers
 import multiprocessing
 import errno
 
-from peer import run_peer, peer_init_logger
-from peer_bpavalidation import run_peer_bpavalidation, peer_bpavalidation_init_logger
+from peer import Peer, run_peer, peer_init_logger
+from peer_bpavalidation import PeerBPAValidation, run_peer_bpavalidation, peer_bpavalidation_init_logger
+from peer_pool import PeerPool, run_peer_worker
 from subprocess import Popen, PIPE
-from bgp_messages import parse
-from rib import rib_global, rib_init_logger
+from framing import ReceiveBuffer
+from feed_protocol import FeedReader
+from transport import BatchChannel, RingChannel
+from ingest import FeedServer
+from rib import rib_global, rib_init_logger, GlobalRIBHandler
+from replay import Replay
 
 try:
     os.chdir(os.path.dirname(__file__))
@@ -24,14 +29,17 @@ except:
 
 parser = argparse.ArgumentParser("This is the server listening for bgp messages.")
 parser.add_argument("--port", type=int, default=3000, help="Server port")
-parser.add_argument("--win_size", default=10, type=int, help="Size of the window (seconds)")
+parser.add_argument("--win_size", default=10, type=float, help="Size of the window (seconds, can be a fraction of a second)")
+parser.add_argument("--win_resolution", default=1000, type=float, help="Resolution (in ms) of the window: the withdrawals expire by buckets of this duration, and the timestamps of the bursts have this precision (default 1000).")
 parser.add_argument("--start_stop", default='1500,9', type=str, help="Minimum number of withdrawals \
 to receive within the a period of time to start and end the burst. start and end sperated by a comma.")
+parser.add_argument("--start_stop_rate", default=None, type=str, help="Withdrawal rates (per second) to start and end the burst, separated by a comma. \
+The thresholds are the rates times the size of the window (replaces --start_stop).")
 parser.add_argument("--min_burst_size", default=2500, type=int, help="Minimum burst size required to execute bpa.")
 parser.add_argument("--bpa_freq", default=2500, type=int, help="BPA frequency execution (in number of withdrawals).")
 parser.add_argument("--p_w", default=1, type=float, help="Weight on the precision when computing the FM score. (if 0 and 0 for both weights, the naive approach is used instead of BPA.)")
 parser.add_argument("--r_w", default=3, type=float, help="Weight on the recall when computing the FM score.")
-parser.add_argument("--bpa_algo", default='bpa-multiple', type=str, help="Algoeithm used. 3 options: naive, bgp-single, bpa-multiple.")
+parser.add_argument("--bpa_algo", default='bpa-multiple', type=str, help="Algoeithm used. 6 options: naive, bgp-single, bpa-multiple, bpa-incremental, bpa-numpy, bpa-anytime.")
 parser.add_argument("--nb_bits_aspath", default=28, type=int, help="Number of bits reserver for the AS path compression.")
 parser.add_argument("--nb_bits_nexthop", default=3, type=int, help="Number of bits reserved for the each nexthop (primary or backup).")
 parser.add_argument("--run_encoding_threshold", default=1000000, type=int, help="Compute the encoding after a certain amount of routes received. Otherwise the encoding is computed when the first withdrawal is received.")
@@ -40,10 +48,29 @@ parser.add_argument("--bpa_validation", action='store_true', default=False, help
 parser.add_argument("--silent", action='store_true', default=False, help="Print bursts information. Set to True if you do want to print this and make SWIFT as fast as possible.")
 parser.add_argument("--bursts_dir", default='bursts', help="Directory where to store information about the bursts prediction (default bursts)")
 parser.add_argument("--log_dir", default='log', help="Directory where to store the logs (default log)")
+parser.add_argument("--batch_size", default=1000, type=int, help="Maximum number of BGP messages sent at once to a peer process (default 1000).")
+parser.add_argument("--batch_delay", default=5, type=float, help="Maximum time (in ms) a BGP message waits in the dispatcher before being sent to its peer process (default 5).")
+parser.add_argument("--ipc", default='queue', type=str, help="Transport between the dispatcher and the peer processes. 2 options: queue (batched multiprocessing queue), ring (shared-memory ring buffer).")
+parser.add_argument("--ring_size", default=262144, type=int, help="Number of records in the ring buffer of each peer when --ipc ring is used (default 262144).")
+parser.add_argument("--peer_pool", action='store_true', default=False, help="Run the peers in a fixed pool of worker processes instead of one process per peer.")
+parser.add_argument("--nb_workers", default=0, type=int, help="Number of worker processes when --peer_pool is used (default 0, i.e., the number of cores).")
+parser.add_argument("--io", default='select', type=str, help="Server receiving the feeds. 2 options: select, asyncore (stops reading a feed while one of its peers is congested).")
+parser.add_argument("--high_water", default=100000, type=int, help="With --io asyncore, number of messages waiting for a peer process above which its feeds are paused (default 100000).")
+parser.add_argument("--low_water", default=50000, type=int, help="With --io asyncore, number of messages waiting for a peer process below which its feeds are resumed (default 50000).")
+parser.add_argument("--topology", default='networkx', type=str, help="Implementation of the AS topologies. 2 options: networkx, array (integer ids and array counters, faster updates).")
+parser.add_argument("--bpa_async", action='store_true', default=False, help="Run BPA (bpa-multiple or bpa-numpy) in two worker processes (forward and backward modes) while the peer keeps processing the BGP messages.")
+parser.add_argument("--bpa_budget", default=5, type=float, help="Time budget (in ms) of bpa-anytime, the search continues after the budget and the improved predictions are applied later on (default 5).")
+parser.add_argument("--background_encoding", action='store_true', default=False, help="Compute the encoding in a child process, the peer keeps processing the BGP messages and sends the prefixes with the new encoding progressively.")
+parser.add_argument("--encoding_period", default=3600, type=float, help="With --background_encoding, recompute the encoding in the background every encoding_period seconds (default 3600, 0 to disable).")
+parser.add_argument("--replay", default=None, type=str, help="Replay the BGP messages of this file in a single process (no socket, no child process) and exit.")
 
 args = parser.parse_args()
 port = args.port
 win_size = args.win_size
+# A window of whole seconds is kept as an integer (e.g., in the bursts_info header)
+if win_size == int(win_size):
+    win_size = int(win_size)
+win_resolution = args.win_resolution/1000.
 withdr_start_end = args.start_stop
 min_bpa_burst_size = args.min_burst_size
 fm_freq = args.bpa_freq
@@ -58,6 +85,21 @@ silent = args.silent
 run_encoding_threshold = args.run_encoding_threshold
 bursts_dir = args.bursts_dir
 log_dir = args.log_dir
+batch_size = args.batch_size
+batch_delay = args.batch_delay/1000.
+ipc = args.ipc
+ring_size = args.ring_size
+peer_pool = args.peer_pool
+io_mode = args.io
+high_water = args.high_water
+low_water = args.low_water
+replay_file = args.replay
+topology = args.topology
+bpa_async = args.bpa_async
+bpa_budget = args.bpa_budget
+background_encoding = args.background_encoding
+encoding_period = args.encoding_period
+nb_workers = args.nb_workers if args.nb_workers > 0 else multiprocessing.cpu_count()
 
 # Initialize the logger for the peer and rib processes
 if not os.path.exists(log_dir):
@@ -80,23 +122,90 @@ handler = logging.handlers.RotatingFileHandler(log_dir+'/main', maxBytes=2000000
 handler.setFormatter(formatter)
 main_logger.addHandler(handler)
 
-if not 'bpa-multiple' == bpa_algo and not 'bpa-single' == bpa_algo and not 'naive' == bpa_algo:
+if not 'bpa-multiple' == bpa_algo and not 'bpa-single' == bpa_algo and not 'bpa-incremental' == bpa_algo and not 'bpa-numpy' == bpa_algo and not 'bpa-anytime' == bpa_algo and not 'naive' == bpa_algo:
     main_logger.error('Unknown algorithm')
     print 'Error: unknown algo.'
     sys.exit(0)
 
+if not 'queue' == ipc and not 'ring' == ipc:
+    main_logger.error('Unknown IPC mode')
+    print 'Error: unknown IPC mode.'
+    sys.exit(0)
+
+if not 'select' == io_mode and not 'asyncore' == io_mode:
+    main_logger.error('Unknown IO mode')
+    print 'Error: unknown IO mode.'
+    sys.exit(0)
+
+if not 'networkx' == topology and not 'array' == topology:
+    main_logger.error('Unknown topology')
+    print 'Error: unknown topology.'
+    sys.exit(0)
+
+if bpa_async and not 'bpa-multiple' == bpa_algo and not 'bpa-numpy' == bpa_algo:
+    main_logger.error('BPA can only run asynchronously with bpa-multiple or bpa-numpy')
+    print 'Error: --bpa_async requires bpa-multiple or bpa-numpy.'
+    sys.exit(0)
+
+if replay_file is not None and (bpa_async or background_encoding):
+    main_logger.error('BPA and the encoding cannot run in the background during a replay')
+    print 'Error: --replay cannot be used with --bpa_async or --background_encoding.'
+    sys.exit(0)
+
+if win_resolution <= 0 or win_resolution > win_size:
+    main_logger.error('Invalid window resolution')
+    print 'Error: --win_resolution must be positive and not larger than the window.'
+    sys.exit(0)
+
 function_peer = run_peer
+class_peer = Peer
 if bpa_validation:
     function_peer = run_peer_bpavalidation
+    class_peer = PeerBPAValidation
 
 # Dictionnary of peers - child processes
 peer_dic = {}
-# Dictionnary of queues
-queue_dic = {}
+# Dictionnary of channels (batched queues) towards the peers
+channel_dic = {}
+# Pool of workers hosting the peers (if --peer_pool is used)
+pool = None
+
+# Create a new channel towards a peer process or a worker
+def new_channel():
+    if ipc == 'ring':
+        return RingChannel(ring_size, logger=main_logger)
+    else:
+        return BatchChannel(batch_size, batch_delay)
+
+# Last time the transport statistics were written in the log file
+last_stats_write = time.time()
 
 # Define the number of withdrawals required to start and end a burst
 nb_withdrawals_burst_start = int(withdr_start_end.split(',')[0])
 nb_withdrawals_burst_end = int(withdr_start_end.split(',')[1])
+if args.start_stop_rate is not None:
+    nb_withdrawals_burst_start = max(1, int(round(float(args.start_stop_rate.split(',')[0])*win_size)))
+    nb_withdrawals_burst_end = max(1, int(round(float(args.start_stop_rate.split(',')[1])*win_size)))
+
+if not os.path.exists('bursts'):
+    os.makedirs('bursts')
+
+with open('bursts/bursts_info', 'w') as fd:
+    fd.write('#\tw_threshold:\t'+str(nb_withdrawals_burst_start)+','+str(nb_withdrawals_burst_end)+'\t'+str(win_size)+'\t'+str(min_bpa_burst_size)+'\t'+str(fm_freq)+'\t'+str(p_w)+'\t'+str(r_w)+'\n')
+
+# Replay a file in this process, with the global RIB in the same process too.
+# The output does not depend on the time: bpa-anytime runs without budget.
+if replay_file is not None:
+    replay = Replay(class_peer, (win_size, nb_withdrawals_burst_start, \
+    nb_withdrawals_burst_end, min_bpa_burst_size, bursts_dir, \
+    None, fm_freq, p_w, \
+    r_w, bpa_algo, nb_bits_aspath, run_encoding_threshold, \
+    global_rib_enabled, silent, topology, False, None, win_resolution, False, encoding_period), GlobalRIBHandler(nb_bits_nexthop, apply_flows=False), main_logger)
+
+    nb_messages, duration = replay.run(replay_file)
+    sys.stdout.flush()
+    sys.stderr.write('Replayed '+str(nb_messages)+' messages in '+('%.2f' % duration)+'s ('+('%.0f' % (nb_messages/max(duration, 1e-6)))+' messages/s).\n')
+    sys.exit(0)
 
 # Starts the global RIB process. All the peer processes will communicate with this process
 socket_rib_name = 'socket_tmp_'+str(port)
@@ -104,12 +213,14 @@ global_rib_process = multiprocessing.Process(target=rib_global, args=(port+1,nb_
 global_rib_process.start()
 main_logger.info('Started the global RIB.')
 
+if peer_pool:
+    pool = PeerPool(nb_workers, run_peer_worker, (class_peer, win_size, nb_withdrawals_burst_start, \
+    nb_withdrawals_burst_end, min_bpa_burst_size, bursts_dir, \
+    socket_rib_name, fm_freq, p_w, \
+    r_w, bpa_algo, nb_bits_aspath, run_encoding_threshold, \
+    global_rib_enabled, silent, topology, bpa_async, bpa_budget, win_resolution, background_encoding, encoding_period), new_channel, logger=main_logger)
+    main_logger.info('Started the pool of '+str(nb_workers)+' peer workers.')
 
-if not os.path.exists('bursts'):
-    os.makedirs('bursts')
-
-with open('bursts/bursts_info', 'w') as fd:
-    fd.write('#\tw_threshold:\t'+str(nb_withdrawals_burst_start)+','+str(nb_withdrawals_burst_end)+'\t'+str(win_size)+'\t'+str(min_bpa_burst_size)+'\t'+str(fm_freq)+'\t'+str(p_w)+'\t'+str(r_w)+'\n')
 
 # Exit properly when receiving SIGINT, refresh the peer dic upon reception of a SIGCHLD
 def signal_handler(sig, frame):
@@ -120,22 +231,35 @@ def signal_handler(sig, frame):
         main_logger.info('Received SIGINT. Exiting.')
         socket.close()
 
+        for peer_id, channel in channel_dic.items():
+            main_logger.info('Transport '+peer_id+' '+str(channel.sender_stats))
+
         for k, v in peer_dic.items():
             try:
                 v.terminate()
             except:
                 pass
 
+        if pool is not None:
+            for line in pool.stats():
+                main_logger.info('Transport '+line)
+            pool.terminate()
+
         global_rib_process.terminate()
 
         os._exit(1)
 
     elif sig == signal.SIGCHLD:
+        if pool is not None:
+            pool.worker_exited()
+
         for peer_id in peer_dic.keys():
             try:
                 if not peer_dic[peer_id].is_alive():
+                    main_logger.info('Transport '+peer_id+' '+str(channel_dic[peer_id].sender_stats))
+                    channel_dic[peer_id].close()
                     del peer_dic[peer_id]
-                    del queue_dic[peer_id]
+                    del channel_dic[peer_id]
                     main_logger.info('Clean child '+str(peer_id))
             except KeyError:
                 pass
@@ -144,17 +268,139 @@ signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 signal.signal(signal.SIGCHLD, signal_handler)
 
+"""
+Handle the text lines received from a feed which could not be parsed.
+"""
+def report_errors(lines):
+    for line in lines:
+        if 'EXIT' in line: # Stop SWIFT
+            os.kill(os.getpid(), signal.SIGINT)
+        else:
+            print 'Error: '+line
+
+"""
+Send a BGP message received from a feed to its peer.
+A new peer process is started for the first message of a peer.
+Returns the id of the peer the message was sent to (None otherwise).
+"""
+def dispatch(bgp_msg):
+    if bgp_msg is None:
+        return None
+
+    if pool is not None:
+        pool.put(bgp_msg)
+        return bgp_msg.peer_id
+
+    if bgp_msg.peer_id not in peer_dic:
+        if len(peer_dic) <= 500:
+            main_logger.info('Starting new peer '+bgp_msg.peer_id)
+            channel_dic[bgp_msg.peer_id] = new_channel()
+            peer_dic[bgp_msg.peer_id] = multiprocessing.Process(target=function_peer, \
+            args=(channel_dic[bgp_msg.peer_id], win_size, nb_withdrawals_burst_start, \
+            nb_withdrawals_burst_end, min_bpa_burst_size, bursts_dir, \
+            socket_rib_name, fm_freq, p_w, \
+            r_w, bpa_algo, nb_bits_aspath, run_encoding_threshold, \
+            global_rib_enabled, silent, topology, bpa_async, bpa_budget, win_resolution, background_encoding, encoding_period))
+            peer_dic[bgp_msg.peer_id].start()
+            channel_dic[bgp_msg.peer_id].process = peer_dic[bgp_msg.peer_id]
+        else:
+            print 'Cannot accept new peers, limit (500) reached.'
+            main_logger.warning('Cannot accept new peers, limit (500) reached.')
+            return None
+
+    # The peer may have been cleaned in the meantime (SIGCHLD)
+    channel = channel_dic.get(bgp_msg.peer_id)
+    if channel is None:
+        return None
+
+    try:
+        channel.put(bgp_msg)
+    except IOError, e:
+        main_logger.info('Peer '+bgp_msg.peer_id+' disconnected ('+str(e)+')')
+        process = peer_dic.pop(bgp_msg.peer_id, None)
+        if channel_dic.pop(bgp_msg.peer_id, None) is not None:
+            channel.close()
+        if process is not None:
+            try:
+                process.terminate()
+                process.join()
+            except OSError:
+                pass
+        return None
+
+    return bgp_msg.peer_id
+
+"""
+Returns the channel towards the process of a peer (None if the peer is gone).
+"""
+def channel_of(peer_id):
+    if pool is not None:
+        return pool.channel_of(peer_id)
+    return channel_dic.get(peer_id)
+
+"""
+Send the batches which have waited for too long, and write the transport statistics
+every minute. Returns the time (in seconds) until the next batch must be sent.
+"""
+def flush_channels():
+    global last_stats_write
+
+    now = time.time()
+    timeout = None
+    for channel in channel_dic.values():
+        remaining = channel.flush_expired(now)
+        if remaining is not None and (timeout is None or remaining < timeout):
+            timeout = remaining
+    if pool is not None:
+        remaining = pool.flush_expired(now)
+        if remaining is not None and (timeout is None or remaining < timeout):
+            timeout = remaining
+
+    if now - last_stats_write >= 60:
+        for peer_id, channel in channel_dic.items():
+            main_logger.info('Transport '+peer_id+' '+str(channel.sender_stats))
+        if pool is not None:
+            for line in pool.stats():
+                main_logger.info('Transport '+line)
+        if server is not None:
+            main_logger.info('Ingest pauses: '+str(server.nb_pauses))
+        last_stats_write = now
+
+    return timeout
+
 socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 socket.bind(('', port))
 socket.listen(5)
 print 'Waiting for new connection...'
 
+# Server used with --io asyncore
+server = None
+
+if io_mode == 'asyncore':
+    server = FeedServer(socket, report_errors, dispatch, channel_of, high_water, low_water, main_logger)
+
+    try:
+        while True:
+            # Wake up when the oldest pending batch must be sent to its peer,
+            # or regularly to resume the paused connections
+            timeout = flush_channels()
+            if server.is_paused() and (timeout is None or timeout > 0.01):
+                timeout = 0.01
+            server.poll(timeout)
+    # Clean exit
+    except KeyboardInterrupt:
+        signal_handler(signal.SIGINT, None)
+
 sock_list = [socket]
-data = ''
+# One reader (and receive buffer) per connection, so that partial messages from different feeds are never mixed
+reader_dic = {}
 
 while True:
+    # Wake up when the oldest pending batch must be sent to its peer
+    timeout = flush_channels()
+
     try:
-        inready, outready, excepready = select.select (sock_list, [], [])
+        inready, outready, excepready = select.select (sock_list, [], [], timeout)
     except select.error, v:
         if v[0] != errno.EINTR:
             raise
@@ -166,57 +412,26 @@ while True:
             if sock == socket:
                 (newsock, address) = sock.accept()
                 sock_list.append(newsock)
+                reader_dic[newsock] = FeedReader(ReceiveBuffer(), report_errors)
                 print 'New connection from ', address
             else:
-                data_tmp = sock.recv(100000000)
-
-                if len(data_tmp) == 0:
+                if reader_dic[sock].buffer.recv_from(sock) == 0:
                     main_logger.info('Disconnected from '+str(sock.getpeername()))
                     print 'Disconnected from '+str(sock.getpeername())
                     sock.close()
                     sock_list.remove(sock)
+                    del reader_dic[sock]
                 else:
-                    data += data_tmp
-
-                    next_data = ''
-                    while data[-1] != '\n':
-                        next_data = data[-1]+next_data
-                        data = data[:-1]
-
-                    for line in data.rstrip('\n').split('\n'):
-                        tmp = time.time()
-                        try:
-                            bgp_msg = parse(line)
-                        except:
-                            if 'EXIT' in line: # Stop SWIFT
-                                os.kill(os.getpid(), signal.SIGINT)
-                            else:
-                                print 'Error: '+line
-                                bgp_msg = None
-
-                        if bgp_msg is not None:
-                            if bgp_msg.peer_id not in peer_dic:
-                                if len(peer_dic) <= 500:
-                                    main_logger.info('Starting new peer '+bgp_msg.peer_id)
-                                    queue_dic[bgp_msg.peer_id] = multiprocessing.Queue()
-                                    peer_dic[bgp_msg.peer_id] = multiprocessing.Process(target=function_peer, \
-                                    args=(queue_dic[bgp_msg.peer_id], win_size, nb_withdrawals_burst_start, \
-                                    nb_withdrawals_burst_end, min_bpa_burst_size, bursts_dir, \
-                                    socket_rib_name, fm_freq, p_w, \
-                                    r_w, bpa_algo, nb_bits_aspath, run_encoding_threshold, \
-                                    global_rib_enabled, silent))
-                                    peer_dic[bgp_msg.peer_id].start()
-                                else:
-                                    print 'Cannot accept new peers, limit (500) reached.'
-                                    main_logger.warning('Cannot accept new peers, limit (500) reached.')
-                            if bgp_msg.peer_id in peer_dic:
-                                try:
-                                    queue_dic[bgp_msg.peer_id].put(bgp_msg)
-                                except IOError:
-                                    main_logger.info('Peer '+bgp_msg.peer_id+' disconnected')
-                                    peer_dic[bgp_msg.peer_id].terminate()
-                                    break
-                    data = next_data
+                    for bgp_msg in reader_dic[sock].messages():
+                        dispatch(bgp_msg)
+
+                    # Drop the connection after a malformed frame
+                    if reader_dic[sock].error is not None:
+                        main_logger.warning('Closing '+str(sock.getpeername())+': '+reader_dic[sock].error)
+                        print 'Closing '+str(sock.getpeername())+': '+reader_dic[sock].error
+                        sock.close()
+                        sock_list.remove(sock)
+                        del reader_dic[sock]
     # Clean exit
     except select.error, KeyboardInterrupt:
         signal_handler(signal.SIGINT, None)
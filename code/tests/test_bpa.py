@@ -0,0 +1,44 @@
+import sys
+import os
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from as_topology import topology_class
+from bpa import AnytimeBPA
+
+"""
+Tests of AnytimeBPA: the search continues after its budget while the burst
+grows, and must keep evaluating the withdrawals it started with.
+"""
+
+class TestAnytimeBPA(unittest.TestCase):
+
+    def setUp(self):
+        self.G = topology_class('networkx')(1, True)
+        self.G_W = topology_class('networkx')(1, True)
+
+        for i in range(0, 20):
+            self.G.add([1, 30, 3000+i])
+        for i in range(0, 18):
+            self.G_W.add([1, 10, 1000+i])
+
+    def test_search_continues_on_its_withdrawals(self):
+        bpa = AnytimeBPA(self.G, self.G_W, 18, 1, 3)
+        bpa.run(0)
+        self.assertFalse(bpa.done())
+
+        # The burst grows while the search continues
+        for i in range(0, 30):
+            self.G_W.add([1, 20, 2000+i])
+
+        edge_set, fm_score, TP, FP, FN = bpa.run(None)
+        self.assertTrue(bpa.done())
+        self.assertLessEqual(fm_score, 1)
+        self.assertTrue(FN >= 0 or (TP, FP, FN) == (-1, -1, -1))
+        for e in edge_set:
+            self.assertNotEqual(e[0], 20)
+            self.assertNotEqual(e[1], 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import sys
+import os
+import time
+import signal
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import encoding
+from as_topology import topology_class
+
+"""
+Tests of BackgroundEncoding: the child which computes the encoding is forked
+from a peer (or a pool worker), and must not run the SIGTERM handler of the peer
+when it is terminated (BackgroundEncoding.stop).
+"""
+
+started = multiprocessing.Event()
+
+# Replaces Encoding.compute_encoding in the child: tells the test that the child
+# is computing, i.e., run_encoding_worker set its signal handlers, then blocks.
+def slow_compute_encoding(self):
+    started.set()
+    time.sleep(60)
+
+
+class TestBackgroundEncoding(unittest.TestCase):
+
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.log_dir, 'peer_1')
+        with open(self.log_file, 'w') as fd:
+            fd.write('Peer_1_(AS1)_started.\n')
+
+        self.compute_encoding = encoding.Encoding.compute_encoding
+        encoding.Encoding.compute_encoding = slow_compute_encoding
+        self.sigterm = signal.getsignal(signal.SIGTERM)
+        started.clear()
+
+    def tearDown(self):
+        encoding.Encoding.compute_encoding = self.compute_encoding
+        signal.signal(signal.SIGTERM, self.sigterm)
+        shutil.rmtree(self.log_dir)
+
+    def test_stop_does_not_run_peer_handler(self):
+        state = {'stopped': False}
+        log_file = self.log_file
+
+        # Same behavior as the handler of run_peer: stops the peer, writes in its log file and exits
+        def signal_handler(sig, frame):
+            state['stopped'] = True
+            with open(log_file, 'a') as fd:
+                fd.write('Received SIGTERM. Exiting.\n')
+            sys.exit(0)
+
+        signal.signal(signal.SIGTERM, signal_handler)
+
+        G = topology_class('networkx')(1, True)
+        G.add([1, 10, 100, 2000])
+        G.add([1, 11, 101, 2001])
+
+        with open(self.log_file, 'r') as fd:
+            log_before = fd.read()
+
+        background_encoding = encoding.BackgroundEncoding('1', G, 20, 5)
+        self.assertTrue(started.wait(10))
+        background_encoding.stop()
+
+        self.assertEqual(background_encoding.process.exitcode, -signal.SIGTERM)
+        self.assertFalse(state['stopped'])
+        with open(self.log_file, 'r') as fd:
+            self.assertEqual(fd.read(), log_before)
+
+
+if __name__ == '__main__':
+    unittest.main()
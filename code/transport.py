@@ -0,0 +1,440 @@
+import os
+import time
+import mmap
+import fcntl
+import struct
+import select
+import marshal
+import multiprocessing
+from Queue import Empty
+from array import array
+
+from bgp_messages import BGPMessage, prefix_to_bytes, prefix_from_bytes
+
+"""
+Counters describing the frames going through a channel: number of frames and
+messages, batch sizes and latencies (in seconds).
+"""
+class BatchStats:
+    def __init__(self):
+        self.nb_frames = 0
+        self.nb_messages = 0
+        self.max_batch_size = 0
+        self.total_latency = 0.
+        self.max_latency = 0.
+
+    def record(self, batch_size, latency):
+        self.nb_frames += 1
+        self.nb_messages += batch_size
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def avg_batch_size(self):
+        return float(self.nb_messages)/self.nb_frames if self.nb_frames > 0 else 0.
+
+    def avg_latency(self):
+        return self.total_latency/self.nb_frames if self.nb_frames > 0 else 0.
+
+    def __str__(self):
+        return 'frames:'+str(self.nb_frames)+' messages:'+str(self.nb_messages)+ \
+        ' batch_avg:'+('%.1f' % self.avg_batch_size())+' batch_max:'+str(self.max_batch_size)+ \
+        ' latency_avg_ms:'+('%.3f' % (self.avg_latency()*1000))+' latency_max_ms:'+('%.3f' % (self.max_latency*1000))
+
+
+"""
+Batched transport between the dispatcher (main process) and a peer process.
+The dispatcher accumulates the messages of a peer and sends them as one compact
+frame (a marshalled list of tuples) when max_batch_size messages are waiting
+or when the oldest message has waited max_delay seconds. The peer process
+drains a whole frame at once, so pickling and pipe syscalls are paid per frame
+and not per BGP message.
+
+The dispatcher only uses put/flush/flush_expired and the peer process only uses get.
+The sender stats measure the flush latency (time spent by the first message of a
+batch in the dispatcher), the receiver stats the time between the flush and
+the moment the peer starts processing the frame.
+"""
+class BatchChannel:
+
+    def __init__(self, max_batch_size=1000, max_delay=0.005):
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        self.queue = multiprocessing.Queue()
+
+        # Number of messages taken by the peer process (only written by the peer)
+        self.consumed = multiprocessing.RawValue('L', 0)
+
+        # Dispatcher side
+        self.batch = []
+        self.batch_start = None
+        self.nb_sent = 0
+        self.sender_stats = BatchStats()
+        self.closed = False
+
+        # Peer side
+        self.frame = []
+        self.frame_index = 0
+        self.receiver_stats = BatchStats()
+
+    """
+    Add a BGP message in the current batch. The batch is sent if it is full.
+    """
+    def put(self, bgp_msg):
+        if self.batch_start is None:
+            self.batch_start = time.time()
+
+        self.batch.append((bgp_msg.mtype, intern(bgp_msg.peer_id), bgp_msg.peer_as, bgp_msg.time, \
+        bgp_msg.prefix, bgp_msg.as_path, bgp_msg.description))
+
+        if len(self.batch) >= self.max_batch_size:
+            self.flush()
+
+    """
+    Send the current batch to the peer process as one frame.
+    """
+    def flush(self):
+        if self.closed:
+            raise IOError('Channel closed, the peer process is gone')
+        if len(self.batch) > 0:
+            now = time.time()
+            self.queue.put(marshal.dumps((now, self.batch), 2))
+
+            self.sender_stats.record(len(self.batch), now-self.batch_start)
+            self.nb_sent += len(self.batch)
+            self.batch = []
+            self.batch_start = None
+
+    """
+    Send the current batch if its first message has waited for too long.
+    Returns the number of seconds until the next flush is needed (None if the batch is empty).
+    """
+    def flush_expired(self, now):
+        if self.batch_start is None or self.closed:
+            return None
+
+        remaining = self.batch_start + self.max_delay - now
+        if remaining <= 0:
+            self.flush()
+            return None
+        return remaining
+
+    """
+    Number of messages sent or waiting in the dispatcher that the peer process
+    has not taken yet.
+    """
+    def pending(self):
+        return self.nb_sent + len(self.batch) - self.consumed.value
+
+    """
+    Return the next BGP message. Blocks until a frame is available, or returns None
+    if no frame arrives within timeout seconds (if set).
+    """
+    def get(self, timeout=None):
+        while self.frame_index >= len(self.frame):
+            try:
+                frame = self.queue.get(True, timeout)
+            except Empty:
+                return None
+            flush_time, self.frame = marshal.loads(frame)
+            self.frame_index = 0
+
+            self.receiver_stats.record(len(self.frame), time.time()-flush_time)
+            self.consumed.value += len(self.frame)
+
+        mtype, peer_id, peer_as, ts, prefix, as_path, description = self.frame[self.frame_index]
+        self.frame_index += 1
+
+        return BGPMessage(mtype, peer_id, peer_as, ts, prefix, as_path, description)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.close()
+
+
+"""
+Counters describing the records going through a ring buffer: number of
+messages, latencies (in seconds) and occupancy of the ring (in records).
+"""
+class RingStats:
+    def __init__(self, nb_slots):
+        self.nb_slots = nb_slots
+        self.nb_messages = 0
+        self.total_latency = 0.
+        self.max_latency = 0.
+        self.occupancy = 0
+        self.max_occupancy = 0
+
+    def record(self, occupancy, latency=0.):
+        self.nb_messages += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.occupancy = occupancy
+        self.max_occupancy = max(self.max_occupancy, occupancy)
+
+    def avg_latency(self):
+        return self.total_latency/self.nb_messages if self.nb_messages > 0 else 0.
+
+    def __str__(self):
+        return 'messages:'+str(self.nb_messages)+ \
+        ' occupancy:'+str(self.occupancy)+'/'+str(self.nb_slots)+' occupancy_max:'+str(self.max_occupancy)+ \
+        ' latency_avg_ms:'+('%.3f' % (self.avg_latency()*1000))+' latency_max_ms:'+('%.3f' % (self.max_latency*1000))
+
+
+# Layout of one record in the ring: type, description, flags, address family,
+# prefix length, peer key, peer AS, timestamp, time when the record was written,
+# network address, and offset/length of the AS path in the arena.
+RING_RECORD = struct.Struct('<cBBBBxxxIIdd16sQI4x')
+RING_COUNTER = struct.Struct('<Q')
+
+# Offsets of the counters shared by both processes (one cache line each)
+RING_HEAD = 0           # Number of records written (producer)
+RING_TAIL = 64          # Number of records read (consumer)
+RING_ARENA_TAIL = 128   # Position of the first arena byte still in use (consumer)
+RING_WAITING = 192      # 1 if the consumer is waiting for new records
+RING_HEADER_SIZE = 256
+
+RING_HAS_ASPATH = 1
+RING_HAS_PEER_AS = 2
+
+RING_MTYPES = {'A': 'A', 'W': 'W', 'CLOSE': 'C', 'INFO': 'I'}
+RING_MTYPES_REVERSE = {'A': 'A', 'W': 'W', 'C': 'CLOSE', 'I': 'INFO'}
+RING_DESCRIPTIONS = [None, 'CBGP', 'BGP4MP', 'TABLE_DUMP2', 'BGPSTREAM']
+
+"""
+Single-producer/single-consumer ring buffer in shared memory (anonymous mmap
+inherited by the peer process), used instead of a multiprocessing queue between
+the dispatcher and a peer process. There is no feeder thread and no pickling:
+each BGP message is written as a fixed-layout record, and its AS path (an array
+of 32-bit AS numbers) is written in a separate circular arena referenced by an
+offset and a length. The first record of each peer carries its peer id in the
+arena, the following ones only carry a peer key.
+
+When the ring is empty the peer process sleeps on a pipe, and the dispatcher
+writes in that pipe only if the peer is actually sleeping. When the ring is full
+the dispatcher waits for the peer to catch up, and raises IOError if the peer
+process (process attribute, set by the owner of the channel) dies meanwhile or
+if the channel is closed. A record larger than the arena raises IOError too.
+Only the A, W and CLOSE messages are transmitted with their full content
+(INFO messages lose their description).
+"""
+class RingChannel:
+
+    def __init__(self, nb_slots=262144, arena_size=None, logger=None):
+        self.nb_slots = nb_slots
+        # By default, 32 bytes per record are reserved for the AS paths (8 AS numbers)
+        self.arena_size = arena_size if arena_size is not None else nb_slots*32
+        self.logger = logger
+
+        self.records_offset = RING_HEADER_SIZE
+        self.arena_offset = RING_HEADER_SIZE + nb_slots*RING_RECORD.size
+        self.mm = mmap.mmap(-1, self.arena_offset + self.arena_size)
+
+        # Pipe used to wake up the peer process
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        flags = fcntl.fcntl(self.wakeup_r, fcntl.F_GETFL)
+        fcntl.fcntl(self.wakeup_r, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        # Dispatcher side
+        self.head = 0
+        self.arena_head = 0
+        self.peer_keys = {}
+        self.falling_behind = False
+        self.sender_stats = RingStats(nb_slots)
+        self.process = None # Process reading the ring (if set, see write)
+        self.closed = False
+
+        # Peer side
+        self.tail = 0
+        self.peer_ids = {}
+        self.receiver_stats = RingStats(nb_slots)
+
+    def load(self, position):
+        return RING_COUNTER.unpack_from(self.mm, position)[0]
+
+    def store(self, position, value):
+        RING_COUNTER.pack_into(self.mm, position, value)
+
+    """
+    Write a record (and its data in the arena) in the ring.
+    Waits for the peer process if the ring or the arena is full.
+    """
+    def write(self, mtype, description, flags, family, prefix_len, peer_key, peer_as, ts, network, data):
+        if len(data) > self.arena_size:
+            raise IOError('Record of '+str(len(data))+' bytes, larger than the arena ('+str(self.arena_size)+' bytes)')
+
+        offset = self.arena_head
+        if len(data) > 0 and offset % self.arena_size + len(data) > self.arena_size:
+            # The data is never split, skip the end of the arena
+            offset += self.arena_size - offset % self.arena_size
+
+        tail = self.load(RING_TAIL)
+        nb_waits = 0
+        while self.head - tail >= self.nb_slots or offset + len(data) - self.load(RING_ARENA_TAIL) > self.arena_size:
+            time.sleep(0.0001)
+            nb_waits += 1
+
+            # The channel is closed when its peer process is cleaned (e.g., on SIGCHLD)
+            if self.closed:
+                raise IOError('Ring closed while waiting for the peer process')
+            if nb_waits % 100 == 0 and self.process is not None and not self.process.is_alive():
+                raise IOError('Peer process died while the ring is full')
+
+            tail = self.load(RING_TAIL)
+
+        if len(data) > 0:
+            position = self.arena_offset + offset % self.arena_size
+            self.mm[position:position+len(data)] = data
+
+        RING_RECORD.pack_into(self.mm, self.records_offset + (self.head % self.nb_slots)*RING_RECORD.size, \
+        mtype, description, flags, family, prefix_len, peer_key, peer_as, ts, time.time(), network, offset, len(data))
+
+        self.arena_head = offset + len(data)
+        self.head += 1
+        self.store(RING_HEAD, self.head)
+
+        # Wake up the peer process if it is sleeping
+        if self.load(RING_WAITING) == 1:
+            self.store(RING_WAITING, 0)
+            # The descriptor of a closed ring may already be reused by another file
+            if self.closed:
+                raise IOError('Ring closed while writing')
+            os.write(self.wakeup_w, 'w')
+
+        occupancy = self.head - tail
+        self.sender_stats.record(occupancy)
+        if occupancy >= 0.9*self.nb_slots and not self.falling_behind:
+            self.falling_behind = True
+            if self.logger is not None:
+                self.logger.warning('Ring buffer above 90% ('+str(occupancy)+'/'+str(self.nb_slots)+'), the peer is falling behind.')
+        elif occupancy < 0.5*self.nb_slots:
+            self.falling_behind = False
+
+    """
+    Write a BGP message in the ring. Raises IOError if the ring is closed in the
+    meantime (the mmap and the wake-up pipe are closed when the peer process is
+    cleaned, e.g., on SIGCHLD).
+    """
+    def put(self, bgp_msg):
+        try:
+            self.put_message(bgp_msg)
+        except (ValueError, OSError):
+            if self.closed:
+                raise IOError('Ring closed while writing')
+            raise
+
+    def put_message(self, bgp_msg):
+        peer_key = self.peer_keys.get(bgp_msg.peer_id)
+        if peer_key is None:
+            peer_key = len(self.peer_keys)
+            self.peer_keys[bgp_msg.peer_id] = peer_key
+            self.write('P', 0, 0, 0, 0, peer_key, 0, 0., '', bgp_msg.peer_id)
+
+        flags = 0
+        data = ''
+        if bgp_msg.as_path is not None:
+            flags |= RING_HAS_ASPATH
+            data = array('I', bgp_msg.as_path).tostring()
+        peer_as = 0
+        if bgp_msg.peer_as is not None:
+            flags |= RING_HAS_PEER_AS
+            peer_as = bgp_msg.peer_as
+
+        family = 0
+        prefix_len = 0
+        network = ''
+        if bgp_msg.prefix is not None and bgp_msg.mtype != 'INFO':
+            family, prefix_len, network = prefix_to_bytes(bgp_msg.prefix)
+
+        self.write(RING_MTYPES[bgp_msg.mtype], RING_DESCRIPTIONS.index(bgp_msg.description), flags, \
+        family, prefix_len, peer_key, peer_as, bgp_msg.time, network, data)
+
+    """
+    Records are visible as soon as they are written, there is nothing to flush.
+    """
+    def flush(self):
+        pass
+
+    def flush_expired(self, now):
+        return None
+
+    """
+    Number of records written that the peer process has not read yet.
+    """
+    def pending(self):
+        if self.closed:
+            return 0
+        return self.head - self.load(RING_TAIL)
+
+    """
+    Wait until the dispatcher writes a new record, at most timeout seconds (if set).
+    Returns False if no record was written in the meantime.
+    """
+    def wait(self, timeout=None):
+        for i in range(0, 100):
+            if self.load(RING_HEAD) > self.tail:
+                return True
+
+        deadline = time.time() + timeout if timeout is not None else None
+        self.store(RING_WAITING, 1)
+        while self.load(RING_HEAD) <= self.tail:
+            if deadline is not None and time.time() >= deadline:
+                self.store(RING_WAITING, 0)
+                return False
+            # The timeout protects against a missed wake up
+            select.select([self.wakeup_r], [], [], 0.01 if timeout is None else min(0.01, timeout))
+            try:
+                os.read(self.wakeup_r, 4096)
+            except OSError:
+                pass
+        self.store(RING_WAITING, 0)
+        return True
+
+    """
+    Return the next BGP message. Blocks until a record is available, or returns
+    None if no record arrives within timeout seconds (if set).
+    """
+    def get(self, timeout=None):
+        while True:
+            if self.load(RING_HEAD) <= self.tail:
+                if not self.wait(timeout):
+                    return None
+
+            mtype, description, flags, family, prefix_len, peer_key, peer_as, ts, put_time, network, offset, length = \
+            RING_RECORD.unpack_from(self.mm, self.records_offset + (self.tail % self.nb_slots)*RING_RECORD.size)
+
+            position = self.arena_offset + offset % self.arena_size
+            data = self.mm[position:position+length]
+
+            self.tail += 1
+            self.store(RING_TAIL, self.tail)
+            self.store(RING_ARENA_TAIL, offset + length)
+
+            if mtype == 'P':
+                self.peer_ids[peer_key] = data
+            else:
+                break
+
+        self.receiver_stats.record(self.load(RING_HEAD)-self.tail, time.time()-put_time)
+
+        as_path = None
+        if flags & RING_HAS_ASPATH:
+            as_path = array('I', data).tolist()
+
+        prefix = None
+        if family != 0:
+            prefix = prefix_from_bytes(family, prefix_len, network)
+
+        return BGPMessage(RING_MTYPES_REVERSE[mtype], self.peer_ids[peer_key], \
+        peer_as if flags & RING_HAS_PEER_AS else None, ts, prefix, as_path, RING_DESCRIPTIONS[description])
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.mm.close()
+        os.close(self.wakeup_r)
+        os.close(self.wakeup_w)
@@ -7,11 +7,14 @@ from collections import deque
 class VirtualNextHops:
 
     def __init__(self, rib, nexthops_nb_bits=3, pusher=None, switch_dpid=None, \
-    IP_prefix="2.0.0.128/25", vnh_file="virtual_nexthops", mapping_router='mapping', logger=None):
+    IP_prefix="2.0.0.128/25", vnh_file="virtual_nexthops", mapping_router='mapping', logger=None, apply_flows=True):
 
         # The Routing Information Base
         self.rib = rib
 
+        # Install the rules in the switch with ovs-ofctl (otherwise they are only written in switch_rules)
+        self.apply_flows = apply_flows
+
         # Logger from the global rib
         self.logger = logger
 
@@ -120,7 +123,8 @@ class VirtualNextHops:
         bitmask = ':'.join(s.encode('hex') for s in bitmask.decode('hex'))
 
         self.fd_rules.write('ovs-ofctl add-flow s1 priority=10,dl_dst='+tmp_mac+'/'+bitmask+',actions=mod_dl_dst:'+real_mac+',output:'+outport+'\n')
-        os.system('ovs-ofctl add-flow s1 priority=10,dl_dst='+tmp_mac+'/'+bitmask+',actions=mod_dl_dst:'+real_mac+',output:'+outport)
+        if self.apply_flows:
+            os.system('ovs-ofctl add-flow s1 priority=10,dl_dst='+tmp_mac+'/'+bitmask+',actions=mod_dl_dst:'+real_mac+',output:'+outport)
 
     def insert_backup_rules(self, peer_ip, depth, aspath_vmac, aspath_bitmask):
         final_flows = []
@@ -165,7 +169,8 @@ class VirtualNextHops:
 
                 final_flows.append('dl_dst='+tmp_mac+'/'+bitmask)
 
-                os.system('ovs-ofctl add-flow s1 priority=100,dl_dst='+tmp_mac+'/'+bitmask+',actions=mod_dl_dst:'+real_mac+',output:'+outport)
+                if self.apply_flows:
+                    os.system('ovs-ofctl add-flow s1 priority=100,dl_dst='+tmp_mac+'/'+bitmask+',actions=mod_dl_dst:'+real_mac+',output:'+outport)
 
         return final_flows
 
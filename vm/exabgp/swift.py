@@ -9,14 +9,28 @@ import time
 import select
 import socket
 import signal
+import argparse
 from netaddr import *
 from random import randint
 from fcntl import fcntl, F_GETFL, F_SETFL
 from os import O_NONBLOCK, read
 
+swift_dir = '/root/SWIFT/swift/code'
+sys.path.append(swift_dir)
+from framing import ReceiveBuffer
+from feed_protocol import FeedEncoder
+from bgp_messages import prefix_to_int
+
+parser = argparse.ArgumentParser("Bridge between ExaBGP and SWIFT.")
+parser.add_argument("--binary", action='store_true', default=False, help="Send the BGP messages to SWIFT with the binary feed protocol instead of text lines.")
+args = parser.parse_args()
+binary = args.binary
+
+encoder = FeedEncoder()
+
 swift_port = randint(3000,4000)
 
-process = subprocess.Popen("python /root/SWIFT/swift/code/swift.py --port "+str(swift_port)+' --silent --run_encoding_threshold 1000', \
+process = subprocess.Popen("python "+swift_dir+"/swift.py --port "+str(swift_port)+' --silent --run_encoding_threshold 1000', \
     shell=True, stdout=subprocess.PIPE, preexec_fn=os.setsid)
 time.sleep(2)
 
@@ -44,8 +58,8 @@ flags = fcntl(sys.stdin, F_GETFL)
 fcntl(sys.stdin, F_SETFL, flags | O_NONBLOCK)
 
 sock_list = [sys.stdin, process.stdout]
-data_stdin = ''
-data_swift = ''
+buffer_stdin = ReceiveBuffer()
+buffer_swift = ReceiveBuffer()
 
 while True:
     inready, outready, excepready = select.select (sock_list, [], [])
@@ -53,19 +67,14 @@ while True:
     #try:
     for sock in inready:
         if sock == sys.stdin:
-            data_tmp = sock.read(100000)
-            next_data = ''
-            data_stdin += data_tmp
-            while len(data_stdin) > 0 and data_stdin[-1] != '\n':
-                next_data = data_stdin[-1]+next_data
-                data_stdin = data_stdin[:-1]
+            buffer_stdin.read_from(sock.fileno())
 
-            for line in data_stdin.rstrip('\n').split('\n'):
+            for line in buffer_stdin.lines():
 
                 try:
                     bgp_message = json.loads(line)
                 except ValueError:
-                    pass
+                    continue
 
                 peer_ip = bgp_message['neighbor']['ip']
                 peer_asn = '-1'
@@ -80,26 +89,25 @@ while True:
 
                             for nexthop in bgp_update['announce']['ipv4 unicast']:
                                 for prefix in bgp_update['announce']['ipv4 unicast'][nexthop]:
-                                    sock_swift.send('BGPSTREAM|exabgp|'+'A|'+str(peer_ip)+'|'+str(peer_asn)+'|'+str(int(time.time()))+'|'+str(prefix)+'|'+str(' '.join(map(lambda x:str(x), aspath)))+'\n')
+                                    if binary:
+                                        sock_swift.sendall(encoder.encode('A', 'exabgp-'+str(peer_ip), int(peer_asn), float(int(time.time())), prefix_to_int(str(prefix)), aspath))
+                                    else:
+                                        sock_swift.send('BGPSTREAM|exabgp|'+'A|'+str(peer_ip)+'|'+str(peer_asn)+'|'+str(int(time.time()))+'|'+str(prefix)+'|'+str(' '.join(map(lambda x:str(x), aspath)))+'\n')
 
                         elif 'withdraw' in bgp_update:
                             if 'ipv4 unicast' in bgp_update['withdraw']:
                                 for prefix in bgp_update['withdraw']['ipv4 unicast']:
-                                    sock_swift.send('BGPSTREAM|exabgp|'+'W|'+str(peer_ip)+'|'+str(peer_asn)+'|'+str(int(time.time()))+'|'+str(prefix)+'|'+'\n')
-
-            data_stdin = next_data
+                                    if binary:
+                                        sock_swift.sendall(encoder.encode('W', 'exabgp-'+str(peer_ip), int(peer_asn), float(int(time.time())), prefix_to_int(str(prefix))))
+                                    else:
+                                        sock_swift.send('BGPSTREAM|exabgp|'+'W|'+str(peer_ip)+'|'+str(peer_asn)+'|'+str(int(time.time()))+'|'+str(prefix)+'|'+'\n')
 
 
         elif sock == process.stdout:
 
-            data_tmp = sock.read(100000)
-            next_data = ''
-            data_swift += data_tmp
-            while len(data_swift) > 0 and data_swift[-1] != '\n':
-                next_data = data_swift[-1]+next_data
-                data_swift = data_swift[:-1]
+            buffer_swift.read_from(sock.fileno())
 
-            for line in data_swift.rstrip('\n').split('\n'):
+            for line in buffer_swift.lines():
                 if line.startswith('A|') or line.startswith('W|'):
                     linetab = line.split('|')
                     msgtype = linetab[0]
@@ -116,7 +124,5 @@ while True:
                         sys.stdout.write ('withdraw route '+prefix+'\n')
                         sys.stdout.flush()
 
-            data_swift = next_data
-
     #except:
     #    signal_handler(signal.SIGTERM, None)